@@ -0,0 +1,208 @@
+import os
+import math
+import time
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+
+class Overloaded(Exception):
+    """A stage could not admit the request before its deadline; maps to 503 + Retry-After"""
+
+    def __init__(self, stage: str, retry_after: int, reason: str):
+        super().__init__(f"{stage} overloaded: {reason}")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class StageLimiter:
+    """At most `concurrency` requests in a stage, and at most `max_queue` waiting for it.
+
+    A request is turned away immediately, rather than after waiting, when the
+    queue is full or when the expected wait (queue length x average service
+    time / concurrency) already exceeds the time left before its deadline.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._slots = threading.Semaphore(concurrency)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        # Exponentially weighted average time a request holds a slot
+        self.avg_service = 0.0
+
+    def retry_after(self) -> int:
+        backlog = (self.waiting + 1) * max(self.avg_service, 0.1) / self.concurrency
+        return max(1, math.ceil(backlog))
+
+    def _reject(self, reason: str):
+        with self._lock:
+            self.rejected += 1
+        raise Overloaded(self.name, self.retry_after(), reason)
+
+    @contextmanager
+    def slot(self, deadline: Optional[float] = None):
+        now = time.time()
+        deadline = min(deadline, now + self.max_wait) if deadline else now + self.max_wait
+        with self._lock:
+            expected_wait = self.waiting * self.avg_service / self.concurrency if self.active >= self.concurrency else 0.0
+            if self.active >= self.concurrency and self.waiting >= self.max_queue:
+                full = True
+            else:
+                full = False
+                self.waiting += 1
+        if full:
+            self._reject(f"{self.max_queue} requests already queued")
+        if now + expected_wait > deadline:
+            with self._lock:
+                self.waiting -= 1
+            self._reject(f"expected wait {expected_wait:.1f}s exceeds the request deadline")
+
+        acquired = self._slots.acquire(timeout=max(deadline - now, 0))
+        with self._lock:
+            self.waiting -= 1
+            if acquired:
+                self.active += 1
+                self.admitted += 1
+        if not acquired:
+            self._reject("deadline passed while queued")
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self.active -= 1
+                self.avg_service = elapsed if not self.avg_service else 0.8 * self.avg_service + 0.2 * elapsed
+            self._slots.release()
+
+    def usage(self) -> dict:
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "active": self.active,
+                "waiting": self.waiting,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_service_ms": round(self.avg_service * 1000, 1),
+            }
+
+
+class RequestGate:
+    """Admission for a whole request, checked before it takes a worker thread.
+
+    It never blocks: with `concurrency` requests running and `max_queue`
+    waiting for a thread, or with an expected wait beyond the request
+    timeout, the next one is turned away at once.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.avg_service = 0.0
+
+    def retry_after(self) -> int:
+        queued = max(self.in_flight - self.concurrency, 0) + 1
+        return max(1, math.ceil(queued * max(self.avg_service, 0.1) / self.concurrency))
+
+    @contextmanager
+    def admit(self):
+        with self._lock:
+            queued = max(self.in_flight - self.concurrency + 1, 0)
+            if self.in_flight >= self.concurrency + self.max_queue:
+                reason = f"{self.max_queue} requests already queued"
+            elif queued * self.avg_service / self.concurrency > self.max_wait:
+                reason = f"expected wait {queued * self.avg_service / self.concurrency:.1f}s exceeds the request deadline"
+            else:
+                reason = None
+                self.in_flight += 1
+                self.admitted += 1
+            if reason:
+                self.rejected += 1
+        if reason:
+            raise Overloaded(self.name, self.retry_after(), reason)
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self.in_flight -= 1
+                self.avg_service = elapsed if not self.avg_service else 0.8 * self.avg_service + 0.2 * elapsed
+
+    def usage(self) -> dict:
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "active": min(self.in_flight, self.concurrency),
+                "waiting": max(self.in_flight - self.concurrency, 0),
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_service_ms": round(self.avg_service * 1000, 1),
+            }
+
+
+class AdmissionController:
+    """Per-stage limiters for the query path (embed, db, llm), behind a gate for the whole request"""
+
+    def __init__(self, limiters: dict, request_timeout: float, gate: Optional[RequestGate] = None):
+        self.limiters = limiters
+        self.request_timeout = request_timeout
+        self.gate = gate or RequestGate(
+            "request", sum(limiter.concurrency for limiter in limiters.values()), 64, request_timeout
+        )
+
+    def deadline(self) -> float:
+        return time.time() + self.request_timeout
+
+    def slot(self, stage: str, deadline: Optional[float] = None):
+        return self.limiters[stage].slot(deadline)
+
+    def usage(self) -> dict:
+        usage = {name: limiter.usage() for name, limiter in self.limiters.items()}
+        usage["request"] = self.gate.usage()
+        return usage
+
+
+def admission_from_env(db_pool_max: int) -> AdmissionController:
+    """Stage limits from <STAGE>_MAX_CONCURRENCY / <STAGE>_MAX_QUEUE; REQUEST_TIMEOUT_SECONDS is the deadline"""
+    cpu_count = os.cpu_count() or 2
+    defaults = {
+        # (concurrency, queue): embedding is CPU-bound, DB is capped by the pool, the LLM by its rate limit
+        "embed": (max(1, cpu_count // 2), 32),
+        "db": (db_pool_max, 64),
+        "llm": (8, 32),
+    }
+    request_timeout = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "25"))
+    limiters = {}
+    for name, (concurrency, max_queue) in defaults.items():
+        limiters[name] = StageLimiter(
+            name,
+            concurrency=int(os.getenv(f"{name.upper()}_MAX_CONCURRENCY", str(concurrency))),
+            max_queue=int(os.getenv(f"{name.upper()}_MAX_QUEUE", str(max_queue))),
+            max_wait=request_timeout,
+        )
+    # Worker threads for /query: enough for every stage to be busy at once, no more
+    gate = RequestGate(
+        "request",
+        concurrency=int(os.getenv("QUERY_MAX_CONCURRENCY", str(sum(limiter.concurrency for limiter in limiters.values())))),
+        max_queue=int(os.getenv("QUERY_MAX_QUEUE", "64")),
+        max_wait=request_timeout,
+    )
+    return AdmissionController(limiters, request_timeout, gate)
@@ -1,15 +1,34 @@
 import os
 import json
+import hashlib
+import tempfile
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+import anyio
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import psycopg2
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 from sentence_transformers import SentenceTransformer
 import google.generativeai as genai
 from groq import Groq
+from session_store import has_followup_signal, new_topic_words, session_store_from_env
+from retrieval_plan import ANSWER_DOC_LIMITS, MIN_RELEVANT_SIMILARITY, QueryPlan, build_query_plan
+from corpora import CORPUS_ADVOCATES
+from embedding_store import get_active_model, get_documents_model, get_model_dimension
+from blue_green import get_corpus_version, table_exists
+from db_pool import pool_from_env, read_router_from_env
+from admission import Overloaded, admission_from_env
+from query_cache import cache_from_env, normalize_query
+from document_fetch import DocumentFetcher
+from query_log import query_log_from_env, top_queries
+from faq_index import faq_index_from_env
+from upload_queue import UPLOAD_DIR, enqueue, is_shipped_filename, safe_filename, get_job, list_jobs, queue_depth
 
 load_dotenv()
 
@@ -23,17 +42,30 @@ else:
 
 # Configure Groq API
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Point at a stand-in server (e.g. fake_groq.py during load tests); None uses the real API
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
 if GROQ_API_KEY:
-    groq_client = Groq(api_key=GROQ_API_KEY)
+    groq_client = Groq(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL)
     print("[OK] Groq API configured successfully")
 else:
     print("Warning: GROQ_API_KEY not found")
     groq_client = None
 
-# Load models locally
-print("Loading embedding model...")
-embedding_model_local = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
-print("Embedding model loaded successfully")
+# Largest PDF POST /ingest/upload accepts
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", "50")) * 1024 * 1024
+
+def load_embedding_model(model_name: str):
+    """Load a sentence-transformers model locally"""
+    print(f"Loading embedding model {model_name}...")
+    model = SentenceTransformer(model_name)
+    print("Embedding model loaded successfully")
+    return model
+
+def load_model_dimensions(conn, active_model: str, documents_model: str) -> dict:
+    """Vector dimension of the active model's document_embeddings (migration bookkeeping is on the primary)"""
+    if active_model == documents_model:
+        return {}
+    return {active_model: get_model_dimension(conn, active_model)}
 
 app = FastAPI(title="RAG API", description="Legal Knowledge Base RAG System")
 
@@ -50,119 +82,425 @@ class QueryRequest(BaseModel):
     query: str
     max_results: Optional[int] = 5
     conversation_history: Optional[List[dict]] = None
+    session_id: Optional[str] = None
+    start_session: bool = False
 
 class QueryResponse(BaseModel):
     answer: str
     sources: List[dict]
     confidence_score: float
+    session_id: Optional[str] = None
+    session_reset: bool = False
 
 class RAGSystem:
     def __init__(self):
         self.embedding_model = os.getenv("EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
         self.llm_model = os.getenv("LLM_MODEL", "mistralai/Mistral-7B-Instruct-v0.2")
-        self.db_conn = None
+        self.db_pool = None
         self.connect_db()
+
+        with self.db_pool.connection() as conn:
+            self.documents_model = get_documents_model(conn)
+            active_model = get_active_model(conn)
+            # Bumped by blue/green rebuilds; anything cached from an older version is stale
+            self.corpus_version = get_corpus_version(conn)
+            # Read here and by the settings watcher, never during a search that already holds a connection
+            self.model_dimensions = load_model_dimensions(conn, active_model, self.documents_model)
+
+        # (model name, encoder) is swapped as one tuple so a query never mixes models
+        self.model_state = {"active": active_model, "loading": None, "loaded_at": None}
+        self.embedding_state = (active_model, load_embedding_model(active_model))
+        self.model_state["loaded_at"] = time.time()
+
+        # In-process counters reported by /stats
+        self.stats_lock = threading.Lock()
+        self.embedding_inflight = 0
+        self.cache_counters = {"session_followup": {"hits": 0, "misses": 0}}
+        self.db_stats = {}
+        self.db_stats_refreshed_at = 0.0
+        self.db_stats_error = None
+        self.db_stats_refreshing = threading.Lock()
+        self.stats_ttl_seconds = float(os.getenv("STATS_TTL_SECONDS", "30"))
+
+        # Query embeddings are keyed by model; retrieval results and answers by corpus version too
+        self.embedding_cache = cache_from_env("query_embedding", 2000)
+        self.retrieval_cache = cache_from_env("retrieval", 1000, versioned=True)
+        # Document ID -> (content, {source, page}), so cached retrievals and follow-ups need no database round trip
+        self.chunk_cache = cache_from_env("chunk", 5000, versioned=True)
+        self.answer_cache = cache_from_env("answer", 500)
+        self.query_log = query_log_from_env()
+        # FAQ questions in memory; a close enough match is answered without retrieval or the LLM
+        self.faq_index = faq_index_from_env()
+        self.load_faq_index()
+
+        # Bounded concurrency and wait queues for the embed, db and llm stages
+        self.admission = admission_from_env(self.read_db.capacity)
+        self.document_fetcher = DocumentFetcher(self.read_db, self.admission, self.chunk_cache)
+
+        # Independent retrieval stages of one query run side by side, each on its own pooled connection
+        self.retrieval_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RETRIEVAL_WORKERS", os.getenv("DB_POOL_MAX", "10"))),
+            thread_name_prefix="rag-retrieval"
+        )
+        # Fan-out of one stage to every shard; separate from the stage pool so the two never wait on each other
+        self.shard_executor = ThreadPoolExecutor(
+            max_workers=sum(shard.capacity for shard in self.read_db.shards),
+            thread_name_prefix="rag-shard"
+        )
+        self.stage_timeout_seconds = float(os.getenv("RETRIEVAL_STAGE_TIMEOUT_MS", "3000")) / 1000
+
+        self.settings_poll_seconds = int(os.getenv("RAG_SETTINGS_POLL_SECONDS", "30"))
+        self.start_settings_watcher()
+        self.start_cache_warming()
     
     def connect_db(self):
-        """Connect to PostgreSQL database"""
+        """Create the PostgreSQL connection pool"""
         try:
-            self.db_conn = psycopg2.connect(
-                host=os.getenv("DB_HOST"),
-                port=os.getenv("DB_PORT"),
-                database=os.getenv("DB_NAME"),
-                user=os.getenv("DB_USER"),
-                password=os.getenv("DB_PASSWORD")
-            )
+            self.db_pool = pool_from_env()
+            # Retrieval reads go to replicas / shards when configured, settings and writes to the primary
+            self.read_db = read_router_from_env(self.db_pool)
         except Exception as e:
             print(f"Database connection error: {str(e)}")
             raise
-    
-    def generate_embedding(self, text: str):
-        """Generate embedding using local sentence-transformers"""
+
+    def invalidate_caches(self, corpus_version: int):
+        """Drop everything cached against an older corpus version"""
+        self.corpus_version = corpus_version
+        self.retrieval_cache.clear()
+        self.chunk_cache.clear()
+        self.answer_cache.clear()
+        print(f"[INFO] Corpus version is now {corpus_version}, cleared retrieval caches")
+        self.load_faq_index()
+
+    def load_faq_index(self):
+        """(Re)load FAQ question vectors for the active query model"""
+        if self.faq_index is None:
+            return
+        try:
+            with self.db_pool.connection() as conn:
+                self.faq_index.load(conn, self.embedding_state[0])
+        except Exception as e:
+            print(f"[WARN] Could not load the FAQ index, direct answers are off: {e}")
+
+    def start_settings_watcher(self):
+        """Poll rag_settings for corpus swaps and embedding model switches"""
+        if self.settings_poll_seconds <= 0:
+            return
+
+        def watch():
+            while True:
+                time.sleep(self.settings_poll_seconds)
+                try:
+                    with self.db_pool.connection() as conn:
+                        active_model = get_active_model(conn)
+                        documents_model = get_documents_model(conn)
+                        corpus_version = get_corpus_version(conn)
+                        # Before the model swap below, so the first query with the new model finds its dimension
+                        self.model_dimensions.update(load_model_dimensions(conn, active_model, documents_model))
+                    if corpus_version != self.corpus_version:
+                        self.invalidate_caches(corpus_version)
+                    if active_model != self.embedding_state[0]:
+                        # Load first, then swap, so queries keep using the old model until the new one is ready
+                        self.model_state["loading"] = active_model
+                        encoder = load_embedding_model(active_model)
+                        self.documents_model = documents_model
+                        self.embedding_state = (active_model, encoder)
+                        self.model_state.update(active=active_model, loading=None, loaded_at=time.time())
+                        print(f"[INFO] Switched query embedding model to {active_model}")
+                        self.load_faq_index()
+                except Exception as e:
+                    print(f"[WARN] Settings watcher error: {e}")
+
+        threading.Thread(target=watch, name="rag-settings-watcher", daemon=True).start()
+
+    def start_cache_warming(self):
+        """Pre-fill caches from the most frequent recently logged queries (WARM_CACHE_QUERIES)"""
+        limit = int(os.getenv("WARM_CACHE_QUERIES", "0"))
+        if limit <= 0:
+            return
+        answer_limit = int(os.getenv("WARM_CACHE_ANSWERS", "0"))
+        days = int(os.getenv("WARM_CACHE_DAYS", "7"))
+
+        def warm():
+            try:
+                queries = top_queries(os.getenv("QUERY_LOG_DIR") or None, days=days, limit=limit)
+            except Exception as e:
+                print(f"[WARN] Could not read query log for cache warming: {e}")
+                return
+            print(f"[INFO] Warming caches with {len(queries)} frequent queries ({answer_limit} with answers)")
+            start = time.time()
+            for index, (text, _count) in enumerate(queries):
+                try:
+                    if index < answer_limit:
+                        # Goes through the LLM, so only the very top queries
+                        self.query(text, log=False)
+                    else:
+                        self.retrieve(text)
+                except Exception as e:
+                    print(f"[WARN] Cache warming failed for a query: {e}")
+            print(f"[INFO] Cache warming done in {time.time() - start:.1f}s")
+
+        threading.Thread(target=warm, name="rag-cache-warmer", daemon=True).start()
+
+    def embed_query(self, text: str, trace: Optional[dict] = None):
+        """Embed text with the active model, returns (embedding, model name)"""
+        model_name, encoder = self.embedding_state
+        cached = self.embedding_cache.get((model_name, text))
+        if cached is not None:
+            if trace is not None:
+                trace["cache"].add("embedding")
+            return cached, model_name
+        with self.stats_lock:
+            self.embedding_inflight += 1
         try:
             # Generate embedding locally - much faster and more reliable!
-            embedding = embedding_model_local.encode(text)
-            return embedding.tolist()
+            with self.admission.slot("embed", trace.get("deadline") if trace else None):
+                embedding = encoder.encode(text).tolist()
+            self.embedding_cache.put((model_name, text), embedding)
+            return embedding, model_name
         except Exception as e:
             print(f"Embedding generation error: {str(e)}")
             raise
+        finally:
+            with self.stats_lock:
+                self.embedding_inflight -= 1
+
+    def record_cache(self, cache_name: str, hit: bool):
+        with self.stats_lock:
+            counters = self.cache_counters.setdefault(cache_name, {"hits": 0, "misses": 0})
+            counters["hits" if hit else "misses"] += 1
+
+    def refresh_db_stats(self):
+        """Catalog-only statistics (no table scans): row estimate, index types and sizes, corpus version"""
+        with self.db_pool.connection(timeout=2) as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                SELECT c.reltuples::bigint AS row_estimate,
+                       pg_total_relation_size(c.oid) AS total_bytes
+                FROM pg_class c
+                WHERE c.oid = 'documents'::regclass
+            """)
+            table = cursor.fetchone()
+            cursor.execute("""
+                SELECT i.relname AS name, am.amname AS type, pg_relation_size(i.oid) AS bytes
+                FROM pg_index x
+                JOIN pg_class i ON i.oid = x.indexrelid
+                JOIN pg_am am ON am.oid = i.relam
+                WHERE x.indrelid = 'documents'::regclass
+                ORDER BY i.relname
+            """)
+            indexes = [dict(row) for row in cursor.fetchall()]
+            cursor.close()
+            corpus_version = get_corpus_version(conn)
+            uploads = queue_depth(conn) if table_exists(conn, "upload_jobs") else None
+
+        self.db_stats = {
+            # reltuples is -1 until the table has been analyzed
+            "row_estimate": max(int(table["row_estimate"]), 0),
+            "table_bytes": int(table["total_bytes"]),
+            "ann_indexes": [idx for idx in indexes if idx["type"] in ("ivfflat", "hnsw")],
+            "other_indexes": [idx for idx in indexes if idx["type"] not in ("ivfflat", "hnsw")],
+            "corpus_version": corpus_version,
+            "upload_queue": uploads,
+        }
+        self.db_stats_refreshed_at = time.time()
+        self.db_stats_error = None
+
+    def cached_db_stats(self):
+        """Database statistics, refreshed by at most one caller per STATS_TTL_SECONDS"""
+        stale = time.time() - self.db_stats_refreshed_at > self.stats_ttl_seconds
+        if stale and self.db_stats_refreshing.acquire(blocking=False):
+            try:
+                self.refresh_db_stats()
+            except Exception as e:
+                self.db_stats_error = str(e)
+                print(f"[WARN] Stats refresh failed: {e}")
+            finally:
+                self.db_stats_refreshing.release()
+        return self.db_stats, self.db_stats_refreshed_at, self.db_stats_error
+
+    def enqueue_upload(self, filename: str, data: bytes) -> dict:
+        """Store an uploaded PDF and queue it for ingest_worker.py; returns the job"""
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        path = os.path.join(UPLOAD_DIR, filename)
+        # Written to a temp file and renamed, so a worker never reads a half-written PDF
+        fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        digest = hashlib.sha256(data).hexdigest()
+        with self.db_pool.connection() as conn:
+            job_id = enqueue(conn, filename, path, digest)
+            conn.commit()
+            job = get_job(conn, job_id)
+        print(f"[INFO] Queued upload {filename} as job {job_id}")
+        return job
+
+    def upload_job(self, job_id: int) -> Optional[dict]:
+        with self.db_pool.connection() as conn:
+            return get_job(conn, job_id)
+
+    def upload_jobs(self, limit: int, status: Optional[str] = None) -> List[dict]:
+        with self.db_pool.connection() as conn:
+            return list_jobs(conn, limit, status)
+
+    def stats(self) -> dict:
+        db_stats, refreshed_at, error = self.cached_db_stats()
+        with self.stats_lock:
+            caches = {
+                name: dict(counters, hit_rate=round(counters["hits"] / max(counters["hits"] + counters["misses"], 1), 3))
+                for name, counters in self.cache_counters.items()
+            }
+            embedding_queue = self.embedding_inflight
+        caches["query_embedding"] = self.embedding_cache.usage()
+        caches["retrieval"] = self.retrieval_cache.usage()
+        caches["chunk"] = self.chunk_cache.usage()
+        caches["answer"] = self.answer_cache.usage()
+        return {
+            "corpus_version": self.corpus_version,
+            "database": dict(db_stats, refreshed_at=refreshed_at, error=error),
+            "pool": self.db_pool.usage(),
+            "read_endpoints": self.read_db.usage(),
+            "caches": caches,
+            "query_log": self.query_log.usage() if self.query_log else None,
+            "faq_index": self.faq_index.usage() if self.faq_index else None,
+            "admission": self.admission.usage(),
+            "embedding": {
+                "queue_depth": embedding_queue,
+                "model": dict(self.model_state),
+                "documents_model": self.documents_model,
+            },
+        }
+
+    def generate_embedding(self, text: str):
+        """Generate embedding using local sentence-transformers"""
+        return self.embed_query(text)[0]
+
+    def vector_source(self, model_name: Optional[str]):
+        """FROM clause and vector expression holding embeddings for model_name"""
+        if model_name is None or model_name == self.documents_model:
+            return "documents", "documents.embedding", []
+        dimension = self.model_dimensions.get(model_name)
+        if dimension is None:
+            raise RuntimeError(f"No embedding migration recorded for {model_name}; run reembed.py for it")
+        # Same cast expression as the migration's partial index, so the planner can use it
+        return (
+            "documents JOIN document_embeddings de ON de.document_id = documents.id AND de.model_name = %s",
+            f"de.embedding::vector({int(dimension)})",
+            [model_name],
+        )
     
-    def search_similar_documents(self, query_embedding, max_results=10, query_text=None):
-        """Hybrid search combining keyword and vector similarity"""
+    def build_filter_clause(self, corpus=None, source=None, exclude_corpus=None):
+        """WHERE clause for corpus/source filters, written so the planner can match the partial ANN indexes"""
+        conditions = []
+        params = []
+        if corpus:
+            conditions.append("corpus = %s")
+            params.append(corpus)
+        if exclude_corpus:
+            conditions.append("corpus <> %s")
+            params.append(exclude_corpus)
+        if source:
+            # Chunks folded into a near-duplicate from another PDF still match that PDF
+            conditions.append("(source = %s OR metadata->'also_in' @> %s::jsonb)")
+            params.extend([source, json.dumps([{"source": source}])])
+        if not conditions:
+            return "", []
+        return "WHERE " + " AND ".join(conditions), params
+
+    def search_similar_documents(self, query_embedding, max_results=10,
+                                 corpus=None, source=None, exclude_corpus=None, embedding_model=None, replicas=None):
+        """Nearest neighbours by vector similarity, restricted to a corpus/source slice, as (id, similarity)"""
         try:
-            cursor = self.db_conn.cursor(cursor_factory=RealDictCursor)
+            with (replicas or self.read_db.shards[0]).connection() as conn:
+                cursor = conn.cursor()
+                where_clause, filter_params = self.build_filter_clause(corpus, source, exclude_corpus)
+                from_clause, vector_expr, from_params = self.vector_source(embedding_model)
+                print(f"[DEBUG] Using vector search with max_results={max_results}")
             
-            # If query text is provided, try keyword search first (for legal terms)
-            if query_text:
-                # Extract important keywords from query (legal terms)
-                legal_keywords = [
-                    'police', 'arrest', 'warrant', 'court', 'judge', 'law', 'legal',
-                    'rights', 'crime', 'criminal', 'civil', 'ipc', 'section', 'act',
-                    'detention', 'bail', 'custody', 'lawyer', 'advocate', 'case',
-                    'property', 'divorce', 'marriage', 'contract', 'agreement', 'dispute',
-                    'rape', 'sexual', 'assault', 'abuse', 'harassment', 'molestation',
-                    'victim', 'violence', 'domestic', 'attack', 'pocso', 'minor',
-                    'child', 'woman', 'women', '376', '354', '509', 'dowry', 'murder',
-                    'theft', 'robbery', 'fraud', 'cheating', 'kidnapping', 'trafficking'
-                ]
-                
-                # Find matching keywords in query
-                query_lower = query_text.lower()
-                found_keywords = [kw for kw in legal_keywords if kw in query_lower]
-                
-                if found_keywords:
-                    print(f"[DEBUG] Found legal keywords: {found_keywords[:3]}...")
-                    # Build keyword search query
-                    keyword_conditions = " OR ".join([f"LOWER(content) LIKE %s" for _ in found_keywords[:5]])  # Limit to top 5 keywords
-                    keyword_params = [f"%{kw}%" for kw in found_keywords[:5]]
-                    
-                    # Hybrid search: combine keyword matches with vector similarity
-                    cursor.execute(f"""
-                        SELECT 
-                            id,
-                            content,
-                            metadata,
-                            1 - (embedding <=> %s::vector) AS similarity,
-                            CASE WHEN ({keyword_conditions}) THEN 1 ELSE 0 END as keyword_match
-                        FROM documents
-                        ORDER BY keyword_match DESC, embedding <=> %s::vector
-                        LIMIT %s
-                    """, (query_embedding, *keyword_params, query_embedding, max_results))
-                    
-                    results = cursor.fetchall()
-                    keyword_matches = sum(1 for r in results if r.get('keyword_match', 0) == 1)
-                    print(f"[DEBUG] Found {len(results)} documents ({keyword_matches} keyword matches)")
-                    cursor.close()
-                    return results
+                cursor.execute(
+                    f"""
+                    SELECT 
+                        documents.id,
+                        1 - ({vector_expr} <=> %s::vector) AS similarity
+                    FROM {from_clause}
+                    {where_clause}
+                    ORDER BY {vector_expr} <=> %s::vector
+                    LIMIT %s
+                    """,
+                    (query_embedding, *from_params, *filter_params, query_embedding, max_results)
+                )
             
-            # Fallback to pure vector search
-            print(f"[DEBUG] Using vector search with max_results={max_results}")
+                results = cursor.fetchall()
+                print(f"[DEBUG] Found {len(results)} similar documents")
+                if results:
+                    print(f"[DEBUG] Top similarity: {results[0][1]:.4f}")
+                cursor.close()
             
-            cursor.execute(
-                """
+                return results
+        except Exception as e:
+            print(f"Search error: {str(e)}")
+            raise
+
+    def keyword_boost_search(self, query_embedding, keywords: List[str], max_results=10,
+                             corpus=None, source=None, exclude_corpus=None, embedding_model=None, replicas=None):
+        """Chunks containing any of the legal keywords, nearest first (ranked ahead of pure vector hits), as (id, similarity)"""
+        with (replicas or self.read_db.shards[0]).connection() as conn:
+            cursor = conn.cursor()
+            where_clause, filter_params = self.build_filter_clause(corpus, source, exclude_corpus)
+            from_clause, vector_expr, from_params = self.vector_source(embedding_model)
+            print(f"[DEBUG] Found legal keywords: {keywords[:3]}...")
+            keyword_conditions = " OR ".join(["LOWER(content) LIKE %s" for _ in keywords])
+            keyword_params = [f"%{kw}%" for kw in keywords]
+            where_clause = f"{where_clause} AND ({keyword_conditions})" if where_clause else f"WHERE {keyword_conditions}"
+
+            cursor.execute(f"""
                 SELECT 
-                    id,
-                    content,
-                    metadata,
-                    1 - (embedding <=> %s::vector) AS similarity
-                FROM documents
-                ORDER BY embedding <=> %s::vector
+                    documents.id,
+                    1 - ({vector_expr} <=> %s::vector) AS similarity
+                FROM {from_clause}
+                {where_clause}
+                ORDER BY {vector_expr} <=> %s::vector
                 LIMIT %s
-                """,
-                (query_embedding, query_embedding, max_results)
-            )
-            
+            """, (query_embedding, *from_params, *filter_params, *keyword_params, query_embedding, max_results))
             results = cursor.fetchall()
-            print(f"[DEBUG] Found {len(results)} similar documents")
-            if results:
-                print(f"[DEBUG] Top similarity: {results[0]['similarity']:.4f}")
             cursor.close()
-            
-            return results
-        except Exception as e:
-            print(f"Search error: {str(e)}")
-            raise
-    
+        print(f"[DEBUG] Found {len(results)} keyword matches")
+        return results
+
+    def fetch_documents_by_ids(self, doc_ids: List[int], similarities: Optional[List[float]] = None,
+                               deadline: Optional[float] = None):
+        """Second retrieval phase: content for the given IDs, in order with their scores (see document_fetch.py)"""
+        return self.document_fetcher.fetch(doc_ids, similarities, self.corpus_version, deadline)
+
+    def scatter_gather(self, search, limit: int, *args, **kwargs) -> List[tuple]:
+        """Run search on every shard in parallel and merge the per-shard top-k by similarity.
+
+        A shard that fails is left out; the search only fails if every shard does.
+        """
+        shards = self.read_db.shards
+        if len(shards) == 1:
+            return search(*args, replicas=shards[0], **kwargs)
+
+        futures = [self.shard_executor.submit(search, *args, replicas=shard, **kwargs) for shard in shards]
+        rows = []
+        errors = []
+        for idx, future in enumerate(futures):
+            try:
+                rows.extend(future.result())
+            except Exception as e:
+                print(f"[WARN] Shard {idx} search failed: {e}")
+                errors.append(e)
+        if errors and len(errors) == len(shards):
+            raise errors[0]
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows[:limit]
+
     def format_answer(self, answer: str) -> str:
         """Ensure proper formatting with each heading on new line and numbered points separated"""
         import re
@@ -193,11 +531,13 @@ class RAGSystem:
         
         return answer
     
-    def generate_answer(self, query: str, context_docs: List[dict], conversation_history: Optional[List[dict]] = None) -> str:
+    def generate_answer(self, query: str, context_docs: List[dict], conversation_history: Optional[List[dict]] = None, conversation_summary: str = "") -> str:
         """Generate answer using Gemini API to understand query and context"""
         try:
             # Build conversation context first (needed for follow-up questions)
             conversation_context = ""
+            if conversation_summary:
+                conversation_context += f"Earlier in this conversation: {conversation_summary}\n\n"
             if conversation_history and len(conversation_history) > 0:
                 recent = conversation_history[-4:]  # Last 4 messages (2 exchanges)
                 for msg in recent:
@@ -215,7 +555,7 @@ class RAGSystem:
             if context_docs:
                 # Check if this is a lawyer query - if so, use more documents
                 is_lawyer_query = any(kw in query.lower() for kw in ['lawyer', 'advocate', 'attorney', 'counsel'])
-                doc_limit = 10 if is_lawyer_query else 5
+                doc_limit = ANSWER_DOC_LIMITS["lawyer" if is_lawyer_query else "general"]
                 
                 for doc in context_docs[:doc_limit]:  # Top N most relevant docs
                     content = doc['content'].strip()
@@ -505,111 +845,312 @@ Answer:"""
         
         return True, None  # General lawyer query
     
-    def query(self, query_text: str, max_results: int = 5, conversation_history: Optional[List[dict]] = None):
+    def lawyer_keyword_search(self, pattern: str, source: str, limit: int = 10, replicas=None):
+        """Exact specialization lookup in the advocate list, as (id, similarity)"""
+        print(f"[DEBUG] Searching for: {pattern}")
+        with (replicas or self.read_db.shards[0]).connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT 
+                    id,
+                    0.9::float AS similarity
+                FROM documents
+                WHERE corpus = %s
+                AND source = %s
+                AND content LIKE %s
+                LIMIT %s
+            """, (CORPUS_ADVOCATES, source, pattern, limit))
+            results = cursor.fetchall()
+            cursor.close()
+        return results
+
+    def plan_executors(self, query_text: str, trace: Optional[dict] = None) -> dict:
+        """Map plan stage names to the methods that run them"""
+        deadline = trace.get("deadline") if trace else None
+
+        def run_lawyer_keyword(stage):
+            try:
+                with self.admission.slot("db", deadline):
+                    return self.scatter_gather(
+                        self.lawyer_keyword_search, stage.fetch_count,
+                        stage.params["pattern"], stage.params["source"], stage.fetch_count
+                    )
+            except Exception as e:
+                # Fall through to the vector stage rather than failing the query
+                print(f"[DEBUG] Keyword search error: {e}")
+                return []
+
+        # Keyword and vector stages embed the same text; whichever runs first embeds it for both
+        embed_lock = threading.Lock()
+        embedded = {}
+
+        def embedding_for(text):
+            with embed_lock:
+                if text not in embedded:
+                    embedded[text] = self.embed_query(text, trace)
+                return embedded[text]
+
+        def run_keyword_search(stage):
+            query_embedding, model_name = embedding_for(stage.embed_text)
+            with self.admission.slot("db", deadline):
+                return self.scatter_gather(
+                    self.keyword_boost_search, stage.fetch_count,
+                    query_embedding, stage.params["keywords"], stage.fetch_count,
+                    embedding_model=model_name, **stage.filters
+                )
+
+        def run_vector_search(stage):
+            query_embedding, model_name = embedding_for(stage.embed_text)
+            with self.admission.slot("db", deadline):
+                return self.scatter_gather(
+                    self.search_similar_documents, stage.fetch_count,
+                    query_embedding, stage.fetch_count, embedding_model=model_name, **stage.filters
+                )
+
+        return {
+            "lawyer_keyword": run_lawyer_keyword,
+            "keyword_search": run_keyword_search,
+            "vector_search": run_vector_search,
+        }
+
+    def plan_query(self, query_text: str, max_results: int = 5) -> QueryPlan:
+        is_lawyer, specialization = self.is_lawyer_query(query_text)
+        return build_query_plan(query_text, is_lawyer, specialization, max_results)
+
+    def fetch_relevant(self, hits, trace: Optional[dict] = None) -> tuple:
+        """Content for the hits the answer stage will read, returns (docs, number of hits wanted)"""
+        return self.document_fetcher.fetch_relevant(hits, self.corpus_version, trace)
+
+    def retrieve(self, query_text: str, max_results: int = 5, trace: Optional[dict] = None):
+        """Plan and run retrieval for a query, returns (docs, plan).
+
+        Runs in two phases. The plan's index searches return only (id, similarity).
+        Content is then fetched just for the hits at or above MIN_RELEVANT_SIMILARITY,
+        the only ones that reach the prompt or the response sources.
+        """
+        plan = self.plan_query(query_text, max_results)
+        corpus_version = self.corpus_version
+        # Routing is part of the key: the same words can plan differently once the keyword rules change
+        route = (plan.query_type, plan.specialization, tuple(stage.name for stage in plan.stages), plan.fetch_count)
+        cache_key = (normalize_query(query_text), route, self.embedding_state[0])
+        cached = self.retrieval_cache.get(cache_key, corpus_version)
+        if cached is not None:
+            docs, wanted = self.fetch_relevant(cached, trace)
+            if len(docs) == wanted:
+                for stage in plan.stages:
+                    stage.status = "cached"
+                if trace is not None:
+                    trace["cache"].add("retrieval")
+                return docs, plan
+
+        print(f"[DEBUG] Query plan: {plan.query_type} -> {[stage.name for stage in plan.stages]}")
+        hits = plan.run_concurrent(
+            self.plan_executors(query_text, trace), self.retrieval_executor, self.stage_timeout_seconds
+        )
+        if trace is not None:
+            for stage in plan.stages:
+                if stage.status == "executed":
+                    trace["timings"][stage.name] = stage.elapsed_ms
+        hits = tuple((hit[0], float(hit[1])) for hit in hits)
+        # Partial results from a timed out or failed stage are not worth keeping
+        if all(stage.status in ("executed", "skipped") for stage in plan.stages):
+            self.retrieval_cache.put(cache_key, corpus_version, hits)
+        fetch_start = time.perf_counter()
+        docs, _wanted = self.fetch_relevant(hits, trace)
+        if trace is not None:
+            trace["timings"]["fetch_by_ids"] = round((time.perf_counter() - fetch_start) * 1000, 2)
+        return docs, plan
+
+    def answer_from_faq(self, query_text: str, trace: dict) -> Optional[dict]:
+        """Curated FAQ answer when the query closely matches an FAQ question, else None"""
+        if self.faq_index is None or self.is_lawyer_query(query_text)[0]:
+            return None
+        match_start = time.perf_counter()
+        # Same text and model as the vector stage, so a miss costs no extra embedding
+        query_embedding, model_name = self.embed_query(query_text, trace)
+        match = self.faq_index.match(query_embedding, model_name)
+        trace["timings"]["faq_match"] = round((time.perf_counter() - match_start) * 1000, 2)
+        self.record_cache("faq", match is not None)
+        if match is None:
+            return None
+        entry, similarity = match
+        print(f"[DEBUG] FAQ match ({similarity:.4f}): {entry['question']}")
+        trace["query_type"] = "faq"
+        return {
+            "answer": self.format_answer(entry['answer']),
+            "sources": [{
+                "content": entry['question'],
+                "source": entry['source'],
+                "page": entry['page'] or 'N/A',
+                "similarity": similarity,
+            }],
+            "confidence_score": round(similarity, 2),
+        }
+
+    def is_session_followup(self, query_text: str, session) -> bool:
+        """A short query that refers back to a session that already retrieved documents"""
+        if session is None or not session.last_doc_ids or not session.turns:
+            return False
+        # Document IDs from before a corpus swap no longer exist in the live table
+        if session.retrieval_version != self.corpus_version:
+            return False
+        if len(query_text.split()) >= 10:
+            return False
+        # "What is the punishment for it?" continues the topic; "What is the GST rate?" starts a new one
+        if not has_followup_signal(query_text):
+            return False
+        # A new lawyer specialization means the user changed topic, so retrieve again
+        is_lawyer, specialization = self.is_lawyer_query(query_text)
+        if is_lawyer and specialization and specialization != session.last_specialization:
+            return False
+        return True
+
+    def record_turn(self, session, query_text: str, answer: str):
+        if session is not None:
+            session.add_turn("user", query_text)
+            session.add_turn("assistant", answer)
+
+    def passes_legal_gate(self, query_text: str, is_followup: bool) -> bool:
+        """Legal questions pass; a follow-up passes without legal terms only if it names no new topic"""
+        if self.is_legal_query(query_text):
+            return True
+        return is_followup and not new_topic_words(query_text)
+
+    def needs_backend(self, query_text: str, session=None) -> bool:
+        """False for greetings and off-topic questions, which are answered without embedding, DB or LLM work"""
+        if self.is_greeting_or_casual(query_text):
+            return False
+        return self.passes_legal_gate(query_text, self.is_session_followup(query_text, session))
+
+    def query(self, query_text: str, max_results: int = 5, conversation_history: Optional[List[dict]] = None,
+              session=None, log: bool = True, deadline: Optional[float] = None):
         """Main RAG query function with conversation memory"""
+        deadline = deadline or self.admission.deadline()
+        if time.time() >= deadline:
+            raise Overloaded("request", 1, "deadline passed before the request started")
+        trace = {"query_type": "general", "cache": set(), "timings": {}, "doc_ids": [], "similarities": [],
+                 "deadline": deadline}
+        start = time.perf_counter()
+        result = self.answer_query(query_text, max_results, conversation_history, session, trace)
+        trace["timings"]["total"] = round((time.perf_counter() - start) * 1000, 2)
+        if log and self.query_log:
+            trace.pop("deadline")
+            trace["text"] = query_text
+            trace["corpus_version"] = self.corpus_version
+            self.query_log.log(trace)
+        return result
+
+    def answer_query(self, query_text: str, max_results: int, conversation_history: Optional[List[dict]],
+                     session, trace: dict):
+        """Greeting, legal gate, retrieval and answer generation; fills trace for the query log"""
         try:
+            # A live session's turns replace the client-supplied history, which is only the fallback
+            conversation_summary = ""
+            if session is not None:
+                if session.turns or not conversation_history:
+                    conversation_history = session.history()
+                conversation_summary = session.summary
+
             # Check for greetings first
             if self.is_greeting_or_casual(query_text):
+                answer = self.handle_greeting(query_text)
+                self.record_turn(session, query_text, answer)
+                trace["query_type"] = "greeting"
                 return {
-                    "answer": self.handle_greeting(query_text),
+                    "answer": answer,
                     "sources": [],
                     "confidence_score": 0.95  # High confidence for greetings
                 }
-            
-            # Check if the query is legal-related
-            if not self.is_legal_query(query_text):
+
+            is_followup = self.is_session_followup(query_text, session)
+            if session is not None:
+                self.record_cache("session_followup", is_followup)
+
+            # Check if the query is legal-related (a bare "explain that" inherits the previous legal topic)
+            if not self.passes_legal_gate(query_text, is_followup):
+                trace["query_type"] = "off_topic"
                 return {
                     "answer": "I'm a legal assistant specialized in Indian law. I can only help with legal questions related to:\n\n• Civil, Criminal, Cyber, and Consumer Law\n• Property, Family, and Marriage matters\n• Legal procedures, rights, and remedies\n• Finding lawyers by specialization\n• Court procedures and legal documentation\n\nPlease ask me a legal question, and I'll be happy to help!",
                     "sources": [],
                     "confidence_score": 0.90
                 }
-            
-            # Check if this is a lawyer query and reformulate if needed
-            is_lawyer, specialization = self.is_lawyer_query(query_text)
-            
-            # Set max_results based on query type
-            if is_lawyer:
-                # Increase max_results for lawyer queries to get more lawyer chunks
-                max_results = max(max_results, 20)
-            else:
-                # For general legal queries, also increase max_results to get more context
-                max_results = max(max_results, 15)
-            
-            # Generate embedding based on query type
-            if is_lawyer and specialization:
-                # Reformulate query to match "Advocate [Name] [Specialization] Law" pattern
-                reformulated_query = f"Advocate {specialization.title()} Law"
-                print(f"[DEBUG] Lawyer query detected. Reformulated: '{reformulated_query}'")
-                query_embedding = self.generate_embedding(reformulated_query)
-            elif is_lawyer:
-                query_embedding = self.generate_embedding("Advocate Law lawyer")
+
+            # Only first-turn questions get the same answer every time
+            answer_key = None
+            if not is_followup and not conversation_history and not conversation_summary:
+                answer_key = (normalize_query(query_text), max_results, self.embedding_state[0], self.corpus_version)
+                cached = self.answer_cache.get(answer_key)
+                if cached is not None:
+                    result, relevant_docs, is_lawyer, specialization = cached
+                    trace["cache"].add("answer")
+                    trace["query_type"] = "lawyer" if is_lawyer else "general"
+                    trace["doc_ids"] = [doc["id"] for doc in relevant_docs]
+                    trace["similarities"] = [float(doc["similarity"]) for doc in relevant_docs]
+                    if session is not None:
+                        self.record_turn(session, query_text, result["answer"])
+                        session.remember_retrieval(
+                            relevant_docs, "lawyer" if is_lawyer else "general", specialization, self.corpus_version
+                        )
+                    return dict(result)
+
+            # A canned FAQ answer ignores the conversation, so it only serves standalone questions
+            if not is_followup and not conversation_history:
+                result = self.answer_from_faq(query_text, trace)
+                if result is not None:
+                    if session is not None:
+                        self.record_turn(session, query_text, result["answer"])
+                        # Nothing retrieved, so the next short question is not a follow-up of older documents
+                        session.remember_retrieval([], "general", None, self.corpus_version)
+                    return result
+
+            if is_followup:
+                # Reuse the previous turn's documents instead of embedding and searching again
+                print(f"[DEBUG] Follow-up in session {session.session_id}, reusing {len(session.last_doc_ids)} documents")
+                fetch_start = time.perf_counter()
+                similar_docs = self.fetch_documents_by_ids(
+                    session.last_doc_ids, session.last_similarities, trace["deadline"]
+                )
+                trace["timings"]["fetch_by_ids"] = round((time.perf_counter() - fetch_start) * 1000, 2)
+                trace["cache"].add("session_followup")
+                trace["query_type"] = "followup"
+                trace["doc_ids"] = [doc["id"] for doc in similar_docs]
+                trace["similarities"] = [float(doc["similarity"]) for doc in similar_docs]
+                is_lawyer = session.last_query_type == "lawyer"
+                specialization = session.last_specialization
             else:
-                # Generate query embedding normally
-                query_embedding = self.generate_embedding(query_text)
-            
-            # Search for similar documents - pass query_text for hybrid search
-            similar_docs = self.search_similar_documents(query_embedding, max_results, query_text=query_text)
-            print(f"[DEBUG] Search returned {len(similar_docs) if similar_docs else 0} documents")
-            
-            # For lawyer queries with specialization, ALWAYS use keyword search to ensure we get the right specialty
-            if is_lawyer and specialization:
-                print(f"[DEBUG] This is a lawyer query for specialization: {specialization}")
-                print(f"[DEBUG] Using keyword search to find exact matches for '{specialization} Law'")
-                try:
-                    cursor = self.db_conn.cursor(cursor_factory=RealDictCursor)
-                    search_term = f"%{specialization.title()} Law%"
-                    print(f"[DEBUG] Searching for: {search_term}")
-                    cursor.execute("""
-                        SELECT 
-                            id,
-                            content,
-                            metadata,
-                            0.9 AS similarity
-                        FROM documents
-                        WHERE content LIKE %s
-                        AND metadata->>'source' = 'Lawyer.pdf'
-                        LIMIT 10
-                    """, (search_term,))
-                    keyword_results = cursor.fetchall()
-                    cursor.close()
-                    
-                    if keyword_results:
-                        print(f"[DEBUG] Found {len(keyword_results)} matches with keyword search for Civil Law")
-                        for kr in keyword_results[:2]:
-                            print(f"[DEBUG] Sample: {kr['content'][:80]}...")
-                        # Use keyword results only (they're more accurate for lawyer queries)
-                        similar_docs = keyword_results
-                        print(f"[DEBUG] Returning {len(similar_docs)} documents to client")
-                    else:
-                        print(f"[DEBUG] Keyword search returned 0 results, using vector search")
-                except Exception as e:
-                    print(f"[DEBUG] Keyword search error: {e}")
-                    import traceback
-                    traceback.print_exc()
-            
+                # Only documents at or above MIN_RELEVANT_SIMILARITY come back; the trace has every hit
+                similar_docs, plan = self.retrieve(query_text, max_results, trace)
+                trace["query_type"] = "lawyer" if plan.is_lawyer else "general"
+                is_lawyer = plan.is_lawyer
+                specialization = plan.specialization
+
             # Apply similarity threshold - only use documents if they're actually relevant
-            SIMILARITY_THRESHOLD = 0.35  # Minimum similarity score to consider document relevant
-            relevant_docs = []
+            relevant_docs = [doc for doc in similar_docs if doc.get('similarity', 0) >= MIN_RELEVANT_SIMILARITY]
+            if relevant_docs:
+                print(f"[DEBUG] {len(relevant_docs)}/{len(trace['doc_ids'])} documents passed similarity threshold ({MIN_RELEVANT_SIMILARITY})")
+                print(f"[DEBUG] Top similarity: {relevant_docs[0]['similarity']:.4f}")
+            elif trace["similarities"]:
+                print(f"[DEBUG] No documents passed similarity threshold ({MIN_RELEVANT_SIMILARITY})")
+                print(f"[DEBUG] Top similarity was: {trace['similarities'][0]:.4f}")
             
-            if similar_docs:
-                # Filter documents by similarity threshold
-                relevant_docs = [doc for doc in similar_docs if doc.get('similarity', 0) >= SIMILARITY_THRESHOLD]
-                
+            # Generate answer - use relevant docs or allow LLM to respond from its knowledge
+            generate_start = time.perf_counter()
+            with self.admission.slot("llm", trace["deadline"]):
                 if relevant_docs:
-                    print(f"[DEBUG] {len(relevant_docs)}/{len(similar_docs)} documents passed similarity threshold ({SIMILARITY_THRESHOLD})")
-                    print(f"[DEBUG] Top similarity: {relevant_docs[0]['similarity']:.4f}")
+                    answer = self.generate_answer(query_text, relevant_docs, conversation_history, conversation_summary)
                 else:
-                    print(f"[DEBUG] No documents passed similarity threshold ({SIMILARITY_THRESHOLD})")
-                    print(f"[DEBUG] Top similarity was: {similar_docs[0]['similarity']:.4f}")
-            
-            # Generate answer - use relevant docs or allow LLM to respond from its knowledge
-            if relevant_docs:
-                answer = self.generate_answer(query_text, relevant_docs, conversation_history)
-            else:
-                # No relevant documents found, allow LLM to answer from its knowledge
-                print("[INFO] No relevant documents found. Using LLM's general knowledge of Indian law...")
-                answer = self.generate_answer(query_text, [], conversation_history)
+                    # No relevant documents found, allow LLM to answer from its knowledge
+                    print("[INFO] No relevant documents found. Using LLM's general knowledge of Indian law...")
+                    answer = self.generate_answer(query_text, [], conversation_history, conversation_summary)
+            trace["timings"]["generate"] = round((time.perf_counter() - generate_start) * 1000, 2)
             
+            if session is not None:
+                self.record_turn(session, query_text, answer)
+                if not is_followup:
+                    session.remember_retrieval(
+                        relevant_docs, "lawyer" if is_lawyer else "general", specialization, self.corpus_version
+                    )
+
             # Prepare sources only if relevant documents were found
             sources = []
             if relevant_docs:
@@ -618,6 +1159,7 @@ Answer:"""
                         "content": doc['content'][:200] + "...",  # Truncate for response
                         "source": doc['metadata'].get('source', 'Unknown'),
                         "page": doc['metadata'].get('page', 'N/A'),
+                        "also_in": doc['metadata'].get('also_in', []),
                         "similarity": float(doc['similarity'])
                     }
                     for doc in relevant_docs
@@ -626,11 +1168,15 @@ Answer:"""
             # Calculate confidence score
             confidence_score = self.calculate_confidence_score(query_text, relevant_docs, answer)
             
-            return {
+            result = {
                 "answer": answer,
                 "sources": sources,
                 "confidence_score": confidence_score
             }
+            # generate_answer reports LLM failures as an "Error: ..." answer; never cache those
+            if answer_key is not None and not answer.startswith("Error:"):
+                self.answer_cache.put(answer_key, (result, relevant_docs, is_lawyer, specialization))
+            return dict(result)
             
         except Exception as e:
             print(f"Query error: {str(e)}")
@@ -638,6 +1184,7 @@ Answer:"""
 
 # Initialize RAG system
 rag_system = RAGSystem()
+session_store = session_store_from_env()
 
 @app.get("/")
 async def root():
@@ -645,57 +1192,65 @@ async def root():
         "message": "Legal RAG API is running",
         "endpoints": {
             "/query": "POST - Query the knowledge base",
-            "/health": "GET - Health check"
+            "/session/{session_id}": "DELETE - End a conversation session",
+            "/ingest/upload": "POST - Upload a PDF for background ingestion",
+            "/ingest/jobs/{job_id}": "GET - Ingestion progress of an upload",
+            "/health": "GET - Health check",
+            "/stats": "GET - Index, pool, cache and embedding statistics"
         }
     }
 
 @app.get("/health")
 async def health():
-    """Health check endpoint"""
-    try:
-        cursor = rag_system.db_conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM documents")
-        doc_count = cursor.fetchone()[0]
-        cursor.close()
-        
-        return {
-            "status": "healthy",
-            "database": "connected",
-            "documents_count": doc_count
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Health check failed: {str(e)}")
+    """Health check endpoint (served from cached catalog stats, no table scan)"""
+    # A stale cache is refreshed by a blocking query, so it runs off the event loop
+    db_stats, refreshed_at, error = await run_in_threadpool(rag_system.cached_db_stats)
+    max_staleness = rag_system.stats_ttl_seconds * 3
+    if not refreshed_at or time.time() - refreshed_at > max_staleness:
+        raise HTTPException(status_code=503, detail=f"Health check failed: {error or 'database stats unavailable'}")
+
+    return {
+        "status": "healthy",
+        "database": "connected",
+        # Planner estimate from pg_class, refreshed at most every STATS_TTL_SECONDS
+        "documents_count": db_stats["row_estimate"],
+        "corpus_version": db_stats["corpus_version"],
+        "stats_age_seconds": round(time.time() - refreshed_at, 1)
+    }
+
+@app.get("/stats")
+async def stats():
+    """Operational statistics for dashboards"""
+    result = await run_in_threadpool(rag_system.stats)
+    result["sessions"] = len(session_store)
+    return result
 
 @app.post("/debug-lawyer")
 async def debug_lawyer(request: QueryRequest):
     """Debug endpoint to see what's happening with lawyer queries"""
     query_text = request.query
     
-    # Test detection
-    is_lawyer, spec = rag_system.is_lawyer_query(query_text)
-    
-    # Test keyword search
-    keyword_results = []
-    if is_lawyer and spec:
-        try:
-            cursor = rag_system.db_conn.cursor(cursor_factory=RealDictCursor)
-            search_term = f"%{spec.title()} Law%"
-            cursor.execute("""
-                SELECT content, metadata
-                FROM documents
-                WHERE content LIKE %s
-                AND metadata->>'source' = 'Lawyer.pdf'
-                LIMIT 5
-            """, (search_term,))
-            keyword_results = cursor.fetchall()
-            cursor.close()
-        except Exception as e:
-            keyword_results = [{"error": str(e)}]
+    # Build and run the retrieval plan the query path would use
+    plan = rag_system.plan_query(query_text, request.max_results)
+    deadline = rag_system.admission.deadline()
+
+    def run_plan():
+        """Embedding and database work, kept off the event loop"""
+        hits = plan.run(rag_system.plan_executors(query_text, {"deadline": deadline, "cache": set()}))
+        if plan.stages[0].name == "lawyer_keyword" and plan.stages[0].rows:
+            return rag_system.fetch_documents_by_ids([hit[0] for hit in hits], [hit[1] for hit in hits], deadline)
+        return []
+
+    try:
+        keyword_results = await run_in_threadpool(run_plan)
+    except Exception as e:
+        keyword_results = [{"error": str(e)}]
     
     return {
         "query": query_text,
-        "is_lawyer_query": is_lawyer,
-        "detected_specialization": spec,
+        "is_lawyer_query": plan.is_lawyer,
+        "detected_specialization": plan.specialization,
+        "plan": plan.to_dict(),
         "keyword_search_count": len(keyword_results),
         "keyword_results_preview": [
             {"content": r.get('content', '')[:200] + "..."} 
@@ -710,21 +1265,99 @@ async def query_knowledge_base(request: QueryRequest):
         if not request.query.strip():
             raise HTTPException(status_code=400, detail="Query cannot be empty")
         
-        result = rag_system.query(
-            request.query, 
-            request.max_results,
-            request.conversation_history
-        )
+        # Sessions are opt-in so stateless traffic never evicts real conversations from the LRU
+        session = session_store.get(request.session_id)
+        session_reset = bool(request.session_id) and session is None
+        if session is None and request.start_session:
+            # Lost session (evicted, expired, restarted or another worker): rebuild it from the client's history
+            session = session_store.create(request.conversation_history)
+        if not rag_system.needs_backend(request.query, session):
+            # Priority lane: canned replies are answered right here and never queue behind retrieval or the LLM
+            result = rag_system.query(request.query, request.max_results, request.conversation_history, session=session)
+        else:
+            # The deadline starts now, so time spent waiting for a worker thread counts against it.
+            # The gate sheds excess requests before they queue for one of the dedicated /query threads
+            deadline = rag_system.admission.deadline()
+            with rag_system.admission.gate.admit():
+                result = await anyio.to_thread.run_sync(
+                    partial(
+                        rag_system.query,
+                        request.query,
+                        request.max_results,
+                        request.conversation_history,
+                        session=session,
+                        deadline=deadline
+                    ),
+                    limiter=app.state.query_threads
+                )
+        result["session_id"] = session.session_id if session is not None else None
+        result["session_reset"] = session_reset
         return result
         
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        print(f"[WARN] Shedding /query: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server is busy ({e.stage}), please retry shortly",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
 
+@app.delete("/session/{session_id}")
+async def end_session(session_id: str):
+    """Drop server-side conversation state for a session"""
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"session_id": session_id, "deleted": True}
+
+@app.post("/ingest/upload", status_code=202)
+async def upload_pdf(file: UploadFile = File(...)):
+    """Accept a PDF and return at once; ingest_worker.py embeds it in the background"""
+    filename = safe_filename(file.filename)
+    if not filename:
+        raise HTTPException(status_code=400, detail="Only .pdf files can be uploaded")
+    if is_shipped_filename(filename):
+        raise HTTPException(status_code=409, detail=f"{filename} is a knowledge-base file; upload it under another name")
+    data = await file.read(UPLOAD_MAX_BYTES + 1)
+    if len(data) > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"File is larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MB")
+    if not data.startswith(b"%PDF-"):
+        raise HTTPException(status_code=400, detail="File is not a PDF")
+    try:
+        job = await run_in_threadpool(rag_system.enqueue_upload, filename, data)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    return {"job": job, "status_url": f"/ingest/jobs/{job['id']}"}
+
+@app.get("/ingest/jobs/{job_id}")
+async def upload_job_status(job_id: int):
+    """Status and embedding progress of an uploaded PDF"""
+    job = await run_in_threadpool(rag_system.upload_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/ingest/jobs")
+async def upload_jobs(status: Optional[str] = None, limit: int = 20):
+    """Most recent upload jobs, optionally only those with one status"""
+    jobs = await run_in_threadpool(rag_system.upload_jobs, min(max(limit, 1), 100), status)
+    return {"jobs": jobs}
+
+@app.on_event("startup")
+async def startup():
+    """Worker threads for /query, separate from the default pool (anyio limiters need the running loop)"""
+    app.state.query_threads = anyio.CapacityLimiter(rag_system.admission.gate.concurrency)
+
 @app.on_event("shutdown")
 async def shutdown():
-    """Close database connection on shutdown"""
-    if rag_system.db_conn:
-        rag_system.db_conn.close()
+    """Close database connections on shutdown"""
+    rag_system.retrieval_executor.shutdown(wait=False)
+    rag_system.shard_executor.shutdown(wait=False)
+    if rag_system.db_pool:
+        rag_system.db_pool.closeall()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,90 @@
+"""Compare the old per-page character splitter with the token-aware chunker.
+
+Usage:
+    python benchmark_chunking.py                 # chunk counts, token sizes, chunking time
+    python benchmark_chunking.py --embed         # also time embedding both chunk sets
+"""
+import os
+import time
+import argparse
+from pdf_cache import PDFTextCache
+from chunker import chunk_pages, make_token_counter, split_text_by_chars
+from embedding_store import DEFAULT_EMBEDDING_MODEL
+
+KNOWLEDGE_BASE_DIRS = ["knowledge-base", "New Knowledge Base"]
+
+
+def load_tokenizer(model_name, embed):
+    """Returns (tokenizer, max_seq_length, model or None)"""
+    if embed:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_name)
+        return model.tokenizer, model.max_seq_length, model
+    from transformers import AutoTokenizer
+    # all-mpnet-base-v2 truncates inputs at 384 tokens
+    return AutoTokenizer.from_pretrained(model_name), 384, None
+
+
+def old_chunks(pages):
+    return [chunk for text in pages if text.strip() for chunk in split_text_by_chars(text, 1000, 200)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF chunking strategies")
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--embed", action="store_true", help="Also time embedding the chunks")
+    args = parser.parse_args()
+
+    tokenizer, max_seq_length, model = load_tokenizer(args.model, args.embed)
+    count_tokens = make_token_counter(tokenizer)
+    max_tokens = max_seq_length - 2
+    cache = PDFTextCache()
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    documents = []
+    for kb_dir in KNOWLEDGE_BASE_DIRS:
+        path = os.path.join(base_dir, kb_dir)
+        if os.path.exists(path):
+            for name in sorted(f for f in os.listdir(path) if f.endswith(".pdf")):
+                documents.append((name, cache.get_pages(os.path.join(path, name))))
+
+    totals = {"old": [0, 0, 0.0, []], "new": [0, 0, 0.0, []]}  # chunks, truncated, seconds, texts
+    print(f"{'Document':<50} {'old':>6} {'new':>6} {'old>lim':>8} {'new>lim':>8}")
+    for name, pages in documents:
+        start = time.perf_counter()
+        old = old_chunks(pages)
+        old_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = [chunk["content"] for chunk in chunk_pages(pages, name, count_tokens, max_tokens=max_tokens)]
+        new_seconds = time.perf_counter() - start
+
+        old_truncated = sum(1 for tokens in count_tokens(old) if tokens > max_tokens)
+        new_truncated = sum(1 for tokens in count_tokens(new) if tokens > max_tokens)
+        print(f"{name[:50]:<50} {len(old):>6} {len(new):>6} {old_truncated:>8} {new_truncated:>8}")
+
+        for key, texts, truncated, seconds in (("old", old, old_truncated, old_seconds), ("new", new, new_truncated, new_seconds)):
+            totals[key][0] += len(texts)
+            totals[key][1] += truncated
+            totals[key][2] += seconds
+            totals[key][3].extend(texts)
+
+    print("-" * 82)
+    for key, label in (("old", "Per-page 1000/200 chars"), ("new", "Token-aware cross-page")):
+        chunks, truncated, seconds, texts = totals[key]
+        tokens = count_tokens(texts)
+        average = sum(tokens) / len(tokens) if tokens else 0
+        print(f"{label:<24} chunks={chunks:<5} avg_tokens={average:6.1f} "
+              f"truncated={truncated:<4} chunk_time={seconds * 1000:7.1f}ms")
+        if model is not None:
+            start = time.perf_counter()
+            model.encode(texts, batch_size=32)
+            print(f"{'':<24} embed_time={time.perf_counter() - start:6.2f}s")
+
+    old_count, new_count = totals["old"][0], totals["new"][0]
+    if old_count:
+        print(f"\nChunk count: {old_count} -> {new_count} ({(1 - new_count / old_count) * 100:.1f}% fewer)")
+
+
+if __name__ == "__main__":
+    main()
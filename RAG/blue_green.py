@@ -0,0 +1,241 @@
+"""Blue/green rebuilds of the documents table.
+
+Ingestion writes into documents_staging, builds the same indexes the live table
+has, validates the result, and then swaps it in with renames inside a single
+transaction. Readers only ever see the old table or the complete new one.
+"""
+from psycopg2 import sql
+from embedding_store import get_setting, set_setting
+
+LIVE_TABLE = "documents"
+STAGING_TABLE = "documents_staging"
+PREVIOUS_TABLE = "documents_previous"
+
+# FAQ question index (see faq_index.py), rebuilt and swapped together with documents
+FAQ_TABLE = "faq_questions"
+FAQ_STAGING_TABLE = "faq_questions_staging"
+FAQ_PREVIOUS_TABLE = "faq_questions_previous"
+
+CORPUS_VERSION_KEY = "corpus_version"
+
+# (suffix, index definition) - keep in sync with setup_database.sql
+DOCUMENT_INDEXES = [
+    ("embedding_idx", "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)"),
+    ("embedding_advocates_idx", "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 10) WHERE corpus = 'advocates'"),
+    ("embedding_faq_idx", "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 50) WHERE corpus = 'faq'"),
+    ("embedding_statutes_idx", "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 50) WHERE corpus = 'statutes'"),
+    ("embedding_legal_idx", "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100) WHERE corpus <> 'advocates'"),
+    ("corpus_source_idx", "(corpus, source)"),
+    ("metadata_idx", "USING gin (metadata)"),
+    ("content_trgm_idx", "USING gin (LOWER(content) gin_trgm_ops)"),
+]
+
+# Unique index on chunk_key; built with the empty staging table because loads rely on it
+CHUNK_KEY_INDEX = "chunk_key_idx"
+# GIN index on the LSH bands, also built up front: near-duplicate lookups during the load use it
+LSH_BANDS_INDEX = "lsh_bands_idx"
+
+MIN_ROW_RATIO = 0.8
+MIN_RECALL = 0.9
+RECALL_SAMPLE_SIZE = 20
+
+
+def get_corpus_version(conn) -> int:
+    return int(get_setting(conn, CORPUS_VERSION_KEY, "0"))
+
+
+def bump_corpus_version(conn) -> int:
+    """Increment corpus_version in the caller's transaction, returns the new version"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE rag_settings SET value = (value::int + 1)::text, updated_at = CURRENT_TIMESTAMP
+        WHERE key = %s RETURNING value::int
+        """,
+        (CORPUS_VERSION_KEY,)
+    )
+    row = cursor.fetchone()
+    cursor.close()
+    if row is None:
+        set_setting(conn, CORPUS_VERSION_KEY, "1")
+        return 1
+    return row[0]
+
+
+def table_exists(conn, table: str) -> bool:
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    exists = cursor.fetchone()[0]
+    cursor.close()
+    return exists
+
+
+def create_staging_table(conn):
+    """Start a rebuild: drop the last rollback copy and any half-built staging table"""
+    cursor = conn.cursor()
+    for table in (PREVIOUS_TABLE, STAGING_TABLE, FAQ_PREVIOUS_TABLE, FAQ_STAGING_TABLE):
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table)))
+    # Vectors of other models for rows that no longer exist anywhere
+    cursor.execute(
+        """
+        DELETE FROM document_embeddings de
+        WHERE NOT EXISTS (SELECT 1 FROM documents d WHERE d.id = de.document_id)
+        """
+    )
+    # Shares the live table's id sequence, so ids stay unique across generations
+    cursor.execute(
+        sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS)").format(
+            sql.Identifier(STAGING_TABLE), sql.Identifier(LIVE_TABLE)
+        )
+    )
+    # For live tables created before the column existed
+    cursor.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS chunk_key TEXT").format(sql.Identifier(STAGING_TABLE)))
+    cursor.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS lsh_bands BIGINT[]").format(sql.Identifier(STAGING_TABLE)))
+    cursor.execute(
+        sql.SQL("CREATE UNIQUE INDEX {} ON {} (chunk_key)").format(
+            sql.Identifier(f"{STAGING_TABLE}_{CHUNK_KEY_INDEX}"), sql.Identifier(STAGING_TABLE)
+        )
+    )
+    cursor.execute(
+        sql.SQL("CREATE INDEX {} ON {} USING gin (lsh_bands)").format(
+            sql.Identifier(f"{STAGING_TABLE}_{LSH_BANDS_INDEX}"), sql.Identifier(STAGING_TABLE)
+        )
+    )
+    # Databases without the FAQ table (shards set up before it existed) just skip it
+    if table_exists(conn, FAQ_TABLE):
+        cursor.execute(
+            sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING ALL)").format(
+                sql.Identifier(FAQ_STAGING_TABLE), sql.Identifier(FAQ_TABLE)
+            )
+        )
+    conn.commit()
+    cursor.close()
+    print(f"✓ Created empty {STAGING_TABLE}")
+
+
+def build_indexes(conn, table: str = STAGING_TABLE):
+    """Build primary key, ANN and text indexes after the bulk load (ivfflat trains on existing rows).
+
+    Safe to run again after a crash: indexes that already exist are kept.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (f"{table}_pkey",))
+    if not cursor.fetchone():
+        cursor.execute(
+            sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY (id)").format(
+                sql.Identifier(table), sql.Identifier(f"{table}_pkey")
+            )
+        )
+    for suffix, definition in DOCUMENT_INDEXES:
+        print(f"  Building {table}_{suffix}...")
+        cursor.execute(
+            sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} ").format(sql.Identifier(f"{table}_{suffix}"), sql.Identifier(table))
+            + sql.SQL(definition)
+        )
+    cursor.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(table)))
+    conn.commit()
+    cursor.close()
+    print(f"✓ Built {len(DOCUMENT_INDEXES) + 1} indexes on {table}")
+
+
+def validate_staging(conn, min_row_ratio: float = MIN_ROW_RATIO, min_recall: float = MIN_RECALL):
+    """Check row counts against the live table and self-recall of a random sample through the ANN index"""
+    cursor = conn.cursor()
+    cursor.execute(sql.SQL("SELECT COUNT(*), COUNT(embedding) FROM {}").format(sql.Identifier(STAGING_TABLE)))
+    staged, embedded = cursor.fetchone()
+    cursor.execute(sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(LIVE_TABLE)))
+    live = cursor.fetchone()[0]
+    # Near-duplicates folded into one row count once per source, so deduplication does not read as lost rows
+    cursor.execute(
+        sql.SQL("SELECT COALESCE(SUM(1 + jsonb_array_length(COALESCE(metadata->'also_in', '[]'::jsonb))), 0) FROM {}")
+        .format(sql.Identifier(STAGING_TABLE))
+    )
+    staged_chunks = int(cursor.fetchone()[0])
+    cursor.execute(
+        sql.SQL("SELECT COALESCE(SUM(1 + jsonb_array_length(COALESCE(metadata->'also_in', '[]'::jsonb))), 0) FROM {}")
+        .format(sql.Identifier(LIVE_TABLE))
+    )
+    live_chunks = int(cursor.fetchone()[0])
+
+    if staged == 0:
+        raise RuntimeError("Staging table is empty")
+    if embedded != staged:
+        raise RuntimeError(f"{staged - embedded} staged rows have no embedding")
+    if live_chunks and staged_chunks < live_chunks * min_row_ratio:
+        raise RuntimeError(
+            f"Staging has {staged_chunks} chunks, below {min_row_ratio:.0%} of the {live_chunks} live chunks"
+        )
+
+    cursor.execute(
+        sql.SQL("SELECT id, embedding::text FROM {} ORDER BY random() LIMIT %s").format(sql.Identifier(STAGING_TABLE)),
+        (RECALL_SAMPLE_SIZE,)
+    )
+    sample = cursor.fetchall()
+    hits = 0
+    for doc_id, embedding in sample:
+        cursor.execute(
+            sql.SQL("SELECT id FROM {} ORDER BY embedding <=> %s::vector LIMIT 5").format(sql.Identifier(STAGING_TABLE)),
+            (embedding,)
+        )
+        if doc_id in [row[0] for row in cursor.fetchall()]:
+            hits += 1
+    recall = hits / len(sample)
+    conn.rollback()
+    cursor.close()
+
+    if recall < min_recall:
+        raise RuntimeError(f"Sample recall {recall:.2f} is below {min_recall:.2f}")
+    print(f"✓ Validated staging: {staged} rows for {staged_chunks} chunks (live: {live} rows),"
+          f" sample recall@5 {recall:.2f}")
+    return {"staged_rows": staged, "live_rows": live, "recall": recall}
+
+
+def swap_in_staging(conn, drop_replaced_embeddings: bool = False) -> int:
+    """Atomically make the staging table live and bump the corpus version, returns the new version.
+
+    drop_replaced_embeddings deletes the other models' vectors of every row that
+    is not live afterwards, for staging tables loaded with ids from elsewhere.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (LIVE_TABLE,))
+    sequence = cursor.fetchone()[0]
+
+    # Everything below commits together; queries block on the lock only for the renames
+    cursor.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(sql.Identifier(LIVE_TABLE)))
+    cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(LIVE_TABLE), sql.Identifier(PREVIOUS_TABLE)))
+    cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(STAGING_TABLE), sql.Identifier(LIVE_TABLE)))
+    for suffix in ["pkey", CHUNK_KEY_INDEX, LSH_BANDS_INDEX] + [suffix for suffix, _ in DOCUMENT_INDEXES]:
+        cursor.execute(
+            sql.SQL("ALTER INDEX IF EXISTS {} RENAME TO {}").format(
+                sql.Identifier(f"{LIVE_TABLE}_{suffix}"), sql.Identifier(f"{PREVIOUS_TABLE}_{suffix}")
+            )
+        )
+        cursor.execute(
+            sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                sql.Identifier(f"{STAGING_TABLE}_{suffix}"), sql.Identifier(f"{LIVE_TABLE}_{suffix}")
+            )
+        )
+    if table_exists(conn, FAQ_STAGING_TABLE):
+        cursor.execute(sql.SQL("ALTER TABLE IF EXISTS {} RENAME TO {}").format(
+            sql.Identifier(FAQ_TABLE), sql.Identifier(FAQ_PREVIOUS_TABLE)))
+        cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+            sql.Identifier(FAQ_STAGING_TABLE), sql.Identifier(FAQ_TABLE)))
+    if sequence:
+        # Keep the id sequence alive when the previous table is dropped on the next rebuild
+        cursor.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY {}.id").format(sql.SQL(sequence), sql.Identifier(LIVE_TABLE)))
+    if drop_replaced_embeddings:
+        # Ids shared with the previous table are other text now, so those vectors go too
+        cursor.execute(
+            sql.SQL("""
+            DELETE FROM document_embeddings de
+            WHERE NOT EXISTS (SELECT 1 FROM {} d WHERE d.id = de.document_id)
+               OR EXISTS (SELECT 1 FROM {} p WHERE p.id = de.document_id)
+            """).format(sql.Identifier(LIVE_TABLE), sql.Identifier(PREVIOUS_TABLE))
+        )
+        print(f"[INFO] Dropped {cursor.rowcount} vectors of replaced documents from document_embeddings")
+
+    version = bump_corpus_version(conn)
+    conn.commit()
+    cursor.close()
+    print(f"✓ Swapped {STAGING_TABLE} in as {LIVE_TABLE}, corpus version is now {version}")
+    return version
@@ -0,0 +1,179 @@
+import re
+from typing import Callable, Iterator, List
+
+# Lines that start a new FAQ entry or section - chunks prefer to end just before these
+BOUNDARY_PATTERNS = [
+    re.compile(r"^Q\d*\s*[:.)]?\s+\S"),           # "Q What...", "Q: What...", "Q9 What..."
+    re.compile(r"^\d+\.\s+.*\?\s*$"),              # "12. Is the information legally binding?"
+    re.compile(r"^(Question|FAQ)\s*\d*\s*[:.)]", re.IGNORECASE),
+    re.compile(r"^(Chapter|Part)\s+[0-9IVX]+\b"),
+]
+
+# Browser print headers/footers repeated on every page of the exported guides
+NOISE_PATTERNS = [
+    re.compile(r"^\d{1,2}/\d{1,2}/\d{2,4},\s*\d{1,2}:\d{2}\s*(AM|PM)\b"),
+    re.compile(r"^(https?://)?[\w.\-]+(:\d+)?/\S*\.html\s+\d+/\d+$"),
+]
+
+TokenCounter = Callable[[List[str]], List[int]]
+
+
+def make_token_counter(tokenizer) -> TokenCounter:
+    """Batch token counter for a Hugging Face tokenizer (special tokens excluded)"""
+    def count(texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        encoded = tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+    return count
+
+
+def is_boundary(line: str) -> bool:
+    return any(pattern.match(line) for pattern in BOUNDARY_PATTERNS)
+
+
+def is_noise(line: str) -> bool:
+    return any(pattern.match(line) for pattern in NOISE_PATTERNS)
+
+
+class _Unit:
+    __slots__ = ("text", "tokens", "page", "boundary")
+
+    def __init__(self, text, tokens, page, boundary):
+        self.text = text
+        self.tokens = tokens
+        self.page = page
+        self.boundary = boundary
+
+
+def _units(pages: List[str], count_tokens: TokenCounter) -> Iterator[_Unit]:
+    """Stream cleaned lines across pages, tokenized one page at a time"""
+    for page_num, text in enumerate(pages, start=1):
+        lines = [line.strip() for line in text.splitlines()]
+        lines = [line for line in lines if line and not is_noise(line)]
+        for line, tokens in zip(lines, count_tokens(lines)):
+            yield _Unit(line, tokens, page_num, is_boundary(line))
+
+
+def _split_oversized(unit: _Unit, max_tokens: int, count_tokens: TokenCounter) -> List[_Unit]:
+    """Split a single line longer than the model limit on word boundaries"""
+    words = unit.text.split()
+    pieces = []
+    start = 0
+    while start < len(words):
+        # Estimate from the line's token/word ratio, then shrink until it fits
+        size = max(1, int(len(words) * max_tokens / max(unit.tokens, 1)))
+        while True:
+            text = " ".join(words[start:start + size])
+            tokens = count_tokens([text])[0]
+            if tokens <= max_tokens or size == 1:
+                break
+            size = max(1, int(size * 0.9))
+        pieces.append(_Unit(text, tokens, unit.page, unit.boundary and start == 0))
+        start += size
+    return pieces
+
+
+def _tail(units: List[_Unit], budget: int) -> List[_Unit]:
+    """Trailing units whose tokens fit in budget"""
+    tail = []
+    tokens = 0
+    for unit in reversed(units):
+        if tokens + unit.tokens > budget:
+            break
+        tail.append(unit)
+        tokens += unit.tokens
+    tail.reverse()
+    return tail
+
+
+def chunk_pages(pages: List[str], source: str, count_tokens: TokenCounter,
+                max_tokens: int = 380, overlap_tokens: int = 32) -> Iterator[dict]:
+    """Pack lines from consecutive pages into chunks of at most max_tokens tokens.
+
+    Chunks run across page boundaries and, when a chunk fills up, end before the
+    last FAQ question/section heading so an entry isn't cut in two. Only a chunk
+    split inside an entry carries overlap_tokens into the next: the entry's
+    question line when it fits, then trailing lines.
+    """
+    current: List[_Unit] = []
+    current_tokens = 0
+    block_start = 0  # index in current where the latest FAQ/section entry begins
+    chunk_idx = 0
+
+    def emit(units: List[_Unit]):
+        nonlocal chunk_idx
+        chunk = {
+            "content": "\n".join(unit.text for unit in units),
+            "metadata": {
+                "source": source,
+                "page": units[0].page,
+                "page_end": units[-1].page,
+                "chunk": chunk_idx,
+                "tokens": sum(unit.tokens for unit in units),
+            },
+        }
+        chunk_idx += 1
+        return chunk
+
+    # Pieces of an over-long line leave room for the overlap (and the entry's question) carried with them
+    piece_tokens = max(max_tokens - overlap_tokens, max_tokens // 2)
+
+    for unit in _units(pages, count_tokens):
+        pieces = [unit] if unit.tokens <= max_tokens else _split_oversized(unit, piece_tokens, count_tokens)
+        for piece in pieces:
+            if current and current_tokens + piece.tokens > max_tokens:
+                if piece.boundary:
+                    # A new entry starts here anyway - clean cut
+                    yield emit(current)
+                    current = []
+                else:
+                    if block_start > 0:
+                        # Cut before the entry that is still being filled and move it to the next chunk
+                        yield emit(current[:block_start])
+                        current = current[block_start:]
+                        block_start = 0
+                    if sum(u.tokens for u in current) + piece.tokens > max_tokens:
+                        # Entry longer than one chunk: cut inside it, carrying its question line
+                        # (when short enough) and a few trailing lines of overlap
+                        yield emit(current)
+                        budget = min(overlap_tokens, max_tokens - piece.tokens)
+                        entry = current[block_start:]
+                        head = entry[:1] if entry and entry[0].boundary and entry[0].tokens <= budget else []
+                        current = head + _tail(entry[len(head):], budget - sum(u.tokens for u in head))
+                        block_start = 0
+                current_tokens = sum(u.tokens for u in current)
+
+            if piece.boundary:
+                block_start = len(current)
+            current.append(piece)
+            current_tokens += piece.tokens
+
+    if current:
+        yield emit(current)
+
+
+def split_text_by_chars(text, chunk_size=1000, overlap=200):
+    """Previous per-page character splitter, kept for benchmark_chunking.py"""
+    chunks = []
+    start = 0
+    text_length = len(text)
+
+    while start < text_length:
+        end = start + chunk_size
+        chunk = text[start:end]
+
+        # Try to break at sentence boundary
+        if end < text_length:
+            last_period = chunk.rfind('.')
+            last_newline = chunk.rfind('\n')
+            break_point = max(last_period, last_newline)
+
+            if break_point > chunk_size * 0.5:  # If we found a reasonable break point
+                chunk = text[start:start + break_point + 1]
+                end = start + break_point + 1
+
+        chunks.append(chunk.strip())
+        start = end - overlap if end < text_length else text_length
+
+    return chunks
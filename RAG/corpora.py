@@ -0,0 +1,20 @@
+import os
+
+# Corpus slices of the documents table, each with its own partial ANN index
+CORPUS_ADVOCATES = "advocates"
+CORPUS_FAQ = "faq"
+CORPUS_STATUTES = "statutes"
+
+CORPORA = (CORPUS_ADVOCATES, CORPUS_FAQ, CORPUS_STATUTES)
+
+ADVOCATE_SOURCES = {"Lawyer.pdf"}
+
+
+def classify_source(source: str) -> str:
+    """Map a knowledge-base file name to its corpus (keep in sync with the backfill in setup_database.sql)"""
+    name = os.path.basename(source)
+    if name in ADVOCATE_SOURCES:
+        return CORPUS_ADVOCATES
+    if "faq" in name.lower():
+        return CORPUS_FAQ
+    return CORPUS_STATUTES
@@ -0,0 +1,246 @@
+import os
+import time
+import zlib
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from admission import Overloaded
+
+
+def connection_params(host: Optional[str] = None, port: Optional[str] = None) -> dict:
+    return {
+        "host": host or os.getenv("DB_HOST"),
+        "port": port or os.getenv("DB_PORT"),
+        "database": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+    }
+
+
+def parse_endpoints(spec: str) -> List[tuple]:
+    """'host:port,host:port' -> [(host, port), ...]; the port defaults to DB_PORT"""
+    endpoints = []
+    for item in spec.split(","):
+        item = item.strip()
+        if item:
+            host, _, port = item.partition(":")
+            endpoints.append((host, port or os.getenv("DB_PORT")))
+    return endpoints
+
+
+def shard_index(doc_id: int, shard_count: int) -> int:
+    """Shard holding a document; shard_sync.py distributes rows with the same function"""
+    return zlib.crc32(str(doc_id).encode()) % shard_count
+
+
+class DatabasePool:
+    """Thread-safe connection pool that waits for a free connection and tracks usage"""
+
+    def __init__(self, minconn: int = 1, maxconn: int = 10, wait_timeout: float = 10.0, **params):
+        self.maxconn = maxconn
+        self.wait_timeout = wait_timeout
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **(params or connection_params()))
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+
+    def getconn(self, timeout: float = None):
+        with self._lock:
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=self.wait_timeout if timeout is None else timeout)
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.timeouts += 1
+        if not acquired:
+            raise TimeoutError("Timed out waiting for a database connection")
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        self._pool.putconn(conn, close=close)
+        with self._lock:
+            self.in_use -= 1
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """Borrow a connection; commits on success, rolls back on error, drops it if broken"""
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken or conn.closed != 0)
+
+    def usage(self) -> dict:
+        with self._lock:
+            return {
+                "max_connections": self.maxconn,
+                "in_use": self.in_use,
+                "idle": len(self._pool._pool),
+                "waiting": self.waiting,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+            }
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+class ReplicaSet:
+    """Read connections balanced over equivalent endpoints, ejecting ones that fail.
+
+    An endpoint that refuses a connection, or whose connection breaks during a
+    query, is skipped for eject_seconds, then tried again by the next request.
+    A full pool or a failed query (a cancelled statement, say) is not the
+    endpoint's fault and does not eject it.
+    """
+
+    def __init__(self, pools: List[tuple], eject_seconds: float = 30.0):
+        self.pools = pools  # [(name, DatabasePool)]
+        self.eject_seconds = eject_seconds
+        self.ejected_until = {name: 0.0 for name, _ in pools}
+        self.failures = {name: 0 for name, _ in pools}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _candidates(self) -> List[tuple]:
+        """Healthy endpoints, least busy first (round-robin among equals), then ejected ones as a last resort"""
+        now = time.time()
+        with self._lock:
+            self._next += 1
+            start = self._next
+        rotated = [self.pools[(start + i) % len(self.pools)] for i in range(len(self.pools))]
+        healthy = [entry for entry in rotated if self.ejected_until[entry[0]] <= now]
+        ejected = [entry for entry in rotated if self.ejected_until[entry[0]] > now]
+        healthy.sort(key=lambda entry: entry[1].in_use)
+        return healthy + ejected
+
+    def eject(self, name: str, error: Exception):
+        with self._lock:
+            self.ejected_until[name] = time.time() + self.eject_seconds
+            self.failures[name] += 1
+        print(f"[WARN] Ejecting database endpoint {name} for {self.eject_seconds:.0f}s: {error}")
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        last_error = None
+        for name, pool in self._candidates():
+            try:
+                conn = pool.getconn(timeout)
+            except TimeoutError as e:
+                # Candidates come least busy first, so the others are saturated too: shed the request
+                raise Overloaded("database", 1, str(e)) from e
+            except psycopg2.OperationalError as e:
+                self.eject(name, e)
+                last_error = e
+                continue
+            broken = False
+            try:
+                yield conn
+                conn.commit()
+            except Exception as e:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+                if broken or conn.closed != 0 or isinstance(e, psycopg2.InterfaceError):
+                    broken = True
+                    self.eject(name, e)
+                raise
+            finally:
+                pool.putconn(conn, close=broken or conn.closed != 0)
+            return
+        raise last_error or RuntimeError("No database endpoints configured")
+
+    @property
+    def capacity(self) -> int:
+        return sum(pool.maxconn for _, pool in self.pools)
+
+    def usage(self) -> dict:
+        now = time.time()
+        return {
+            name: dict(
+                pool.usage(),
+                healthy=self.ejected_until[name] <= now,
+                failures=self.failures[name],
+            )
+            for name, pool in self.pools
+        }
+
+
+class ReadRouter:
+    """Read endpoints for retrieval: one or more hash shards, each a ReplicaSet"""
+
+    def __init__(self, shards: List[ReplicaSet]):
+        self.shards = shards
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.shards) > 1
+
+    def shard_number(self, doc_id: int) -> int:
+        return shard_index(doc_id, len(self.shards))
+
+    @property
+    def capacity(self) -> int:
+        # A scatter-gather query holds one connection per shard
+        return min(shard.capacity for shard in self.shards)
+
+    def usage(self) -> dict:
+        return {f"shard_{idx}": shard.usage() for idx, shard in enumerate(self.shards)}
+
+
+def replica_set_from_spec(spec: str, eject_seconds: float) -> ReplicaSet:
+    pools = []
+    for host, port in parse_endpoints(spec.replace("|", ",")):
+        # minconn=0 so an endpoint that is down at startup is ejected instead of failing the app
+        pool = DatabasePool(
+            minconn=0,
+            maxconn=int(os.getenv("DB_POOL_MAX", "10")),
+            wait_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            **connection_params(host, port)
+        )
+        pools.append((f"{host}:{port}", pool))
+    return ReplicaSet(pools, eject_seconds)
+
+
+def read_router_from_env(primary: DatabasePool) -> ReadRouter:
+    """DB_SHARDS='a:5433|a2:5434,b:5435' (shards by comma, replicas by |), else DB_READ_REPLICAS, else the primary"""
+    eject_seconds = float(os.getenv("DB_EJECT_SECONDS", "30"))
+    shards_spec = os.getenv("DB_SHARDS", "").strip()
+    if shards_spec:
+        return ReadRouter([replica_set_from_spec(group, eject_seconds) for group in shards_spec.split(",") if group.strip()])
+    replicas_spec = os.getenv("DB_READ_REPLICAS", "").strip()
+    if replicas_spec:
+        return ReadRouter([replica_set_from_spec(replicas_spec, eject_seconds)])
+    return ReadRouter([ReplicaSet([("primary", primary)], eject_seconds)])
+
+
+def pool_from_env(**params) -> DatabasePool:
+    return DatabasePool(
+        minconn=int(os.getenv("DB_POOL_MIN", "1")),
+        maxconn=int(os.getenv("DB_POOL_MAX", "10")),
+        wait_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        **params
+    )
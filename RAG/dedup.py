@@ -0,0 +1,286 @@
+"""Near-duplicate chunk detection at ingest (MinHash signatures with LSH banding).
+
+The same text can reach the index more than once: a guide kept in both
+folders, a re-uploaded PDF, an FAQ answer quoting a statute guide, or a page
+repeated within one file. A chunk whose word shingles are at least
+DEDUP_THRESHOLD similar (Jaccard) to a stored chunk it may fold into is neither
+embedded nor stored. Its source, page and chunk number are added to the stored
+chunk's metadata "also_in" list instead. FAQ and statute chunks fold into each
+other; the advocate directory is kept apart.
+
+Every stored chunk keeps its LSH band hashes in the lsh_bands column. A GIN
+index on that column finds candidates, which are then checked by exact Jaccard.
+
+Reworded text shares few shingles, so after embedding, a chunk whose vector is
+at least DEDUP_EMBEDDING_THRESHOLD similar (cosine) to a stored chunk is folded
+the same way. That saves the row and its index entries, not the embedding.
+"""
+import os
+import re
+import json
+import zlib
+import hashlib
+from typing import List, Optional, Set, Tuple
+
+import numpy as np
+from psycopg2 import sql
+
+from corpora import CORPUS_ADVOCATES, CORPUS_FAQ, CORPUS_STATUTES, classify_source
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+# 16 bands of 8 rows: a pair with Jaccard 0.85 shares a band with probability ~0.99, at 0.5 only ~0.06
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+# Smallest prime above 2**32; with a < 2**31 the products fit in uint64
+PRIME = 4294967311
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, 2 ** 31, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 2 ** 31, size=NUM_PERM, dtype=np.uint64)
+
+# Metadata copied into an "also_in" reference
+REFERENCE_KEYS = ("source", "page", "page_end", "chunk")
+
+
+def foldable_corpora(corpus: str) -> Tuple[str, ...]:
+    """Corpora a chunk may be folded into. Retrieval filters the advocate directory in or out,
+    but always searches FAQ and statute chunks together"""
+    if corpus == CORPUS_ADVOCATES:
+        return (CORPUS_ADVOCATES,)
+    return (CORPUS_FAQ, CORPUS_STATUTES)
+
+
+def shingles(text: str) -> Set[str]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def minhash(shingle_set: Set[str]) -> np.ndarray:
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    if not len(hashes):
+        return np.full(NUM_PERM, PRIME, dtype=np.uint64)
+    return ((np.outer(hashes, _PERM_A) + _PERM_B) % PRIME).min(axis=0)
+
+
+def band_hashes(signature: np.ndarray) -> List[int]:
+    """One signed 64-bit hash per band (a Postgres BIGINT); the band number is part of the hash"""
+    bands = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(band.to_bytes(2, "little") + rows.tobytes(), digest_size=8).digest()
+        bands.append(int.from_bytes(digest, "little", signed=True))
+    return bands
+
+
+def lsh_bands(text: str) -> List[int]:
+    return band_hashes(minhash(shingles(text)))
+
+
+def reference(key: str, chunk: dict) -> dict:
+    ref = {name: chunk["metadata"][name] for name in REFERENCE_KEYS if name in chunk["metadata"]}
+    ref["chunk_key"] = key
+    return ref
+
+
+def attach_duplicate(cursor, table: str, target_key: str, key: str, chunk: dict) -> bool:
+    """Record the chunk as another occurrence of target_key; False if the target row is gone"""
+    ref = reference(key, chunk)
+    cursor.execute(
+        sql.SQL("""
+        UPDATE {} SET metadata = CASE
+            WHEN COALESCE(metadata->'also_in', '[]'::jsonb) @> %s::jsonb THEN metadata
+            ELSE jsonb_set(metadata, '{{also_in}}', COALESCE(metadata->'also_in', '[]'::jsonb) || %s::jsonb)
+        END
+        WHERE chunk_key = %s
+        """).format(sql.Identifier(table)),
+        (json.dumps([{"chunk_key": key}]), json.dumps([ref]), target_key)
+    )
+    return cursor.rowcount > 0
+
+
+def remove_source(cursor, table: str, source: str, keep_keys: Optional[List[str]] = None):
+    """Delete a source's chunks, except keep_keys, along with its "also_in" references.
+
+    A deleted chunk that other sources also contain stays, handed over to the
+    first of them.
+    """
+    keep_keys = keep_keys or []
+    table_id = sql.Identifier(table)
+    cursor.execute(
+        sql.SQL("""
+        UPDATE {} SET metadata = jsonb_set(metadata, '{{also_in}}', COALESCE(
+            (SELECT jsonb_agg(ref) FROM jsonb_array_elements(metadata->'also_in') ref
+             WHERE ref->>'source' <> %s OR ref->>'chunk_key' = ANY(%s)),
+            '[]'::jsonb))
+        WHERE metadata->'also_in' @> %s::jsonb
+        """).format(table_id),
+        (source, keep_keys, json.dumps([{"source": source}]))
+    )
+    cursor.execute(
+        sql.SQL("""
+        UPDATE {} SET
+            source = metadata->'also_in'->0->>'source',
+            corpus = CASE
+                WHEN corpus = 'advocates' THEN corpus
+                WHEN LOWER(metadata->'also_in'->0->>'source') LIKE '%%faq%%' THEN 'faq'
+                ELSE 'statutes'
+            END,
+            chunk_key = metadata->'also_in'->0->>'chunk_key',
+            metadata = (metadata || ((metadata->'also_in'->0) - 'chunk_key')) #- '{{also_in,0}}'
+        WHERE source = %s AND NOT (chunk_key = ANY(%s)) AND jsonb_array_length(COALESCE(metadata->'also_in', '[]'::jsonb)) > 0
+        """).format(table_id),
+        (source, keep_keys)
+    )
+    promoted = cursor.rowcount
+    cursor.execute(
+        sql.SQL("""
+        DELETE FROM document_embeddings WHERE document_id IN (
+            SELECT id FROM {} WHERE source = %s AND NOT (chunk_key = ANY(%s))
+        )
+        """).format(table_id),
+        (source, keep_keys)
+    )
+    cursor.execute(
+        sql.SQL("DELETE FROM {} WHERE source = %s AND NOT (chunk_key = ANY(%s))").format(table_id),
+        (source, keep_keys)
+    )
+    if promoted:
+        print(f"  {promoted} chunks of {source} stay, now attributed to another source")
+
+
+class ChunkDeduplicator:
+    """Splits ingest batches into chunks to store and near-duplicates of stored chunks, counting the savings"""
+
+    def __init__(self, threshold: float, embedding_threshold: float = 0.0):
+        self.threshold = threshold
+        self.embedding_threshold = embedding_threshold
+        self.checked = 0
+        self.duplicates = 0
+        # Of the duplicates, those found by embedding similarity (already embedded)
+        self.embedded_duplicates = 0
+        self.chars_saved = 0
+
+    def split_batch(self, cursor, table: str, batch: List[Tuple[str, dict]],
+                    exclude_source: Optional[str] = None):
+        """(unique, duplicates): unique is [(key, chunk)] with chunk["lsh_bands"] set,
+        duplicates is [(key, chunk, target_key, similarity)].
+
+        A chunk may also duplicate an earlier unique chunk of the same batch, so
+        insert the unique chunks before attaching the duplicates.
+        """
+        prepared = []
+        for key, chunk in batch:
+            chunk_shingles = shingles(chunk["content"])
+            chunk["lsh_bands"] = band_hashes(minhash(chunk_shingles))
+            prepared.append((key, chunk, chunk_shingles, classify_source(chunk["metadata"]["source"])))
+
+        # Stored chunks sharing a band with the batch; an excluded source is about to be replaced
+        cursor.execute(
+            sql.SQL("""
+            SELECT chunk_key, content, corpus, lsh_bands FROM {}
+            WHERE lsh_bands && %s::bigint[] AND corpus = ANY(%s) AND (%s::text IS NULL OR source <> %s)
+            """).format(sql.Identifier(table)),
+            (
+                sorted({band for _, chunk, _, _ in prepared for band in chunk["lsh_bands"]}),
+                sorted({target for _, _, _, corpus in prepared for target in foldable_corpora(corpus)}),
+                exclude_source, exclude_source,
+            )
+        )
+        candidates = [
+            (row[0], shingles(row[1]), row[2], set(row[3])) for row in cursor.fetchall()
+        ]
+
+        unique, duplicates = [], []
+        for key, chunk, chunk_shingles, corpus in prepared:
+            bands = set(chunk["lsh_bands"])
+            foldable = foldable_corpora(corpus)
+            best_key, best_similarity = None, 0.0
+            for target_key, target_shingles, target_corpus, target_bands in candidates:
+                if target_corpus not in foldable or not bands & target_bands:
+                    continue
+                similarity = jaccard(chunk_shingles, target_shingles)
+                if similarity > best_similarity:
+                    best_key, best_similarity = target_key, similarity
+            self.checked += 1
+            if best_key is not None and best_similarity >= self.threshold:
+                duplicates.append((key, chunk, best_key, best_similarity))
+                self.duplicates += 1
+                self.chars_saved += len(chunk["content"])
+            else:
+                unique.append((key, chunk))
+                candidates.append((key, chunk_shingles, corpus, bands))
+        return unique, duplicates
+
+    def split_embedded(self, cursor, table: str, batch: List[Tuple[str, dict]], embeddings: List[list],
+                       exclude_source: Optional[str] = None):
+        """(indices of batch to store, duplicates as in split_batch) for chunks split_batch kept.
+
+        A chunk folds into the stored chunk, or earlier chunk of the batch, whose
+        document vector is nearest, if the cosine similarity reaches
+        embedding_threshold. Disabled when the threshold is 0.
+        """
+        if not self.embedding_threshold or not batch:
+            return list(range(len(batch))), []
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        keep, duplicates = [], []
+        for idx, (key, chunk) in enumerate(batch):
+            corpus = classify_source(chunk["metadata"]["source"])
+            foldable = foldable_corpora(corpus)
+            # Same filters as retrieval, so the partial ANN indexes serve the lookup
+            corpus_filter = "corpus = %s" if corpus == CORPUS_ADVOCATES else "corpus <> %s"
+            cursor.execute(
+                sql.SQL("""
+                SELECT chunk_key, 1 - (embedding <=> %s::vector) FROM {}
+                WHERE {} AND (%s::text IS NULL OR source <> %s)
+                ORDER BY embedding <=> %s::vector LIMIT 1
+                """).format(sql.Identifier(table), sql.SQL(corpus_filter)),
+                (embeddings[idx], CORPUS_ADVOCATES, exclude_source, exclude_source, embeddings[idx])
+            )
+            row = cursor.fetchone()
+            best_key, best_similarity = (row[0], float(row[1])) if row else (None, 0.0)
+            for kept in keep:
+                kept_key, kept_chunk = batch[kept]
+                if classify_source(kept_chunk["metadata"]["source"]) not in foldable:
+                    continue
+                similarity = float(vectors[idx] @ vectors[kept])
+                if similarity > best_similarity:
+                    best_key, best_similarity = kept_key, similarity
+            if best_key is not None and best_similarity >= self.embedding_threshold:
+                duplicates.append((key, chunk, best_key, best_similarity))
+                self.duplicates += 1
+                self.embedded_duplicates += 1
+                self.chars_saved += len(chunk["content"])
+            else:
+                keep.append(idx)
+        return keep, duplicates
+
+    def report(self, vector_bytes: int, models: int = 1) -> str:
+        """Savings so far; vector_bytes is the size of one chunk's vectors over all models"""
+        if not self.checked:
+            return "Near-duplicates: no chunks checked"
+        saved_bytes = self.duplicates * vector_bytes + self.chars_saved
+        return (
+            f"Near-duplicates: {self.duplicates}/{self.checked} chunks ({self.duplicates / self.checked:.1%}) folded"
+            f" into existing chunks, {(self.duplicates - self.embedded_duplicates) * models} embeddings skipped,"
+            f" ~{saved_bytes / 1024:.0f} KB of rows and vectors not stored"
+        )
+
+
+def deduplicator_from_env() -> Optional[ChunkDeduplicator]:
+    """ChunkDeduplicator with DEDUP_THRESHOLD and DEDUP_EMBEDDING_THRESHOLD (0 = off), or None when INGEST_DEDUP=0"""
+    if os.getenv("INGEST_DEDUP", "1") == "0":
+        return None
+    return ChunkDeduplicator(
+        float(os.getenv("DEDUP_THRESHOLD", "0.85")),
+        float(os.getenv("DEDUP_EMBEDDING_THRESHOLD", "0.97")),
+    )
@@ -0,0 +1,90 @@
+from typing import List, Optional
+
+from retrieval_plan import MIN_RELEVANT_SIMILARITY
+
+
+class DocumentFetcher:
+    """Second retrieval phase: content for document IDs from the chunk cache, else one lookup per shard.
+
+    The chunk cache is a VersionedCache; rows cached at an older corpus version
+    are fetched again, since a blue/green swap can reuse their IDs.
+    """
+
+    def __init__(self, read_db, admission, chunk_cache):
+        self.read_db = read_db
+        self.admission = admission
+        self.chunk_cache = chunk_cache
+
+    def fetch(self, doc_ids: List[int], similarities: Optional[List[float]] = None,
+              corpus_version: Optional[int] = None, deadline: Optional[float] = None) -> List[dict]:
+        """Documents in the order of doc_ids with their scores; IDs no longer stored are dropped.
+
+        Only the columns the answer stage reads are fetched, as plain tuples
+        rather than a dict per row.
+        """
+        if not doc_ids:
+            return []
+        chunks = {}
+        for doc_id in doc_ids:
+            chunk = self.chunk_cache.get(doc_id, corpus_version)
+            if chunk is not None:
+                chunks[doc_id] = chunk
+
+        missing = [doc_id for doc_id in doc_ids if doc_id not in chunks]
+        if missing:
+            # Each shard is asked only for the IDs it owns
+            by_shard = {}
+            for doc_id in missing:
+                by_shard.setdefault(self.read_db.shard_number(doc_id), []).append(doc_id)
+            for shard_number, shard_ids in by_shard.items():
+                replicas = self.read_db.shards[shard_number]
+                with self.admission.slot("db", deadline), replicas.connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(
+                        """
+                        SELECT id, content, source, (metadata->>'page')::int, metadata->'also_in'
+                        FROM documents WHERE id = ANY(%s)
+                        """,
+                        (shard_ids,)
+                    )
+                    rows = cursor.fetchall()
+                    cursor.close()
+                for doc_id, content, source, page, also_in in rows:
+                    metadata = {"source": source} if page is None else {"source": source, "page": page}
+                    if also_in:
+                        # Near-duplicate copies of this chunk in other PDFs (see dedup.py)
+                        metadata["also_in"] = [
+                            {"source": ref.get("source"), "page": ref.get("page")} for ref in also_in
+                        ]
+                    chunks[doc_id] = (content, metadata)
+                    self.chunk_cache.put(doc_id, corpus_version, chunks[doc_id])
+
+        docs = []
+        for idx, doc_id in enumerate(doc_ids):
+            chunk = chunks.get(doc_id)
+            if chunk is None:
+                continue
+            docs.append({
+                'id': doc_id,
+                'content': chunk[0],
+                'metadata': chunk[1],
+                'similarity': similarities[idx] if similarities else 0.9,
+            })
+        return docs
+
+    def fetch_relevant(self, hits, corpus_version: Optional[int] = None, trace: Optional[dict] = None) -> tuple:
+        """Content for the hits the answer stage will read, returns (docs, number of hits wanted).
+
+        Hits below MIN_RELEVANT_SIMILARITY never reach the prompt or the sources,
+        so their content is not fetched. Fewer docs than wanted means some IDs
+        are gone, and a cached hit list should be searched again.
+        """
+        if trace is not None:
+            trace["doc_ids"] = [hit[0] for hit in hits]
+            trace["similarities"] = [float(hit[1]) for hit in hits]
+        relevant = [hit for hit in hits if hit[1] >= MIN_RELEVANT_SIMILARITY]
+        docs = self.fetch(
+            [hit[0] for hit in relevant], [float(hit[1]) for hit in relevant],
+            corpus_version, trace.get("deadline") if trace else None
+        )
+        return docs, len(relevant)
@@ -0,0 +1,123 @@
+import hashlib
+from typing import Dict, List, Optional
+
+# Model whose vectors are stored in documents.embedding unless rag_settings says otherwise
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+
+ACTIVE_MODEL_KEY = "active_embedding_model"
+DOCUMENTS_MODEL_KEY = "documents_embedding_model"
+
+
+def content_hash(text: str) -> str:
+    """Content address of a chunk - identical text always maps to the same embedding"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_setting(conn, key: str, default: Optional[str] = None) -> Optional[str]:
+    cursor = conn.cursor()
+    cursor.execute("SELECT value FROM rag_settings WHERE key = %s", (key,))
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else default
+
+
+def set_setting(conn, key: str, value: str):
+    """Upsert a setting (caller controls the transaction)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        INSERT INTO rag_settings (key, value, updated_at)
+        VALUES (%s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = EXCLUDED.updated_at
+        """,
+        (key, value)
+    )
+    cursor.close()
+
+
+def get_active_model(conn) -> str:
+    return get_setting(conn, ACTIVE_MODEL_KEY, DEFAULT_EMBEDDING_MODEL)
+
+
+def get_documents_model(conn) -> str:
+    return get_setting(conn, DOCUMENTS_MODEL_KEY, DEFAULT_EMBEDDING_MODEL)
+
+
+def get_model_dimension(conn, model_name: str) -> Optional[int]:
+    cursor = conn.cursor()
+    cursor.execute("SELECT dimension FROM embedding_migrations WHERE model_name = %s", (model_name,))
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else None
+
+
+def model_index_name(model_name: str) -> str:
+    """Stable index name for a model's partial ANN index on document_embeddings"""
+    return f"document_embeddings_{content_hash(model_name)[:12]}_idx"
+
+
+class EmbeddingStore:
+    """Embeddings keyed by (model name, content hash) in the embedding_cache table"""
+
+    def __init__(self, conn, model_name: str, encoder):
+        self.conn = conn
+        self.model_name = model_name
+        self.encoder = encoder
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, hashes: List[str]) -> Dict[str, list]:
+        if not hashes:
+            return {}
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT content_hash, embedding::real[]
+            FROM embedding_cache
+            WHERE model_name = %s AND content_hash = ANY(%s)
+            """,
+            (self.model_name, list(hashes))
+        )
+        found = {row[0]: list(row[1]) for row in cursor.fetchall()}
+        cursor.close()
+        return found
+
+    def store(self, items: Dict[str, list]):
+        if not items:
+            return
+        cursor = self.conn.cursor()
+        for digest, embedding in items.items():
+            cursor.execute(
+                """
+                INSERT INTO embedding_cache (model_name, content_hash, embedding)
+                VALUES (%s, %s, %s::vector)
+                ON CONFLICT (model_name, content_hash) DO NOTHING
+                """,
+                (self.model_name, digest, embedding)
+            )
+        cursor.close()
+
+    def embed_many(self, texts: List[str], batch_size: int = 32) -> List[list]:
+        """Embed texts, only running the model for content not seen before under this model"""
+        hashes = [content_hash(text) for text in texts]
+        cached = self.lookup(list(set(hashes)))
+
+        missing = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in cached and digest not in missing:
+                missing[digest] = text
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            digests = list(missing.keys())
+            vectors = self.encoder.encode([missing[d] for d in digests], batch_size=batch_size)
+            fresh = {digest: vector.tolist() for digest, vector in zip(digests, vectors)}
+            self.store(fresh)
+            cached.update(fresh)
+
+        return [cached[digest] for digest in hashes]
+
+    def embed(self, text: str) -> list:
+        return self.embed_many([text])[0]
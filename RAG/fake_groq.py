@@ -0,0 +1,71 @@
+"""Stand-in for the Groq chat completions API, used by load_test.py.
+
+Usage:
+    FAKE_GROQ_LATENCY_MS=800 uvicorn fake_groq:app --port 8100
+    GROQ_BASE_URL=http://127.0.0.1:8100 GROQ_API_KEY=fake uvicorn app:app
+"""
+import os
+import time
+import uuid
+import random
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Mean latency of a completion and +/- jitter, both in milliseconds
+LATENCY_MS = float(os.getenv("FAKE_GROQ_LATENCY_MS", "800"))
+JITTER_MS = float(os.getenv("FAKE_GROQ_JITTER_MS", "200"))
+# Fraction of requests answered with a 500, to exercise the error path
+ERROR_RATE = float(os.getenv("FAKE_GROQ_ERROR_RATE", "0"))
+
+ANSWER = """**Your Rights:**
+1. You have the right to file a complaint at the nearest police station.
+2. You can approach the consumer forum or civil court depending on the dispute.
+
+**Steps:**
+1. Collect all documents and evidence - immediately
+2. File the complaint - within 30 days
+
+**Next Steps:**
+1. Consult a lawyer for your specific case."""
+
+app = FastAPI(title="Fake Groq API")
+stats = {"requests": 0, "errors": 0}
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    delay = max(LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS), 0) / 1000
+    await asyncio.sleep(delay)
+
+    if random.random() < ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse(status_code=500, content={"error": {"message": "Injected failure", "type": "server_error"}})
+
+    prompt = body["messages"][-1]["content"]
+    prompt_tokens = len(prompt.split())
+    completion_tokens = len(ANSWER.split())
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "llama-3.3-70b-versatile"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": ANSWER},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
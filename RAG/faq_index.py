@@ -0,0 +1,138 @@
+"""Question/answer pairs extracted from the FAQ PDFs, for answering a query without the LLM.
+
+Ingest stores each pair in faq_questions with an embedding of the question
+(under the active query model). The API holds those vectors in memory and, when
+a query's embedding is close enough to a question, serves the curated answer.
+"""
+import os
+import re
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from blue_green import FAQ_TABLE
+from chunker import is_boundary, is_noise
+from embedding_store import content_hash
+
+QUESTION_PATTERNS = [
+    re.compile(r"^Q\d*\s*[:.)]?\s+(?P<question>\S.*)$"),
+    re.compile(r"^(?:Question|FAQ)\s*\d*\s*[:.)]\s*(?P<question>\S.*)$", re.IGNORECASE),
+    re.compile(r"^\d+\.\s+(?P<question>.*\?)\s*$"),
+]
+ANSWER_PREFIX = re.compile(r"^(?:A|Ans|Answer)\s*\d*\s*[:.)]\s*", re.IGNORECASE)
+
+# A question may wrap onto this many further lines before its "?"
+MAX_QUESTION_LINES = 3
+MIN_ANSWER_CHARS = 20
+
+
+def match_question(line: str) -> Optional[str]:
+    for pattern in QUESTION_PATTERNS:
+        match = pattern.match(line)
+        if match:
+            return match.group("question").strip()
+    return None
+
+
+def extract_faq_entries(pages: List[str], source: str) -> List[dict]:
+    """Question/answer pairs in page order; an answer runs until the next question or section heading"""
+    lines = [
+        (page_num, line.strip())
+        for page_num, text in enumerate(pages, start=1)
+        for line in text.splitlines()
+        if line.strip() and not is_noise(line.strip())
+    ]
+    entries = []
+    seen = set()
+    i = 0
+    while i < len(lines):
+        page, line = lines[i]
+        question = match_question(line)
+        i += 1
+        if question is None:
+            continue
+        # Join wrapped question lines, but only when a "?" closes the question soon after
+        if "?" not in question:
+            for extra in range(1, MAX_QUESTION_LINES + 1):
+                if i + extra > len(lines) or is_boundary(lines[i + extra - 1][1]):
+                    break
+                if lines[i + extra - 1][1].endswith("?"):
+                    question = " ".join([question] + [text for _, text in lines[i:i + extra]])
+                    i += extra
+                    break
+        answer = []
+        while i < len(lines) and not is_boundary(lines[i][1]):
+            answer.append(lines[i][1])
+            i += 1
+        answer_text = ANSWER_PREFIX.sub("", " ".join(answer)).strip()
+        key = question.lower()
+        if len(answer_text) < MIN_ANSWER_CHARS or key in seen:
+            continue
+        seen.add(key)
+        entries.append({"question": question, "answer": answer_text, "source": source, "page": page})
+    return entries
+
+
+def entry_key(file_digest: str, entry: dict) -> str:
+    return content_hash(f"{file_digest}:{entry['question']}:{entry['answer']}")
+
+
+class FAQIndex:
+    """FAQ question vectors of one model, matched by exact cosine similarity in memory"""
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        # (model name, entries, normalized question matrix), replaced as one tuple on reload
+        self._state = (None, [], None)
+        self.loaded_at = None
+        self._lock = threading.Lock()
+
+    def load(self, conn, model_name: str):
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT question, answer, source, page, embedding::real[] FROM {FAQ_TABLE} WHERE model_name = %s",
+            (model_name,)
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        entries = [{"question": row[0], "answer": row[1], "source": row[2], "page": row[3]} for row in rows]
+        matrix = None
+        if rows:
+            matrix = np.asarray([row[4] for row in rows], dtype=np.float32)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            self._state = (model_name, entries, matrix)
+            self.loaded_at = time.time()
+        print(f"[INFO] Loaded {len(entries)} FAQ questions for {model_name}")
+
+    def match(self, embedding, model_name: str):
+        """(entry, similarity) of the closest question at or above the threshold, else None"""
+        loaded_model, entries, matrix = self._state
+        if matrix is None or loaded_model != model_name:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        similarity = float(scores[best])
+        if similarity < self.threshold:
+            return None
+        return entries[best], similarity
+
+    def usage(self) -> dict:
+        model_name, entries, _matrix = self._state
+        return {
+            "model": model_name,
+            "questions": len(entries),
+            "threshold": self.threshold,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def faq_index_from_env() -> Optional[FAQIndex]:
+    """FAQIndex with FAQ_MATCH_THRESHOLD, or None when FAQ_DIRECT_ANSWERS=0"""
+    if os.getenv("FAQ_DIRECT_ANSWERS", "1") == "0":
+        return None
+    return FAQIndex(float(os.getenv("FAQ_MATCH_THRESHOLD", "0.9")))
@@ -0,0 +1,252 @@
+"""Durable bookkeeping for process_pdfs.py runs.
+
+A job records which files are finished and how many chunks of the current
+file are stored. Each batch of chunks commits in the same transaction as its
+checkpoint, so a crash loses at most one batch. Chunks that fail to embed or
+insert, and files that cannot be read, go to a dead-letter table instead of
+being skipped silently.
+"""
+import os
+import json
+import time
+from typing import List, Optional
+from embedding_store import content_hash
+
+# Job phases, in order; resume continues from the recorded one
+PHASE_LOADING = "loading"
+PHASE_INDEXING = "indexing"
+PHASE_SWAPPING = "swapping"
+PHASE_COMPLETED = "completed"
+
+# Session advisory lock: held exclusively by the process_pdfs.py run or resume working on a job,
+# shared by ingest workers while they publish an upload. Postgres releases it when the holder's
+# connection closes, crash or not
+REBUILD_LOCK_KEY = 0x52414701
+
+
+def chunk_key(file_digest: str, chunk: dict) -> str:
+    """Identity of a chunk: the same file content always yields the same keys"""
+    return content_hash(f"{file_digest}:{chunk['metadata']['chunk']}:{chunk['content']}")
+
+
+def create_job(conn, target_table: str, files: List[str]) -> int:
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO ingest_jobs (target_table, phase) VALUES (%s, %s) RETURNING id",
+        (target_table, PHASE_LOADING)
+    )
+    job_id = cursor.fetchone()[0]
+    for path in files:
+        cursor.execute(
+            "INSERT INTO ingest_files (job_id, file_path) VALUES (%s, %s)",
+            (job_id, path)
+        )
+    conn.commit()
+    cursor.close()
+    return job_id
+
+
+def latest_unfinished_job(conn) -> Optional[dict]:
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT id, target_table, phase, error FROM ingest_jobs
+        WHERE phase <> %s AND NOT abandoned
+        ORDER BY id DESC LIMIT 1
+        """,
+        (PHASE_COMPLETED,)
+    )
+    row = cursor.fetchone()
+    cursor.close()
+    if not row:
+        return None
+    return {"id": row[0], "target_table": row[1], "phase": row[2], "error": row[3]}
+
+
+def abandon_unfinished_jobs(conn):
+    """A fresh run replaces the staging table, so older unfinished jobs can no longer resume"""
+    cursor = conn.cursor()
+    cursor.execute("UPDATE ingest_jobs SET abandoned = TRUE, updated_at = CURRENT_TIMESTAMP WHERE phase <> %s",
+                   (PHASE_COMPLETED,))
+    conn.commit()
+    cursor.close()
+
+
+def try_rebuild_lock(conn, wait_seconds: float = 0) -> bool:
+    """Exclusive; waits up to wait_seconds for uploads being published to finish"""
+    deadline = time.time() + wait_seconds
+    cursor = conn.cursor()
+    while True:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (REBUILD_LOCK_KEY,))
+        acquired = cursor.fetchone()[0]
+        conn.commit()
+        if acquired or time.time() >= deadline:
+            break
+        time.sleep(1)
+    cursor.close()
+    return acquired
+
+
+def try_publish_lock(conn) -> bool:
+    """Shared with other publishing workers, so it only fails while a rebuild holds the lock"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_try_advisory_lock_shared(%s)", (REBUILD_LOCK_KEY,))
+    acquired = cursor.fetchone()[0]
+    cursor.close()
+    return acquired
+
+
+def release_publish_lock(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_advisory_unlock_shared(%s)", (REBUILD_LOCK_KEY,))
+    cursor.close()
+
+
+def abandon_job(conn, job_id: int):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE ingest_jobs SET abandoned = TRUE, updated_at = CURRENT_TIMESTAMP WHERE id = %s", (job_id,))
+    conn.commit()
+    cursor.close()
+
+
+def job_idle_seconds(conn, job_id: int) -> float:
+    """Seconds since the job last changed phase or checkpointed a batch"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - GREATEST(j.updated_at, MAX(f.updated_at)))
+        FROM ingest_jobs j LEFT JOIN ingest_files f ON f.job_id = j.id
+        WHERE j.id = %s
+        GROUP BY j.updated_at
+        """,
+        (job_id,)
+    )
+    row = cursor.fetchone()
+    cursor.close()
+    return float(row[0]) if row and row[0] is not None else 0.0
+
+
+def set_phase(conn, job_id: int, phase: str, error: Optional[str] = None):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE ingest_jobs
+        SET phase = %s, error = %s, updated_at = CURRENT_TIMESTAMP,
+            finished_at = CASE WHEN %s = %s THEN CURRENT_TIMESTAMP END
+        WHERE id = %s
+        """,
+        (phase, error, phase, PHASE_COMPLETED, job_id)
+    )
+    conn.commit()
+    cursor.close()
+
+
+def record_error(conn, job_id: int, error: str):
+    conn.rollback()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE ingest_jobs SET error = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+                   (error[:2000], job_id))
+    conn.commit()
+    cursor.close()
+
+
+def pending_files(conn, job_id: int) -> List[dict]:
+    """Files not finished yet, with the content hash recorded when they were started (None if never)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT file_path, file_hash FROM ingest_files WHERE job_id = %s AND NOT done ORDER BY file_path",
+        (job_id,)
+    )
+    files = [{"file_path": row[0], "file_hash": row[1]} for row in cursor.fetchall()]
+    cursor.close()
+    return files
+
+
+def checkpoint_file(cursor, job_id: int, file_path: str, file_hash: str, chunks: int, stored: int,
+                    failed: int, done: bool = False, duplicates: int = 0):
+    """Called inside the batch's transaction, so the checkpoint and the rows commit together.
+
+    stored includes the duplicates, chunks folded into a near-duplicate already stored.
+    """
+    cursor.execute(
+        """
+        UPDATE ingest_files
+        SET file_hash = %s, chunks = %s, stored = %s, failed = %s, done = %s, duplicates = %s,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE job_id = %s AND file_path = %s
+        """,
+        (file_hash, chunks, stored, failed, done, duplicates, job_id, file_path)
+    )
+
+
+def add_dead_letter(cursor, job_id: int, chunk_key: str, file_path: str, chunk: dict, error: str):
+    cursor.execute(
+        """
+        INSERT INTO ingest_dead_letters (job_id, chunk_key, file_path, content, metadata, error)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (job_id, chunk_key) DO UPDATE
+        SET error = EXCLUDED.error, attempts = ingest_dead_letters.attempts + 1, updated_at = CURRENT_TIMESTAMP
+        """,
+        (job_id, chunk_key, file_path, chunk["content"], json.dumps(chunk["metadata"]), error[:2000])
+    )
+
+
+def add_unreadable_file(cursor, job_id: int, file_path: str, error: str):
+    """A file that could not be read or parsed, dead-lettered as a whole (metadata "unreadable")"""
+    add_dead_letter(
+        cursor, job_id, f"file:{file_path}", file_path,
+        {"content": "", "metadata": {"source": os.path.basename(file_path), "unreadable": True}},
+        error
+    )
+
+
+def dead_letters(conn, job_id: int) -> List[dict]:
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT chunk_key, file_path, content, metadata, error, attempts
+        FROM ingest_dead_letters WHERE job_id = %s ORDER BY file_path, chunk_key
+        """,
+        (job_id,)
+    )
+    rows = [
+        {"chunk_key": row[0], "file_path": row[1], "content": row[2], "metadata": row[3],
+         "error": row[4], "attempts": row[5]}
+        for row in cursor.fetchall()
+    ]
+    cursor.close()
+    return rows
+
+
+def clear_dead_letter(cursor, job_id: int, chunk_key: str, file_path: str):
+    """A retried chunk was stored: drop it from the dead letters and move it to the file's stored count"""
+    cursor.execute("DELETE FROM ingest_dead_letters WHERE job_id = %s AND chunk_key = %s", (job_id, chunk_key))
+    cursor.execute(
+        """
+        UPDATE ingest_files SET stored = stored + 1, failed = GREATEST(failed - 1, 0), updated_at = CURRENT_TIMESTAMP
+        WHERE job_id = %s AND file_path = %s
+        """,
+        (job_id, file_path)
+    )
+
+
+def clear_file_dead_letters(cursor, job_id: int, file_path: str):
+    cursor.execute("DELETE FROM ingest_dead_letters WHERE job_id = %s AND file_path = %s", (job_id, file_path))
+
+
+def job_summary(conn, job_id: int) -> dict:
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT COUNT(*), COUNT(*) FILTER (WHERE done), COALESCE(SUM(stored), 0), COALESCE(SUM(chunks), 0),
+               COALESCE(SUM(duplicates), 0)
+        FROM ingest_files WHERE job_id = %s
+        """,
+        (job_id,)
+    )
+    files, done, stored, chunks, duplicates = cursor.fetchone()
+    cursor.execute("SELECT COUNT(*) FROM ingest_dead_letters WHERE job_id = %s", (job_id,))
+    failed = cursor.fetchone()[0]
+    cursor.close()
+    return {"files": files, "files_done": done, "chunks": chunks, "stored": stored, "duplicates": duplicates,
+            "dead_letters": failed}
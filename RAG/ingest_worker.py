@@ -0,0 +1,264 @@
+"""Background ingestion of PDFs uploaded through POST /ingest/upload.
+
+Usage:
+    python ingest_worker.py [--workers 2]
+
+Runs a pool of worker processes, separate from the API, that take jobs from
+the upload_jobs queue. Each worker limits itself so ingest never starves query
+serving:
+
+    INGEST_WORKERS (1)          worker processes, one job each at a time
+    INGEST_TORCH_THREADS (1)    CPU threads each worker's embedding model may use
+    INGEST_NICE (10)            scheduling priority below the API process
+    INGEST_CPUS                 cores the workers are pinned to, e.g. "2,3"
+    INGEST_BATCH_SIZE (32)      chunks embedded between progress updates
+
+A file's chunks, its FAQ pairs and the corpus_version bump are committed in one
+transaction. Queries see all of the new document or none of it.
+"""
+import os
+import time
+import signal
+import socket
+import argparse
+import multiprocessing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "2"))
+# A running job with no progress update for this long is assumed to have lost its worker
+STALE_SECONDS = int(os.getenv("INGEST_STALE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+
+
+def limit_resources():
+    """Applied in each worker process before the embedding model loads"""
+    nice = int(os.getenv("INGEST_NICE", "10"))
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+    cpus = os.getenv("INGEST_CPUS", "").strip()
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {int(cpu) for cpu in cpus.split(",") if cpu.strip()})
+    import torch
+    torch.set_num_threads(int(os.getenv("INGEST_TORCH_THREADS", "1")))
+
+
+def acquire_publish_lock(conn) -> bool:
+    """Share the rebuild lock for a publish; False while a blue/green rebuild would swap the chunks out.
+
+    The lock is held until release_publish_lock, so no rebuild can start between
+    this check and the publish. An unfinished rebuild whose process is gone (no
+    one holds the lock) and that has not progressed for STALE_SECONDS is
+    abandoned rather than holding uploads back forever; resuming it would drop
+    them again.
+    """
+    from ingest_jobs import abandon_job, job_idle_seconds, latest_unfinished_job, release_publish_lock, try_publish_lock
+    if not try_publish_lock(conn):
+        conn.commit()
+        return False
+    try:
+        job = latest_unfinished_job(conn)
+        if job is not None:
+            idle = job_idle_seconds(conn, job['id'])
+            if idle < STALE_SECONDS:
+                release_publish_lock(conn)
+                conn.commit()
+                return False
+            abandon_job(conn, job['id'])
+            print(f"[WARN] Rebuild job {job['id']} stopped in phase '{job['phase']}' {idle:.0f}s ago;"
+                  f" abandoned it so uploads can go live. Run process_pdfs.py again for a full rebuild")
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        release_publish_lock(conn)
+        conn.commit()
+        raise
+
+
+def rebuild_in_progress(conn) -> bool:
+    from ingest_jobs import release_publish_lock
+    if not acquire_publish_lock(conn):
+        return True
+    release_publish_lock(conn)
+    conn.commit()
+    return False
+
+
+def publish(processor, job, digest, pages, unique, duplicates, embeddings, active_embeddings) -> int:
+    """Replace any earlier version of the file and make the new chunks visible, returns the corpus version"""
+    from corpora import CORPUS_FAQ, classify_source
+    from blue_green import FAQ_TABLE, LIVE_TABLE, bump_corpus_version
+    from dedup import attach_duplicate, remove_source
+    from faq_index import extract_faq_entries
+    from upload_queue import complete_job, is_shipped_filename
+
+    conn = processor.db_conn
+    source = os.path.basename(job['file_path'])
+    if is_shipped_filename(source):
+        # Publishing would delete the shipped file's chunks; the API refuses these names, older jobs may not
+        raise RuntimeError(f"{source} is a knowledge-base file name; upload it under another name")
+    cursor = conn.cursor()
+    remove_source(cursor, LIVE_TABLE, source)
+    for idx, (key, chunk) in enumerate(unique):
+        active = active_embeddings[idx] if active_embeddings else None
+        processor.insert_chunk(cursor, key, chunk, embeddings[idx], active)
+    for key, chunk, target_key, _similarity in duplicates:
+        if not attach_duplicate(cursor, LIVE_TABLE, target_key, key, chunk):
+            # The near-duplicate was removed by another upload since the lookup; store this chunk after all
+            active = processor.active_store.embed(chunk['content']) if processor.active_store else None
+            processor.insert_chunk(cursor, key, chunk, processor.generate_embedding(chunk['content']), active)
+    if processor.faq_table:
+        cursor.execute(f"DELETE FROM {FAQ_TABLE} WHERE source = %s", (source,))
+        if classify_source(source) == CORPUS_FAQ:
+            entries = extract_faq_entries(pages, source)
+            if entries:
+                processor.store_faq_entries(cursor, digest, entries)
+    version = bump_corpus_version(conn)
+    complete_job(cursor, job['id'], version)
+    conn.commit()
+    cursor.close()
+    return version
+
+
+def ingest_upload(processor, job):
+    from blue_green import LIVE_TABLE
+    from ingest_jobs import chunk_key, release_publish_lock
+    from pdf_cache import file_hash
+    from process_pdfs import BATCH_SIZE
+    from upload_queue import fail_job, heartbeat, release_job
+
+    conn = processor.db_conn
+    job_id = job['id']
+    path = job['file_path']
+    print(f"\n=== Upload job {job_id}: {job['filename']} (attempt {job['attempts']}) ===")
+    start = time.time()
+    try:
+        if not os.path.exists(path) or file_hash(path) != job['file_hash']:
+            raise RuntimeError("Uploaded file is missing or was replaced by a newer upload")
+        digest = job['file_hash']
+        pages = processor.pdf_cache.get_pages(path)
+        chunks = processor.extract_text_from_pdf(path, pages)
+        if not chunks:
+            raise RuntimeError("No text could be extracted from the PDF")
+        heartbeat(conn, job_id, chunks_total=len(chunks), chunks_embedded=0)
+        conn.commit()
+
+        unique = [(chunk_key(digest, chunk), chunk) for chunk in chunks]
+        duplicates = []
+        if processor.deduplicator:
+            # Compared with everything live except the file's own earlier version, which publish replaces
+            cursor = conn.cursor()
+            unique, duplicates = processor.deduplicator.split_batch(
+                cursor, LIVE_TABLE, unique, exclude_source=os.path.basename(path)
+            )
+            cursor.close()
+            conn.commit()
+            if duplicates:
+                print(f"  {len(duplicates)}/{len(chunks)} chunks are near-duplicates of stored chunks, not embedded")
+
+        texts = [chunk['content'] for _, chunk in unique]
+        embeddings, active_embeddings = [], []
+        for offset in range(0, len(texts), BATCH_SIZE):
+            batch = texts[offset:offset + BATCH_SIZE]
+            embeddings.extend(processor.embedding_store.embed_many(batch))
+            if processor.active_store:
+                active_embeddings.extend(processor.active_store.embed_many(batch))
+            # The vectors reach embedding_cache with this commit, so a retried job does not embed them again
+            heartbeat(conn, job_id, chunks_embedded=len(duplicates) + len(embeddings))
+            conn.commit()
+
+        if processor.deduplicator:
+            cursor = conn.cursor()
+            keep, reworded = processor.deduplicator.split_embedded(
+                cursor, LIVE_TABLE, unique, embeddings, exclude_source=os.path.basename(path)
+            )
+            cursor.close()
+            conn.commit()
+            if reworded:
+                print(f"  {len(reworded)} more chunks are reworded near-duplicates of stored chunks, not stored")
+                unique = [unique[idx] for idx in keep]
+                embeddings = [embeddings[idx] for idx in keep]
+                active_embeddings = [active_embeddings[idx] for idx in keep] if active_embeddings else []
+                duplicates.extend(reworded)
+
+        if not acquire_publish_lock(conn):
+            print(f"[INFO] A rebuild is in progress, job {job_id} goes back in the queue")
+            release_job(conn, job_id)
+            return
+        try:
+            version = publish(processor, job, digest, pages, unique, duplicates, embeddings, active_embeddings)
+        finally:
+            # Kept until the publish committed or rolled back, so a rebuild cannot slip in between
+            conn.rollback()
+            release_publish_lock(conn)
+            conn.commit()
+        print(f"✓ Job {job_id}: {len(chunks)} chunks live at corpus version {version} in {time.time() - start:.1f}s")
+    except Exception as e:
+        print(f"✗ Job {job_id} failed: {str(e)}")
+        fail_job(conn, job_id, str(e))
+
+
+def worker_main(index: int):
+    limit_resources()
+    from blue_green import FAQ_TABLE, LIVE_TABLE, table_exists
+    from process_pdfs import PDFProcessor
+    from upload_queue import claim_job
+
+    processor = PDFProcessor(target_table=LIVE_TABLE)
+    processor.faq_table = FAQ_TABLE if table_exists(processor.db_conn, FAQ_TABLE) else None
+    processor.db_conn.commit()
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"[INFO] Ingest worker {index} ({name}) ready")
+    while True:
+        # Database errors end the process; the parent starts a fresh one
+        if rebuild_in_progress(processor.db_conn):
+            time.sleep(POLL_SECONDS * 5)
+            continue
+        job = claim_job(processor.db_conn, name, STALE_SECONDS, MAX_ATTEMPTS)
+        if job is None:
+            time.sleep(POLL_SECONDS)
+            continue
+        ingest_upload(processor, job)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest uploaded PDFs in the background")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", "1")))
+    args = parser.parse_args()
+
+    # Each worker loads its own model; spawn keeps torch state out of the parent
+    context = multiprocessing.get_context("spawn")
+    workers = {}
+    stopping = []
+
+    def start(index):
+        process = context.Process(target=worker_main, args=(index,), name=f"ingest-worker-{index}", daemon=True)
+        process.start()
+        workers[index] = process
+
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    print(f"Starting {args.workers} ingest workers")
+    for index in range(args.workers):
+        start(index)
+    try:
+        while not stopping:
+            time.sleep(5)
+            for index, process in list(workers.items()):
+                if not process.is_alive() and not stopping:
+                    print(f"[WARN] Ingest worker {index} exited with code {process.exitcode}, restarting")
+                    start(index)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # A job cut off here is picked up again once its heartbeat goes stale
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join(timeout=10)
+        print("✓ Ingest workers stopped")
+
+
+if __name__ == "__main__":
+    main()
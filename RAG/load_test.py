@@ -0,0 +1,383 @@
+"""Offline load test: run app.py against a fake Groq server and step up concurrency.
+
+Usage:
+    python load_test.py                                # start fake Groq + API, default steps
+    python load_test.py --concurrency 1,4,16,64 --step-seconds 60 --llm-latency-ms 1500
+    python load_test.py --url http://localhost:8000    # target an API that is already running
+    python load_test.py --compare loadtest_results/20250101-120000.json
+
+The API uses the database from .env (a local Postgres with pgvector and a
+processed corpus). Results are written to loadtest_results/ as JSON.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+import requests
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, "loadtest_results")
+
+GREETINGS = ["hi", "hello", "good morning", "thanks"]
+LAWYER_QUERIES = [
+    "I need a criminal lawyer",
+    "Find me a family law advocate",
+    "Suggest a property lawyer",
+    "Which advocate handles cyber crime cases?",
+    "I need a divorce lawyer",
+]
+LEGAL_QUERIES = [
+    "How do I report a cybercrime in India?",
+    "What are my rights if the police arrest me?",
+    "How to file a consumer complaint for a defective product?",
+    "What is the punishment for cheating under IPC?",
+    "How can I get anticipatory bail?",
+    "What is the procedure for mutual consent divorce?",
+    "Can my landlord evict me without notice?",
+    "How do I file an RTI application?",
+]
+FOLLOWUPS = ["What documents do I need?", "How long does it take?", "What are the costs?"]
+
+# (weight, scenario) - scenarios are sequences of requests sharing one session
+QUERY_MIX = [
+    (15, "greeting"),
+    (20, "lawyer"),
+    (35, "legal"),
+    (20, "legal_followup"),
+    (10, "legal_with_history"),
+]
+
+
+def scenario_requests(name):
+    """Yield (endpoint label, json body) pairs; a None session_id is filled in from the previous response"""
+    if name == "greeting":
+        yield "query:greeting", {"query": random.choice(GREETINGS)}
+    elif name == "lawyer":
+        yield "query:lawyer", {"query": random.choice(LAWYER_QUERIES), "max_results": 10}
+    elif name == "legal":
+        yield "query:legal", {"query": random.choice(LEGAL_QUERIES)}
+    elif name == "legal_followup":
+        question = random.choice(LEGAL_QUERIES)
+        yield "query:legal", {"query": question, "start_session": True}
+        # Like the chat client, a trimmed history goes along in case the session lives in another worker
+        yield "query:followup", {
+            "query": random.choice(FOLLOWUPS), "session_id": None, "start_session": True,
+            "conversation_history": [{"role": "user", "content": question}],
+        }
+    elif name == "legal_with_history":
+        question = random.choice(LEGAL_QUERIES)
+        history = [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": "1. File a complaint at the nearest police station."},
+        ]
+        yield "query:history", {"query": random.choice(FOLLOWUPS), "conversation_history": history}
+
+
+def percentile(values, pct, digits=1):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], digits)
+
+
+class StepRecorder:
+    """Latencies and errors per endpoint label for one concurrency step"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.status_codes = {}
+
+    def record(self, label, elapsed_ms, status_code):
+        with self.lock:
+            self.latencies.setdefault(label, []).append(elapsed_ms)
+            self.status_codes.setdefault(label, {})
+            self.status_codes[label][status_code] = self.status_codes[label].get(status_code, 0) + 1
+            if status_code != 200:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+    def summary(self, concurrency, seconds):
+        endpoints = {}
+        all_latencies = []
+        total_errors = 0
+        for label, values in sorted(self.latencies.items()):
+            errors = self.errors.get(label, 0)
+            total_errors += errors
+            all_latencies.extend(values)
+            endpoints[label] = {
+                "requests": len(values),
+                "errors": errors,
+                "status_codes": {str(code): count for code, count in self.status_codes[label].items()},
+                "throughput_rps": round(len(values) / seconds, 2),
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "p99_ms": percentile(values, 99),
+            }
+        total = len(all_latencies)
+        return {
+            "concurrency": concurrency,
+            "seconds": seconds,
+            "requests": total,
+            "errors": total_errors,
+            "error_rate": round(total_errors / total, 4) if total else 0.0,
+            "throughput_rps": round(total / seconds, 2),
+            "p50_ms": percentile(all_latencies, 50),
+            "p95_ms": percentile(all_latencies, 95),
+            "p99_ms": percentile(all_latencies, 99),
+            "endpoints": endpoints,
+        }
+
+
+def run_user(url, deadline, recorder, health_every, timeout):
+    """One simulated user: picks scenarios from QUERY_MIX back to back until the deadline"""
+    http = requests.Session()
+    weights = [weight for weight, _ in QUERY_MIX]
+    names = [name for _, name in QUERY_MIX]
+    iteration = 0
+    while time.time() < deadline:
+        iteration += 1
+        if health_every and iteration % health_every == 0:
+            start = time.perf_counter()
+            try:
+                status = http.get(f"{url}/health", timeout=timeout).status_code
+            except requests.RequestException:
+                status = 0
+            recorder.record("health", (time.perf_counter() - start) * 1000, status)
+
+        session_id = None
+        for label, body in scenario_requests(random.choices(names, weights)[0]):
+            if "session_id" in body:
+                body["session_id"] = session_id
+            start = time.perf_counter()
+            try:
+                response = http.post(f"{url}/query", json=body, timeout=timeout)
+                status = response.status_code
+                if status == 200:
+                    session_id = response.json().get("session_id")
+            except requests.RequestException:
+                status = 0
+            recorder.record(label, (time.perf_counter() - start) * 1000, status)
+            if status != 200 or time.time() >= deadline:
+                break
+
+
+def run_step(url, concurrency, seconds, warmup, health_every, timeout):
+    # Warm-up traffic at the new concurrency is not measured
+    if warmup:
+        warm_threads = [
+            threading.Thread(target=run_user, args=(url, time.time() + warmup, StepRecorder(), 0, timeout))
+            for _ in range(concurrency)
+        ]
+        for thread in warm_threads:
+            thread.start()
+        for thread in warm_threads:
+            thread.join()
+
+    recorder = StepRecorder()
+    deadline = time.time() + seconds
+    threads = [
+        threading.Thread(target=run_user, args=(url, deadline, recorder, health_every, timeout))
+        for _ in range(concurrency)
+    ]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Requests in flight at the deadline finish late; measure the real wall time
+    return recorder.summary(concurrency, time.time() - start)
+
+
+def find_saturation(steps, p99_slo_ms, max_error_rate, min_gain):
+    """First step where throughput stops growing, p99 breaks the SLO or errors climb"""
+    best_throughput = 0.0
+    for index, step in enumerate(steps):
+        reasons = []
+        if step["p99_ms"] is not None and step["p99_ms"] > p99_slo_ms:
+            reasons.append(f"p99 {step['p99_ms']:.0f}ms > {p99_slo_ms:.0f}ms")
+        if step["error_rate"] > max_error_rate:
+            reasons.append(f"error rate {step['error_rate']:.1%}")
+        if index > 0 and step["throughput_rps"] < best_throughput * (1 + min_gain):
+            reasons.append(f"throughput {step['throughput_rps']} rps did not grow over {best_throughput} rps")
+        if reasons:
+            sustainable = steps[index - 1]["concurrency"] if index > 0 else None
+            return {"concurrency": step["concurrency"], "max_sustainable_concurrency": sustainable, "reasons": reasons}
+        best_throughput = max(best_throughput, step["throughput_rps"])
+    return None
+
+
+def wait_for_health(url, timeout):
+    """The API loads the embedding model on startup, so this can take a while"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=5).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+
+def start_services(args):
+    """Start fake_groq.py and app.py with uvicorn; returns the processes"""
+    fake_env = dict(
+        os.environ,
+        FAKE_GROQ_LATENCY_MS=str(args.llm_latency_ms),
+        FAKE_GROQ_JITTER_MS=str(args.llm_jitter_ms),
+        FAKE_GROQ_ERROR_RATE=str(args.llm_error_rate),
+    )
+    fake_groq = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fake_groq:app", "--port", str(args.fake_groq_port), "--log-level", "warning"],
+        cwd=BASE_DIR, env=fake_env
+    )
+
+    app_env = dict(
+        os.environ,
+        GROQ_BASE_URL=f"http://127.0.0.1:{args.fake_groq_port}",
+        GROQ_API_KEY="load-test",
+        # generate_answer only calls the LLM when a Gemini key is configured
+        GEMINI_API_KEY=os.getenv("GEMINI_API_KEY") or "load-test",
+    )
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.api_port), "--log-level", "warning",
+         "--workers", str(args.workers)],
+        cwd=BASE_DIR, env=app_env, stdout=subprocess.DEVNULL
+    )
+    return [fake_groq, api]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_step(step):
+    print(f"  c={step['concurrency']:<4} {step['throughput_rps']:>7.2f} rps  "
+          f"p50={step['p50_ms']}ms p95={step['p95_ms']}ms p99={step['p99_ms']}ms  "
+          f"errors={step['errors']}/{step['requests']}")
+    for label, endpoint in step["endpoints"].items():
+        print(f"      {label:<16} n={endpoint['requests']:<6} p50={endpoint['p50_ms']}ms "
+              f"p95={endpoint['p95_ms']}ms p99={endpoint['p99_ms']}ms errors={endpoint['errors']}")
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    previous_steps = {step["concurrency"]: step for step in previous["steps"]}
+    print(f"\n=== Compared with {os.path.basename(previous_path)} (commit {previous['config'].get('commit')}) ===")
+    for step in current["steps"]:
+        old = previous_steps.get(step["concurrency"])
+        if not old:
+            continue
+        print(f"  c={step['concurrency']:<4} throughput {old['throughput_rps']:>7.2f} -> {step['throughput_rps']:>7.2f} rps  "
+              f"p99 {old['p99_ms']} -> {step['p99_ms']}ms")
+    old_sat = (previous.get("saturation") or {}).get("concurrency")
+    new_sat = (current.get("saturation") or {}).get("concurrency")
+    print(f"  saturation concurrency {old_sat} -> {new_sat}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Step-load the RAG API with a realistic query mix")
+    parser.add_argument("--url", help="Target an already running API instead of starting one")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="Comma-separated concurrency steps")
+    parser.add_argument("--step-seconds", type=float, default=30)
+    parser.add_argument("--warmup-seconds", type=float, default=5)
+    parser.add_argument("--health-every", type=int, default=5, help="Probe /health every N scenarios per user (0 = never)")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--api-port", type=int, default=8765)
+    parser.add_argument("--fake-groq-port", type=int, default=8766)
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="uvicorn worker processes for the API. Sessions live in one process, so with more than 1 "
+             "a follow-up often lands on another worker and is answered from its sent history, "
+             "without reusing the first turn's documents"
+    )
+    parser.add_argument("--p99-slo-ms", type=float, default=10000)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--min-gain", type=float, default=0.1, help="Throughput growth below this fraction counts as saturated")
+    parser.add_argument("--label", default="", help="Free-form note stored with the results")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    processes = []
+    url = args.url
+    try:
+        if not url:
+            processes = start_services(args)
+            url = f"http://127.0.0.1:{args.api_port}"
+        print(f"Waiting for {url}/health ...")
+        if not wait_for_health(url, 300):
+            print("✗ API did not become healthy")
+            sys.exit(1)
+        print("✓ API is up")
+
+        steps = []
+        for concurrency in levels:
+            print(f"\n=== Concurrency {concurrency} for {args.step_seconds:.0f}s ===")
+            step = run_step(url, concurrency, args.step_seconds, args.warmup_seconds, args.health_every, args.timeout)
+            print_step(step)
+            steps.append(step)
+
+        saturation = find_saturation(steps, args.p99_slo_ms, args.max_error_rate, args.min_gain)
+        try:
+            server_stats = requests.get(f"{url}/stats", timeout=10).json()
+        except (requests.RequestException, ValueError):
+            server_stats = None
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    if saturation:
+        print(f"\n✓ Saturated at concurrency {saturation['concurrency']} "
+              f"(max sustainable: {saturation['max_sustainable_concurrency']}): {'; '.join(saturation['reasons'])}")
+    else:
+        print("\n✓ No saturation within the tested concurrency steps")
+
+    results = {
+        "config": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "label": args.label,
+            "url": args.url or "local",
+            "workers": args.workers,
+            "step_seconds": args.step_seconds,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "llm_error_rate": args.llm_error_rate,
+            "query_mix": dict((name, weight) for weight, name in QUERY_MIX),
+            "seed": args.seed,
+        },
+        "steps": steps,
+        "saturation": saturation,
+        "server_stats": server_stats,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✓ Results saved to {path}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
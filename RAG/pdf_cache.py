@@ -0,0 +1,54 @@
+import os
+import gzip
+import json
+import hashlib
+from typing import List, Optional
+import pypdf
+from pypdf import PdfReader
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".cache", "pdf_text")
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PDFTextCache:
+    """Extracted page text on disk, keyed by PDF content hash and pypdf version"""
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir or os.getenv("PDF_CACHE_DIR", DEFAULT_CACHE_DIR)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def cache_path(self, digest: str) -> str:
+        # A pypdf upgrade can change extraction output, so it is part of the key
+        return os.path.join(self.cache_dir, f"{digest}-pypdf{pypdf.__version__}.json.gz")
+
+    def get_pages(self, pdf_path: str) -> List[str]:
+        """Text of every page (empty string for blank pages), parsing the PDF only on a cache miss"""
+        path = self.cache_path(file_hash(pdf_path))
+        if os.path.exists(path):
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    pages = json.load(f)["pages"]
+                self.hits += 1
+                return pages
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring unreadable PDF cache entry {path}: {e}")
+
+        self.misses += 1
+        reader = PdfReader(pdf_path)
+        pages = [page.extract_text() or "" for page in reader.pages]
+
+        # Write to a temp file first so a crash never leaves a truncated entry behind
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"source": os.path.basename(pdf_path), "pages": pages}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return pages
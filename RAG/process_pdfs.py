@@ -1,173 +1,492 @@
+"""Chunk, embed and load the knowledge-base PDFs into a staging table, then swap it live.
+
+Usage:
+    python process_pdfs.py [run]            # new ingestion job (rebuilds documents_staging)
+    python process_pdfs.py resume           # continue the last interrupted job where it stopped
+    python process_pdfs.py retry            # re-attempt its dead-lettered chunks, then continue
+    python process_pdfs.py status           # progress and dead letters of the last job
+
+run, resume and retry take --allow-failures to swap in a corpus that still has dead letters.
+"""
 import os
 import json
+import argparse
+from itertools import groupby
 from dotenv import load_dotenv
-from pypdf import PdfReader
 import psycopg2
-from psycopg2.extras import execute_values
-import time
-from sentence_transformers import SentenceTransformer
+from psycopg2 import sql
+from corpora import CORPUS_FAQ, classify_source
+from pdf_cache import PDFTextCache, file_hash
+from chunker import chunk_pages, make_token_counter
+from embedding_store import EmbeddingStore, get_active_model, get_documents_model
+from blue_green import (
+    FAQ_STAGING_TABLE, FAQ_TABLE, LIVE_TABLE, STAGING_TABLE, build_indexes, create_staging_table,
+    swap_in_staging, table_exists, validate_staging,
+)
+from faq_index import entry_key, extract_faq_entries
+from dedup import attach_duplicate, deduplicator_from_env, lsh_bands, remove_source
+from upload_queue import KNOWLEDGE_BASE_DIRS, completed_upload_paths
+from ingest_jobs import (
+    PHASE_COMPLETED, PHASE_INDEXING, PHASE_LOADING, PHASE_SWAPPING,
+    abandon_unfinished_jobs, add_dead_letter, add_unreadable_file, checkpoint_file, chunk_key, clear_dead_letter,
+    clear_file_dead_letters, create_job, dead_letters, job_summary, latest_unfinished_job,
+    pending_files, record_error, set_phase, try_rebuild_lock,
+)
 
 load_dotenv()
 
-# Load local embedding model (same as app.py)
-print("Loading embedding model...")
-embedding_model_local = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
-print("✓ Embedding model loaded!")
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHUNK_OVERLAP_TOKENS = 32
+# Chunks per transaction; a crash loses at most one batch of work
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "32"))
+# How long a run waits for ingest workers to finish publishing uploads
+REBUILD_LOCK_WAIT_SECONDS = 120
+
+
+def connect_db():
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD")
+    )
+
+
+def knowledge_base_files(conn):
+    """PDF paths relative to this directory, so a job can be resumed from any working directory"""
+    files = []
+    for kb_dir in KNOWLEDGE_BASE_DIRS:
+        path = os.path.join(BASE_DIR, kb_dir)
+        if os.path.exists(path):
+            files.extend(os.path.join(kb_dir, f) for f in sorted(os.listdir(path)) if f.endswith('.pdf'))
+    # A rebuild also picks up PDFs uploaded through the API, but only those that were published
+    files.extend(os.path.relpath(path, BASE_DIR) for path in completed_upload_paths(conn))
+    conn.commit()
+    return files
+
 
 class PDFProcessor:
-    def __init__(self):
-        self.embedding_model = embedding_model_local
-        self.db_conn = psycopg2.connect(
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT"),
-            database=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD")
-        )
-        
-    def extract_text_from_pdf(self, pdf_path):
-        """Extract text from PDF file"""
+    def __init__(self, target_table=LIVE_TABLE):
+        # Table new chunks are written to (the staging table during a blue/green rebuild)
+        self.target_table = target_table
+        # FAQ pairs go to the FAQ table of the same generation (set once the tables exist)
+        self.faq_table = None
+        self.db_conn = connect_db()
+        # Imported here so the job bookkeeping loads without the model stack
+        from sentence_transformers import SentenceTransformer
+
+        # Load local embedding model (same one app.py searches documents.embedding with)
+        self.model_name = get_documents_model(self.db_conn)
+        print(f"Loading embedding model {self.model_name}...")
+        self.embedding_model = SentenceTransformer(self.model_name)
+        print("✓ Embedding model loaded!")
+        self.embedding_store = EmbeddingStore(self.db_conn, self.model_name, self.embedding_model)
+        self.pdf_cache = PDFTextCache()
+
+        # Chunks are sized so the model embeds them without truncation ([CLS]/[SEP] excluded)
+        self.count_tokens = make_token_counter(self.embedding_model.tokenizer)
+        self.max_chunk_tokens = self.embedding_model.max_seq_length - 2
+
+        # While a migrated model is active, new chunks also need vectors for it
+        self.active_store = None
+        active_model = get_active_model(self.db_conn)
+        if active_model != self.model_name:
+            print(f"Loading active query model {active_model}...")
+            active_encoder = SentenceTransformer(active_model)
+            self.active_store = EmbeddingStore(self.db_conn, active_model, active_encoder)
+            self.max_chunk_tokens = min(self.max_chunk_tokens, active_encoder.max_seq_length - 2)
+
+        # Near-duplicates of stored chunks are attached to them instead of embedded (None when INGEST_DEDUP=0)
+        self.deduplicator = deduplicator_from_env()
+
+    def extract_text_from_pdf(self, pdf_path, pages=None):
+        """Extract text from PDF file and chunk it to the embedding model's token limit"""
         print(f"Reading PDF: {pdf_path}")
-        reader = PdfReader(pdf_path)
-        text_chunks = []
-        
-        for page_num, page in enumerate(reader.pages):
-            text = page.extract_text()
-            if text.strip():
-                # Split into smaller chunks (approximately 1000 characters each)
-                chunks = self.split_text(text, chunk_size=1000, overlap=200)
-                for chunk_idx, chunk in enumerate(chunks):
-                    text_chunks.append({
-                        'content': chunk,
-                        'metadata': {
-                            'source': os.path.basename(pdf_path),
-                            'page': page_num + 1,
-                            'chunk': chunk_idx
-                        }
-                    })
-        
-        print(f"✓ Extracted {len(text_chunks)} chunks from {len(reader.pages)} pages")
+        if pages is None:
+            pages = self.pdf_cache.get_pages(pdf_path)
+        text_chunks = list(chunk_pages(
+            pages,
+            os.path.basename(pdf_path),
+            self.count_tokens,
+            max_tokens=self.max_chunk_tokens,
+            overlap_tokens=CHUNK_OVERLAP_TOKENS
+        ))
+
+        print(f"✓ Extracted {len(text_chunks)} chunks from {len(pages)} pages")
         return text_chunks
-    
-    def split_text(self, text, chunk_size=1000, overlap=200):
-        """Split text into overlapping chunks"""
-        chunks = []
-        start = 0
-        text_length = len(text)
-        
-        while start < text_length:
-            end = start + chunk_size
-            chunk = text[start:end]
-            
-            # Try to break at sentence boundary
-            if end < text_length:
-                last_period = chunk.rfind('.')
-                last_newline = chunk.rfind('\n')
-                break_point = max(last_period, last_newline)
-                
-                if break_point > chunk_size * 0.5:  # If we found a reasonable break point
-                    chunk = text[start:start + break_point + 1]
-                    end = start + break_point + 1
-            
-            chunks.append(chunk.strip())
-            start = end - overlap if end < text_length else text_length
-        
-        return chunks
-    
+
     def generate_embedding(self, text):
-        """Generate embedding using local sentence-transformers model"""
+        """Generate embedding using local sentence-transformers model (cached by content hash)"""
+        return self.embedding_store.embed(text)
+
+    def stored_keys(self, cursor, keys):
+        """Chunk keys already in the target table (stored by an interrupted attempt)"""
+        cursor.execute(
+            sql.SQL("SELECT chunk_key FROM {} WHERE chunk_key = ANY(%s)").format(sql.Identifier(self.target_table)),
+            (keys,)
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+    def insert_chunk(self, cursor, key, chunk, embedding, active_embedding):
+        source = chunk['metadata']['source']
+        cursor.execute(
+            sql.SQL("""
+            INSERT INTO {} (content, metadata, embedding, corpus, source, chunk_key, lsh_bands)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (chunk_key) DO NOTHING
+            RETURNING id
+            """).format(sql.Identifier(self.target_table)),
+            (
+                chunk['content'],
+                json.dumps(chunk['metadata']),
+                embedding,
+                classify_source(source),
+                source,
+                key,
+                chunk.get('lsh_bands') or lsh_bands(chunk['content'])
+            )
+        )
+        row = cursor.fetchone()
+        if row and active_embedding is not None:
+            cursor.execute(
+                """
+                INSERT INTO document_embeddings (model_name, document_id, embedding)
+                VALUES (%s, %s, %s::vector)
+                ON CONFLICT (model_name, document_id) DO NOTHING
+                """,
+                (self.active_store.model_name, row[0], active_embedding)
+            )
+
+    def store_batch(self, cursor, job_id, file_path, batch):
+        """Embed and insert (chunk_key, chunk) pairs; failures go to the dead letters.
+
+        Near-duplicates of stored chunks are attached to them instead. Returns
+        (stored keys, how many of them were folded into a near-duplicate).
+        """
+        duplicates = []
+        if self.deduplicator:
+            batch, duplicates = self.deduplicator.split_batch(cursor, self.target_table, batch)
+        texts = [chunk['content'] for _, chunk in batch]
+        cursor.execute("SAVEPOINT ingest_batch")
         try:
-            embedding = self.embedding_model.encode(text)
-            return embedding.tolist()
+            embeddings = self.embedding_store.embed_many(texts)
+            active_embeddings = self.active_store.embed_many(texts) if self.active_store else [None] * len(texts)
+            cursor.execute("RELEASE SAVEPOINT ingest_batch")
         except Exception as e:
-            print(f"Error generating embedding: {str(e)}")
-            return None
-    
-    def store_chunks_in_db(self, chunks):
-        """Store text chunks with embeddings in database"""
-        cursor = self.db_conn.cursor()
-        
-        print(f"Generating embeddings and storing {len(chunks)} chunks...")
-        
-        for idx, chunk in enumerate(chunks):
+            cursor.execute("ROLLBACK TO SAVEPOINT ingest_batch")
+            print(f"[WARN] Batch embedding failed ({e}), embedding chunks one at a time")
+            embeddings = active_embeddings = None
+
+        if self.deduplicator and embeddings is not None:
+            # Reworded near-duplicates only show up once the vectors exist
+            cursor.execute("SAVEPOINT ingest_dedup")
+            try:
+                keep, reworded = self.deduplicator.split_embedded(cursor, self.target_table, batch, embeddings)
+                cursor.execute("RELEASE SAVEPOINT ingest_dedup")
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT ingest_dedup")
+                print(f"[WARN] Embedding near-duplicate check failed ({e}), storing the batch as is")
+                keep, reworded = list(range(len(batch))), []
+            batch = [batch[idx] for idx in keep]
+            embeddings = [embeddings[idx] for idx in keep]
+            active_embeddings = [active_embeddings[idx] for idx in keep]
+            duplicates.extend(reworded)
+
+        stored = []
+        for idx, (key, chunk) in enumerate(batch):
+            cursor.execute("SAVEPOINT ingest_chunk")
             try:
-                # Generate embedding
-                embedding = self.generate_embedding(chunk['content'])
-                
-                if embedding:
-                    # Insert into database
-                    cursor.execute(
-                        """
-                        INSERT INTO documents (content, metadata, embedding)
-                        VALUES (%s, %s, %s)
-                        """,
-                        (
-                            chunk['content'],
-                            json.dumps(chunk['metadata']),
-                            embedding
-                        )
-                    )
-                    
-                    if (idx + 1) % 10 == 0:
-                        print(f"✓ Processed {idx + 1}/{len(chunks)} chunks")
-                        self.db_conn.commit()
-                
+                if embeddings is None:
+                    embedding = self.generate_embedding(chunk['content'])
+                    active_embedding = self.active_store.embed(chunk['content']) if self.active_store else None
+                else:
+                    embedding, active_embedding = embeddings[idx], active_embeddings[idx]
+                self.insert_chunk(cursor, key, chunk, embedding, active_embedding)
+                cursor.execute("RELEASE SAVEPOINT ingest_chunk")
+                stored.append(key)
             except Exception as e:
-                print(f"Error processing chunk {idx}: {str(e)}")
-                continue
-        
-        self.db_conn.commit()
+                cursor.execute("ROLLBACK TO SAVEPOINT ingest_chunk")
+                print(f"✗ Chunk {chunk['metadata']['chunk']} of {chunk['metadata']['source']}: {str(e)}")
+                add_dead_letter(cursor, job_id, key, file_path, chunk, str(e))
+
+        # After the inserts: a duplicate may point at a chunk of this same batch
+        folded = 0
+        for key, chunk, target_key, _similarity in duplicates:
+            if attach_duplicate(cursor, self.target_table, target_key, key, chunk):
+                stored.append(key)
+                folded += 1
+            else:
+                add_dead_letter(cursor, job_id, key, file_path, chunk, f"near-duplicate of failed chunk {target_key}")
+        return stored, folded
+
+    def vector_bytes(self):
+        """Bytes of the vectors stored per chunk, for the deduplication report"""
+        stores = [self.embedding_store] + ([self.active_store] if self.active_store else [])
+        return sum(store.encoder.get_sentence_embedding_dimension() * 4 for store in stores), len(stores)
+
+    def store_faq_entries(self, cursor, digest, entries):
+        """FAQ pairs with question vectors from the model queries are embedded with (idempotent)"""
+        store = self.active_store or self.embedding_store
+        vectors = store.embed_many([entry['question'] for entry in entries])
+        for entry, vector in zip(entries, vectors):
+            cursor.execute(
+                sql.SQL("""
+                INSERT INTO {} (entry_key, question, answer, source, page, model_name, embedding)
+                VALUES (%s, %s, %s, %s, %s, %s, %s::vector)
+                ON CONFLICT (entry_key) DO NOTHING
+                """).format(sql.Identifier(self.faq_table)),
+                (entry_key(digest, entry), entry['question'], entry['answer'], entry['source'],
+                 entry['page'], store.model_name, vector)
+            )
+        print(f"✓ Indexed {len(entries)} FAQ questions")
+
+    def process_file(self, job_id, file_path, recorded_hash=None):
+        """Store one PDF in checkpointed batches, skipping chunks an earlier attempt already stored"""
+        pdf_path = os.path.join(BASE_DIR, file_path)
+        source = os.path.basename(pdf_path)
+        try:
+            digest = file_hash(pdf_path)
+            pages = self.pdf_cache.get_pages(pdf_path)
+            chunks = self.extract_text_from_pdf(pdf_path, pages)
+        except Exception as e:
+            # A missing or corrupt PDF must not stop every later run; it waits in the dead letters instead
+            print(f"✗ Could not read {file_path}: {str(e)}")
+            self.db_conn.rollback()
+            cursor = self.db_conn.cursor()
+            add_unreadable_file(cursor, job_id, file_path, str(e))
+            checkpoint_file(cursor, job_id, file_path, recorded_hash, 0, 0, 1, done=True)
+            self.db_conn.commit()
+            cursor.close()
+            return
+        keys = [chunk_key(digest, chunk) for chunk in chunks]
+        faq_entries = []
+        if self.faq_table and classify_source(source) == CORPUS_FAQ:
+            faq_entries = extract_faq_entries(pages, source)
+        cursor = self.db_conn.cursor()
+
+        if recorded_hash and recorded_hash != digest:
+            # The file was edited after the interrupted attempt; its earlier chunks are stale
+            print(f"[WARN] {file_path} changed since it was started, replacing its stored chunks")
+            remove_source(cursor, self.target_table, source, keys)
+            if self.faq_table:
+                cursor.execute(
+                    sql.SQL("DELETE FROM {} WHERE source = %s AND NOT (entry_key = ANY(%s))").format(
+                        sql.Identifier(self.faq_table)
+                    ),
+                    (source, [entry_key(digest, entry) for entry in faq_entries])
+                )
+        if faq_entries:
+            # Commits with the first checkpoint below
+            self.store_faq_entries(cursor, digest, faq_entries)
+        # Every chunk not stored yet is attempted again below
+        clear_file_dead_letters(cursor, job_id, file_path)
+
+        already = self.stored_keys(cursor, keys)
+        pending = [(key, chunk) for key, chunk in zip(keys, chunks) if key not in already]
+        if already:
+            print(f"  Resuming: {len(already)}/{len(chunks)} chunks already stored")
+
+        stored, failed, duplicates = len(already), 0, 0
+        for start in range(0, len(pending), BATCH_SIZE):
+            batch = pending[start:start + BATCH_SIZE]
+            batch_stored, batch_folded = self.store_batch(cursor, job_id, file_path, batch)
+            stored += len(batch_stored)
+            failed += len(batch) - len(batch_stored)
+            duplicates += batch_folded
+            last = start + BATCH_SIZE >= len(pending)
+            checkpoint_file(cursor, job_id, file_path, digest, len(chunks), stored, failed, done=last,
+                            duplicates=duplicates)
+            self.db_conn.commit()
+            print(f"✓ Processed {stored}/{len(chunks)} chunks ({duplicates} folded into near-duplicates)")
+        if not pending:
+            checkpoint_file(cursor, job_id, file_path, digest, len(chunks), stored, failed, done=True,
+                            duplicates=duplicates)
+            self.db_conn.commit()
         cursor.close()
-        print(f"✓ Successfully stored all chunks in database!")
-    
-    def process_knowledge_base(self, knowledge_base_dir):
-        """Process all PDFs in knowledge base directory"""
-        pdf_files = [f for f in os.listdir(knowledge_base_dir) if f.endswith('.pdf')]
-        
-        print(f"\nFound {len(pdf_files)} PDF files to process:")
-        for pdf_file in pdf_files:
-            print(f"  - {pdf_file}")
-        
-        all_chunks = []
-        
-        for pdf_file in pdf_files:
-            pdf_path = os.path.join(knowledge_base_dir, pdf_file)
-            chunks = self.extract_text_from_pdf(pdf_path)
-            all_chunks.extend(chunks)
-        
-        print(f"\nTotal chunks to process: {len(all_chunks)}")
-        self.store_chunks_in_db(all_chunks)
-    
+        if failed:
+            print(f"✗ {failed} chunks of {file_path} failed and were dead-lettered")
+
+    def retry_dead_letters(self, job_id):
+        letters = dead_letters(self.db_conn, job_id)
+        print(f"Retrying {len(letters)} dead-lettered chunks...")
+        # Files that could not be read are processed again from the start
+        for letter in [letter for letter in letters if letter['metadata'].get('unreadable')]:
+            self.process_file(job_id, letter['file_path'])
+        letters = [letter for letter in letters if not letter['metadata'].get('unreadable')]
+        cursor = self.db_conn.cursor()
+        recovered = 0
+        for file_path, group in groupby(letters, key=lambda letter: letter['file_path']):
+            group = list(group)
+            for start in range(0, len(group), BATCH_SIZE):
+                batch = group[start:start + BATCH_SIZE]
+                pairs = [(letter['chunk_key'], {"content": letter['content'], "metadata": letter['metadata']})
+                         for letter in batch]
+                stored, _folded = self.store_batch(cursor, job_id, file_path, pairs)
+                for key in stored:
+                    clear_dead_letter(cursor, job_id, key, file_path)
+                self.db_conn.commit()
+                recovered += len(stored)
+        cursor.close()
+        print(f"✓ Recovered {recovered}/{len(letters)} chunks")
+
+    def run_job(self, job, allow_failures=False):
+        """Carry a job forward from its recorded phase: load, index and validate, swap"""
+        job_id = job['id']
+        if job['phase'] == PHASE_LOADING:
+            if not table_exists(self.db_conn, self.target_table):
+                raise RuntimeError(f"{self.target_table} no longer exists; start a new run")
+            faq_table = FAQ_STAGING_TABLE if self.target_table == STAGING_TABLE else FAQ_TABLE
+            self.faq_table = faq_table if table_exists(self.db_conn, faq_table) else None
+            files = pending_files(self.db_conn, job_id)
+            print(f"\n=== Job {job_id}: {len(files)} files to process ===")
+            for entry in files:
+                self.process_file(job_id, entry['file_path'], entry['file_hash'])
+            print(f"PDF text cache: {self.pdf_cache.hits} hits, {self.pdf_cache.misses} parsed")
+            print(f"✓ Embedding cache: {self.embedding_store.hits} reused, {self.embedding_store.misses} newly embedded")
+            if self.deduplicator:
+                print(f"✓ {self.deduplicator.report(*self.vector_bytes())}")
+
+            summary = job_summary(self.db_conn, job_id)
+            if summary['dead_letters'] and not allow_failures:
+                print(f"\n✗ {summary['dead_letters']} chunks failed; the live {LIVE_TABLE} table was not changed")
+                print("  Retry them with `python process_pdfs.py retry`, or swap anyway with --allow-failures")
+                return False
+            set_phase(self.db_conn, job_id, PHASE_INDEXING)
+            job['phase'] = PHASE_INDEXING
+
+        if job['phase'] == PHASE_INDEXING:
+            print("\n=== Building indexes and validating staging table ===")
+            build_indexes(self.db_conn)
+            validate_staging(self.db_conn)
+            set_phase(self.db_conn, job_id, PHASE_SWAPPING)
+            job['phase'] = PHASE_SWAPPING
+
+        if job['phase'] == PHASE_SWAPPING:
+            if table_exists(self.db_conn, STAGING_TABLE):
+                swap_in_staging(self.db_conn)
+            else:
+                # The swap committed before the crash; only the job record is behind
+                print(f"✓ {STAGING_TABLE} was already swapped in")
+            set_phase(self.db_conn, job_id, PHASE_COMPLETED)
+        return True
+
     def close(self):
         """Close database connection"""
         self.db_conn.close()
 
-def main():
-    processor = PDFProcessor()
-    
+
+def run(args):
+    # Build into a staging table so /query keeps reading the complete live corpus
+    processor = PDFProcessor(target_table=STAGING_TABLE)
+    job_id = None
     try:
-        # Process both knowledge base directories
-        base_dir = os.path.dirname(__file__)
-        
-        # Old knowledge base
-        old_kb_dir = os.path.join(base_dir, 'knowledge-base')
-        if os.path.exists(old_kb_dir):
-            print("\n=== Processing 'knowledge-base' folder ===")
-            processor.process_knowledge_base(old_kb_dir)
-        
-        # New knowledge base
-        new_kb_dir = os.path.join(base_dir, 'New Knowledge Base')
-        if os.path.exists(new_kb_dir):
-            print("\n=== Processing 'New Knowledge Base' folder ===")
-            processor.process_knowledge_base(new_kb_dir)
-        
-        print("\n✓ All knowledge bases processed successfully!")
-        
+        # Held until the processor's connection closes; tells ingest workers this run is alive
+        if not try_rebuild_lock(processor.db_conn, REBUILD_LOCK_WAIT_SECONDS):
+            raise RuntimeError("Another process_pdfs.py run or resume is in progress")
+        abandon_unfinished_jobs(processor.db_conn)
+        create_staging_table(processor.db_conn)
+        files = knowledge_base_files(processor.db_conn)
+        print(f"\nFound {len(files)} PDF files to process:")
+        for file_path in files:
+            print(f"  - {file_path}")
+        job_id = create_job(processor.db_conn, STAGING_TABLE, files)
+        if processor.run_job({"id": job_id, "phase": PHASE_LOADING}, args.allow_failures):
+            print("\n✓ All knowledge bases processed successfully!")
     except Exception as e:
-        print(f"\n✗ Error: {str(e)}")
+        fail(processor, job_id, e)
         raise
     finally:
         processor.close()
 
+
+def resume(args, retry=False):
+    conn = connect_db()
+    job = latest_unfinished_job(conn)
+    conn.close()
+    if not job:
+        print("No unfinished ingestion job to resume")
+        return
+    print(f"Resuming job {job['id']} in phase '{job['phase']}'" + (f" (last error: {job['error']})" if job['error'] else ""))
+    processor = PDFProcessor(target_table=job['target_table'])
+    try:
+        if not try_rebuild_lock(processor.db_conn, REBUILD_LOCK_WAIT_SECONDS):
+            raise RuntimeError("Another process_pdfs.py run or resume is in progress")
+        # An ingest worker may have given up on the job while the model loaded
+        job = latest_unfinished_job(processor.db_conn)
+        processor.db_conn.commit()
+        if not job:
+            print("The unfinished job was abandoned in the meantime; start a new run")
+            return
+        if retry:
+            if job['phase'] != PHASE_LOADING:
+                print(f"Job {job['id']} is past loading; dead letters can no longer be retried")
+            else:
+                processor.retry_dead_letters(job['id'])
+        if processor.run_job(job, args.allow_failures):
+            print("\n✓ All knowledge bases processed successfully!")
+    except Exception as e:
+        fail(processor, job['id'], e)
+        raise
+    finally:
+        processor.close()
+
+
+def retry(args):
+    resume(args, retry=True)
+
+
+def fail(processor, job_id, error):
+    print(f"\n✗ Error: {str(error)}")
+    print(f"  The live {LIVE_TABLE} table was not changed")
+    if job_id is not None:
+        try:
+            record_error(processor.db_conn, job_id, str(error))
+            print("  Continue from the last checkpoint with `python process_pdfs.py resume`")
+        except psycopg2.Error:
+            pass
+
+
+def status(args):
+    conn = connect_db()
+    try:
+        job = latest_unfinished_job(conn)
+        if not job:
+            print("No unfinished ingestion job")
+            return
+        summary = job_summary(conn, job['id'])
+        print(f"Job {job['id']} -> {job['target_table']}, phase '{job['phase']}'")
+        print(f"  files:  {summary['files_done']}/{summary['files']} done")
+        print(f"  chunks: {summary['stored']}/{summary['chunks']} stored (of files started so far),"
+              f" {summary['duplicates']} of them folded into near-duplicates")
+        print(f"  dead letters: {summary['dead_letters']}")
+        if job['error']:
+            print(f"  last error: {job['error']}")
+        for letter in dead_letters(conn, job['id'])[:20]:
+            where = "unreadable file" if letter['metadata'].get('unreadable') else f"chunk {letter['metadata'].get('chunk')}"
+            print(f"  ✗ {letter['file_path']} {where} ({letter['attempts']} attempts): {letter['error']}")
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest the knowledge-base PDFs")
+    subparsers = parser.add_subparsers(dest="command")
+    for name, func, help_text in [
+        ("run", run, "Start a new ingestion job"),
+        ("resume", resume, "Continue the last interrupted job"),
+        ("retry", retry, "Retry dead-lettered chunks, then continue the job"),
+    ]:
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--allow-failures", action="store_true", help="Swap in even if chunks are dead-lettered")
+        sub.set_defaults(func=func)
+    status_parser = subparsers.add_parser("status", help="Progress of the last unfinished job")
+    status_parser.set_defaults(func=status)
+    args = parser.parse_args()
+    if not args.command:
+        args = parser.parse_args(["run"])
+    args.func(args)
+
 if __name__ == "__main__":
     main()
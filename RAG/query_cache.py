@@ -0,0 +1,84 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+
+def normalize_query(text: str) -> str:
+    """Cache key form of a query: lower case, single spaces, no trailing punctuation"""
+    return re.sub(r"\s+", " ", text.lower()).strip().rstrip("?!. ")
+
+
+class LRUCache:
+    """Thread-safe bounded LRU map with hit/miss counters"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def usage(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class VersionedCache(LRUCache):
+    """LRU entries tagged with the corpus version they were read at; any other version is a miss.
+
+    A lookup racing a re-ingest can store an entry after the caches were
+    cleared; the tag keeps it from being served to the new version.
+    """
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value):
+        super().put(key, (version, value))
+
+
+def cache_from_env(name: str, default_size: int, versioned: bool = False) -> LRUCache:
+    """LRUCache (VersionedCache if versioned) sized by <NAME>_CACHE_SIZE (0 disables it)"""
+    cache_class = VersionedCache if versioned else LRUCache
+    return cache_class(int(os.getenv(f"{name.upper()}_CACHE_SIZE", str(default_size))))
@@ -0,0 +1,209 @@
+"""Append-only binary log of served queries.
+
+Each day gets one file, logs/queries/queries-YYYYMMDD.qlog. The file starts
+with MAGIC and then holds a stream of records:
+
+    T  text record   hash(8) len(u16) utf-8 text       written once per query text per file
+    Q  query record  timestamp(f64) hash(8) type(u8) cache flags(u8) corpus version(u32)
+                     n_docs(u16) n_stages(u8), then n_stages x (stage(u8) ms(f32)),
+                     n_docs x document id(i64), n_docs x similarity(f16)
+
+Writes happen on a background thread; the request path only enqueues.
+"""
+import os
+import time
+import queue
+import struct
+import hashlib
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+
+MAGIC = b"RQLOG\x01"
+DEFAULT_LOG_DIR = os.path.join(os.path.dirname(__file__), "logs", "queries")
+
+# Append-only: new values go at the end so old logs keep decoding
+QUERY_TYPES = ("greeting", "off_topic", "general", "lawyer", "followup", "faq")
+STAGES = ("total", "lawyer_keyword", "vector_search", "fetch_by_ids", "generate", "keyword_search", "faq_match")
+CACHE_FLAGS = ("embedding", "retrieval", "answer", "session_followup")
+
+_TEXT_HEADER = struct.Struct("<8sH")
+_QUERY_HEADER = struct.Struct("<d8sBBIHB")
+_STAGE = struct.Struct("<Bf")
+
+
+def query_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+def encode_query(entry: dict, digest: bytes) -> bytes:
+    flags = 0
+    for bit, name in enumerate(CACHE_FLAGS):
+        if name in entry.get("cache", ()):
+            flags |= 1 << bit
+    stages = [(STAGES.index(name), ms) for name, ms in entry.get("timings", {}).items() if name in STAGES]
+    doc_ids = entry.get("doc_ids", [])[:0xFFFF]
+    similarities = entry.get("similarities", [])[:len(doc_ids)]
+    parts = [
+        b"Q",
+        _QUERY_HEADER.pack(
+            entry.get("timestamp", time.time()), digest, QUERY_TYPES.index(entry["query_type"]),
+            flags, entry.get("corpus_version") or 0, len(doc_ids), len(stages)
+        ),
+    ]
+    parts.extend(_STAGE.pack(stage, ms) for stage, ms in stages)
+    parts.append(struct.pack(f"<{len(doc_ids)}q", *doc_ids))
+    parts.append(struct.pack(f"<{len(doc_ids)}e", *similarities))
+    return b"".join(parts)
+
+
+class QueryLog:
+    """Queues query records and appends them to the day's log file from a daemon thread"""
+
+    def __init__(self, log_dir: Optional[str] = None, max_queue: int = 10000):
+        self.log_dir = log_dir or DEFAULT_LOG_DIR
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self._file = None
+        self._file_day = None
+        self._seen_texts = set()
+        threading.Thread(target=self._run, name="rag-query-log", daemon=True).start()
+
+    def log(self, entry: dict):
+        """Never blocks: when the writer falls behind, records are dropped and counted"""
+        entry.setdefault("timestamp", time.time())
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _open_for(self, timestamp: float):
+        day = datetime.fromtimestamp(timestamp).strftime("%Y%m%d")
+        if day == self._file_day:
+            return
+        if self._file:
+            self._file.close()
+        path = os.path.join(self.log_dir, f"queries-{day}.qlog")
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._file_day = day
+        # Every file carries the texts it references, so files can be read or deleted independently
+        self._seen_texts = set()
+
+    def _write(self, entry: dict):
+        self._open_for(entry["timestamp"])
+        text = entry["text"]
+        digest = query_hash(text)
+        if digest not in self._seen_texts:
+            encoded = text.encode("utf-8")[:0xFFFF]
+            self._file.write(b"T" + _TEXT_HEADER.pack(digest, len(encoded)) + encoded)
+            self._seen_texts.add(digest)
+        self._file.write(encode_query(entry, digest))
+        self.written += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for entry in batch:
+                try:
+                    self._write(entry)
+                except Exception as e:
+                    print(f"[WARN] Query log write failed: {e}")
+            if self._file:
+                self._file.flush()
+
+    def usage(self) -> dict:
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+
+def read_query_log(path: str) -> Iterator[dict]:
+    """Decode one log file; a record cut short by a crash ends the file"""
+    texts = {}
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a query log")
+    pos = len(MAGIC)
+    try:
+        while pos < len(data):
+            kind = data[pos:pos + 1]
+            pos += 1
+            if kind == b"T":
+                digest, length = _TEXT_HEADER.unpack_from(data, pos)
+                pos += _TEXT_HEADER.size
+                texts[digest] = data[pos:pos + length].decode("utf-8", errors="replace")
+                pos += length
+            elif kind == b"Q":
+                timestamp, digest, query_type, flags, corpus_version, n_docs, n_stages = _QUERY_HEADER.unpack_from(data, pos)
+                pos += _QUERY_HEADER.size
+                timings = {}
+                for _ in range(n_stages):
+                    stage, ms = _STAGE.unpack_from(data, pos)
+                    pos += _STAGE.size
+                    timings[STAGES[stage]] = round(ms, 2)
+                doc_ids = list(struct.unpack_from(f"<{n_docs}q", data, pos))
+                pos += 8 * n_docs
+                similarities = [round(s, 4) for s in struct.unpack_from(f"<{n_docs}e", data, pos)]
+                pos += 2 * n_docs
+                yield {
+                    "timestamp": timestamp,
+                    "query_hash": digest.hex(),
+                    "text": texts.get(digest),
+                    "query_type": QUERY_TYPES[query_type],
+                    "cache": [name for bit, name in enumerate(CACHE_FLAGS) if flags & (1 << bit)],
+                    "corpus_version": corpus_version,
+                    "doc_ids": doc_ids,
+                    "similarities": similarities,
+                    "timings": timings,
+                }
+            else:
+                print(f"[WARN] Unknown record type {kind!r} in {path}, stopping")
+                return
+    except struct.error:
+        print(f"[WARN] Truncated record at the end of {path}")
+
+
+def log_files(log_dir: Optional[str] = None, days: Optional[int] = None) -> List[str]:
+    """Log files, oldest first, optionally only the last `days` days"""
+    log_dir = log_dir or DEFAULT_LOG_DIR
+    if not os.path.isdir(log_dir):
+        return []
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y%m%d") if days else ""
+    names = sorted(
+        name for name in os.listdir(log_dir)
+        if name.startswith("queries-") and name.endswith(".qlog") and name[8:16] >= cutoff
+    )
+    return [os.path.join(log_dir, name) for name in names]
+
+
+def read_query_logs(log_dir: Optional[str] = None, days: Optional[int] = None) -> Iterator[dict]:
+    for path in log_files(log_dir, days):
+        yield from read_query_log(path)
+
+
+def top_queries(log_dir: Optional[str] = None, days: int = 7, limit: int = 100,
+                query_types=("general", "lawyer")) -> List[tuple]:
+    """Most frequent query texts of the given types, as (text, count)"""
+    counts = Counter()
+    texts = {}
+    for record in read_query_logs(log_dir, days):
+        if record["query_type"] in query_types and record["text"]:
+            counts[record["query_hash"]] += 1
+            texts[record["query_hash"]] = record["text"]
+    return [(texts[digest], count) for digest, count in counts.most_common(limit)]
+
+
+def query_log_from_env() -> Optional[QueryLog]:
+    """QueryLog in QUERY_LOG_DIR, or None when QUERY_LOG_ENABLED=0"""
+    if os.getenv("QUERY_LOG_ENABLED", "1") == "0":
+        return None
+    return QueryLog(os.getenv("QUERY_LOG_DIR") or None)
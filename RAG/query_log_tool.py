@@ -0,0 +1,159 @@
+"""Inspect and replay the binary query log written by app.py.
+
+Usage:
+    python query_log_tool.py summary [--days 7]              # mix, cache hit rates, stage timings
+    python query_log_tool.py top [--days 7] [--limit 20]     # most frequent legal/lawyer queries
+    python query_log_tool.py replay --url http://localhost:8000 [--speed 1] [--concurrency 4]
+    python query_log_tool.py replay --retrieval-only         # in-process retrieval, compares retrieved IDs
+"""
+import time
+import argparse
+import threading
+from collections import Counter
+from load_test import percentile
+from query_log import CACHE_FLAGS, read_query_logs, top_queries
+
+
+def summary(args):
+    records = list(read_query_logs(args.log_dir, args.days))
+    if not records:
+        print("No query log records found")
+        return
+    types = Counter(record["query_type"] for record in records)
+    cache = Counter(flag for record in records for flag in record["cache"])
+    timings = {}
+    for record in records:
+        for stage, ms in record["timings"].items():
+            timings.setdefault(stage, []).append(ms)
+
+    print(f"{len(records)} queries, {len({r['query_hash'] for r in records})} distinct texts")
+    print("\nQuery types:")
+    for name, count in types.most_common():
+        print(f"  {name:<12} {count:>7} ({count / len(records):.1%})")
+    print("\nCache hits (share of all queries):")
+    for flag in CACHE_FLAGS:
+        print(f"  {flag:<18} {cache[flag]:>7} ({cache[flag] / len(records):.1%})")
+    print("\nStage timings (ms):")
+    for stage, values in sorted(timings.items()):
+        print(f"  {stage:<16} n={len(values):<7} p50={percentile(values, 50)} "
+              f"p95={percentile(values, 95)} p99={percentile(values, 99)}")
+    similarities = [r["similarities"][0] for r in records if r["similarities"]]
+    if similarities:
+        print(f"\nTop-1 similarity: p10={percentile(similarities, 10, 3)} p50={percentile(similarities, 50, 3)} "
+              f"p90={percentile(similarities, 90, 3)}")
+
+
+def top(args):
+    for text, count in top_queries(args.log_dir, days=args.days, limit=args.limit):
+        print(f"{count:>6}  {text}")
+
+
+def replay_http(records, args):
+    import requests
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    first_logged = records[0]["timestamp"]
+    replay_start = time.time()
+    pending = iter(records)
+
+    def worker():
+        nonlocal errors
+        http = requests.Session()
+        while True:
+            with lock:
+                record = next(pending, None)
+            if record is None:
+                return
+            if args.speed > 0:
+                # Keep the logged inter-arrival times, compressed by --speed
+                delay = (record["timestamp"] - first_logged) / args.speed - (time.time() - replay_start)
+                if delay > 0:
+                    time.sleep(delay)
+            start = time.perf_counter()
+            try:
+                ok = http.post(f"{args.url}/query", json={"query": record["text"]}, timeout=120).status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+                errors += 0 if ok else 1
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - replay_start
+    print(f"Replayed {len(latencies)} queries in {elapsed:.1f}s ({len(latencies) / elapsed:.2f} qps), {errors} errors")
+    print(f"Latency p50={percentile(latencies, 50)}ms p95={percentile(latencies, 95)}ms p99={percentile(latencies, 99)}ms")
+
+
+def replay_retrieval(records, args):
+    """Re-run retrieval in process and compare against the logged document IDs"""
+    from app import rag_system
+    latencies = []
+    overlaps = []
+    for record in records:
+        if record["query_type"] not in ("general", "lawyer"):
+            continue
+        start = time.perf_counter()
+        # The trace holds every hit; the returned docs are only those relevant enough to fetch
+        trace = {"cache": set(), "timings": {}}
+        rag_system.retrieve(record["text"], trace=trace)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if record["doc_ids"]:
+            retrieved = set(trace["doc_ids"])
+            overlaps.append(len(retrieved & set(record["doc_ids"])) / len(record["doc_ids"]))
+    if not latencies:
+        print("No retrieval queries to replay")
+        return
+    print(f"Replayed {len(latencies)} retrievals")
+    print(f"Latency p50={percentile(latencies, 50)}ms p95={percentile(latencies, 95)}ms p99={percentile(latencies, 99)}ms")
+    if overlaps:
+        print(f"Overlap with logged IDs: {sum(overlaps) / len(overlaps):.1%} "
+              "(below 100% after a corpus rebuild or model switch is expected)")
+
+
+def replay(args):
+    records = [r for r in read_query_logs(args.log_dir, args.days) if r["text"]]
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("No query log records found")
+        return
+    if args.retrieval_only:
+        replay_retrieval(records, args)
+    else:
+        replay_http(records, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query log tools")
+    parser.add_argument("--log-dir", help="Defaults to QUERY_LOG_DIR or logs/queries")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    summary_parser = subparsers.add_parser("summary", help="Query mix, cache hit rates and stage timings")
+    summary_parser.add_argument("--days", type=int, default=7)
+    summary_parser.set_defaults(func=summary)
+
+    top_parser = subparsers.add_parser("top", help="Most frequent queries")
+    top_parser.add_argument("--days", type=int, default=7)
+    top_parser.add_argument("--limit", type=int, default=20)
+    top_parser.set_defaults(func=top)
+
+    replay_parser = subparsers.add_parser("replay", help="Replay logged queries")
+    replay_parser.add_argument("--days", type=int, default=1)
+    replay_parser.add_argument("--limit", type=int, default=0, help="Replay at most N queries (0 = all)")
+    replay_parser.add_argument("--url", default="http://localhost:8000")
+    replay_parser.add_argument("--speed", type=float, default=0, help="1 = logged pace, 10 = 10x faster, 0 = no pauses")
+    replay_parser.add_argument("--concurrency", type=int, default=1)
+    replay_parser.add_argument("--retrieval-only", action="store_true", help="Run retrieval in process instead of HTTP")
+    replay_parser.set_defaults(func=replay)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""Background re-embedding of the knowledge base for a new embedding model.
+
+Usage:
+    python reembed.py run <model> [--batch-size 64] [--pause 0.0] [--activate]
+    python reembed.py status
+    python reembed.py activate <model>
+
+The job fills document_embeddings for <model> next to the live vectors, so the
+API keeps serving from the current model until `activate` switches it.
+"""
+import os
+import time
+import argparse
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+from sentence_transformers import SentenceTransformer
+from embedding_store import (
+    ACTIVE_MODEL_KEY,
+    EmbeddingStore,
+    get_active_model,
+    get_documents_model,
+    model_index_name,
+    set_setting,
+)
+
+load_dotenv()
+
+
+def connect():
+    return psycopg2.connect(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD")
+    )
+
+
+def update_progress(cursor, model_name, **fields):
+    assignments = sql.SQL(", ").join(
+        sql.SQL("{} = %s").format(sql.Identifier(key)) for key in fields
+    )
+    cursor.execute(
+        sql.SQL("UPDATE embedding_migrations SET {}, updated_at = CURRENT_TIMESTAMP WHERE model_name = %s").format(assignments),
+        (*fields.values(), model_name)
+    )
+
+
+def run_migration(conn, model_name, batch_size=64, pause=0.0):
+    """Embed every document for model_name that doesn't have a vector for it yet (resumable)"""
+    if model_name == get_documents_model(conn):
+        print(f"{model_name} already backs documents.embedding, nothing to re-embed")
+        return
+
+    print(f"Loading embedding model {model_name}...")
+    encoder = SentenceTransformer(model_name)
+    dimension = encoder.get_sentence_embedding_dimension()
+    store = EmbeddingStore(conn, model_name, encoder)
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        INSERT INTO embedding_migrations (model_name, dimension, status)
+        VALUES (%s, %s, 'running')
+        ON CONFLICT (model_name) DO UPDATE
+        SET dimension = EXCLUDED.dimension, status = 'running', error = NULL, finished_at = NULL
+        """,
+        (model_name, dimension)
+    )
+    cursor.execute("SELECT COUNT(*) FROM documents")
+    total = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM document_embeddings WHERE model_name = %s", (model_name,))
+    done = cursor.fetchone()[0]
+    update_progress(cursor, model_name, total_documents=total, embedded_documents=done)
+    conn.commit()
+    print(f"Re-embedding {total - done} of {total} documents with {model_name} ({dimension} dims)")
+
+    try:
+        while True:
+            cursor.execute(
+                """
+                SELECT d.id, d.content
+                FROM documents d
+                LEFT JOIN document_embeddings de
+                    ON de.document_id = d.id AND de.model_name = %s
+                WHERE de.document_id IS NULL
+                ORDER BY d.id
+                LIMIT %s
+                """,
+                (model_name, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            vectors = store.embed_many([content for _, content in rows], batch_size=batch_size)
+            execute_values(
+                cursor,
+                """
+                INSERT INTO document_embeddings (model_name, document_id, embedding)
+                VALUES %s
+                ON CONFLICT (model_name, document_id) DO NOTHING
+                """,
+                [(model_name, doc_id, vector) for (doc_id, _), vector in zip(rows, vectors)],
+                template="(%s, %s, %s::vector)"
+            )
+            done += len(rows)
+            update_progress(cursor, model_name, embedded_documents=done, cache_hits=store.hits)
+            conn.commit()
+            print(f"✓ {done}/{total} documents ({store.hits} from embedding cache)")
+
+            if pause:
+                # Throttle so the job doesn't compete with query traffic
+                time.sleep(pause)
+
+        print("Building ANN index for the new model...")
+        cursor.execute(
+            sql.SQL(
+                "CREATE INDEX IF NOT EXISTS {} ON document_embeddings "
+                "USING hnsw ((embedding::vector({})) vector_cosine_ops) WHERE model_name = {}"
+            ).format(sql.Identifier(model_index_name(model_name)), sql.Literal(dimension), sql.Literal(model_name))
+        )
+        update_progress(cursor, model_name, status="ready")
+        cursor.execute(
+            "UPDATE embedding_migrations SET finished_at = CURRENT_TIMESTAMP WHERE model_name = %s",
+            (model_name,)
+        )
+        conn.commit()
+        print(f"✓ {model_name} is ready. Run `python reembed.py activate \"{model_name}\"` to switch.")
+    except Exception as e:
+        conn.rollback()
+        update_progress(cursor, model_name, status="failed", error=str(e))
+        conn.commit()
+        raise
+    finally:
+        cursor.close()
+
+
+def activate(conn, model_name):
+    """Atomically switch the model RAGSystem queries with"""
+    cursor = conn.cursor()
+    if model_name != get_documents_model(conn):
+        cursor.execute("SELECT status FROM embedding_migrations WHERE model_name = %s", (model_name,))
+        row = cursor.fetchone()
+        if not row or row[0] != "ready":
+            raise RuntimeError(f"{model_name} has no finished migration (status: {row[0] if row else 'none'})")
+        cursor.execute(
+            """
+            SELECT COUNT(*) FROM documents d
+            LEFT JOIN document_embeddings de ON de.document_id = d.id AND de.model_name = %s
+            WHERE de.document_id IS NULL
+            """,
+            (model_name,)
+        )
+        missing = cursor.fetchone()[0]
+        if missing:
+            raise RuntimeError(f"{missing} documents have no {model_name} vector yet, re-run the migration first")
+
+    previous = get_active_model(conn)
+    set_setting(conn, ACTIVE_MODEL_KEY, model_name)
+    conn.commit()
+    cursor.close()
+    print(f"✓ Active embedding model: {previous} -> {model_name}")
+    print("  Running API instances switch on their next model poll (RAG_SETTINGS_POLL_SECONDS)")
+
+
+def print_status(conn):
+    cursor = conn.cursor()
+    print(f"Active model:    {get_active_model(conn)}")
+    print(f"Documents model: {get_documents_model(conn)}")
+    cursor.execute(
+        """
+        SELECT model_name, dimension, status, embedded_documents, total_documents, cache_hits, updated_at, error
+        FROM embedding_migrations
+        ORDER BY started_at
+        """
+    )
+    for model_name, dimension, status, done, total, hits, updated_at, error in cursor.fetchall():
+        percent = (done / total * 100) if total else 0
+        print(f"  {model_name} ({dimension} dims): {status} {done}/{total} ({percent:.1f}%), "
+              f"{hits} cache hits, updated {updated_at}")
+        if error:
+            print(f"    error: {error}")
+    cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed the knowledge base for a new embedding model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Fill vectors for a model in the background")
+    run_parser.add_argument("model")
+    run_parser.add_argument("--batch-size", type=int, default=64)
+    run_parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    run_parser.add_argument("--activate", action="store_true", help="Switch to the model when finished")
+
+    activate_parser = subparsers.add_parser("activate", help="Switch the query model")
+    activate_parser.add_argument("model")
+
+    subparsers.add_parser("status", help="Show migration progress")
+
+    args = parser.parse_args()
+    conn = connect()
+    try:
+        if args.command == "run":
+            run_migration(conn, args.model, args.batch_size, args.pause)
+            if args.activate:
+                activate(conn, args.model)
+        elif args.command == "activate":
+            activate(conn, args.model)
+        else:
+            print_status(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import List, Optional
+from corpora import CORPUS_ADVOCATES
+
+# How many retrieved documents generate_answer actually puts into the prompt
+ANSWER_DOC_LIMITS = {
+    "lawyer": 10,
+    "general": 5,
+}
+
+# Hits below this similarity never reach the prompt or the sources, so their content is not fetched
+MIN_RELEVANT_SIMILARITY = 0.35
+
+LAWYER_SOURCE = "Lawyer.pdf"
+
+# Legal terms that put matching chunks ahead of pure vector neighbours
+BOOST_KEYWORDS = [
+    'police', 'arrest', 'warrant', 'court', 'judge', 'law', 'legal',
+    'rights', 'crime', 'criminal', 'civil', 'ipc', 'section', 'act',
+    'detention', 'bail', 'custody', 'lawyer', 'advocate', 'case',
+    'property', 'divorce', 'marriage', 'contract', 'agreement', 'dispute',
+    'rape', 'sexual', 'assault', 'abuse', 'harassment', 'molestation',
+    'victim', 'violence', 'domestic', 'attack', 'pocso', 'minor',
+    'child', 'woman', 'women', '376', '354', '509', 'dowry', 'murder',
+    'theft', 'robbery', 'fraud', 'cheating', 'kidnapping', 'trafficking'
+]
+MAX_BOOST_KEYWORDS = 5
+
+
+class PlanStage:
+    """One retrieval step of a query plan"""
+
+    def __init__(self, name: str, description: str, fetch_count: int,
+                 embed_text: Optional[str] = None, params: Optional[dict] = None,
+                 filters: Optional[dict] = None, stop_when_found: bool = False):
+        self.name = name
+        self.description = description
+        self.fetch_count = fetch_count
+        self.embed_text = embed_text
+        self.params = params or {}
+        # Corpus/source filters pushed down into the indexed scan
+        self.filters = filters or {}
+        # Cheap exact stages end the plan as soon as they return rows
+        self.stop_when_found = stop_when_found
+        self.status = "pending"
+        self.rows = 0
+        self.elapsed_ms = None
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "fetch_count": self.fetch_count,
+            "embed_text": self.embed_text,
+            "params": self.params,
+            "filters": self.filters,
+            "stop_when_found": self.stop_when_found,
+            "status": self.status,
+            "rows": self.rows,
+            "elapsed_ms": self.elapsed_ms,
+        }
+
+
+class QueryPlan:
+    """Ordered retrieval stages chosen for a query, cheapest first"""
+
+    def __init__(self, query_type: str, specialization: Optional[str], stages: List[PlanStage], answer_limit: int):
+        self.query_type = query_type
+        self.specialization = specialization
+        self.stages = stages
+        self.answer_limit = answer_limit
+
+    @property
+    def is_lawyer(self) -> bool:
+        return self.query_type == "lawyer"
+
+    @property
+    def fetch_count(self) -> int:
+        return max(stage.fetch_count for stage in self.stages)
+
+    def combine(self, results: List[Optional[List[tuple]]]) -> List[tuple]:
+        """Stage hits, (id, similarity), in plan order without duplicates; a stop_when_found stage with rows ends the list"""
+        docs = []
+        seen = set()
+        for idx, (stage, rows) in enumerate(zip(self.stages, results)):
+            for hit in rows or []:
+                if hit[0] not in seen:
+                    seen.add(hit[0])
+                    docs.append(hit)
+            if rows and stage.stop_when_found:
+                for skipped in self.stages[idx + 1:]:
+                    skipped.status = "skipped"
+                break
+        return docs[:self.fetch_count]
+
+    def _run_stage(self, stage: PlanStage, executor) -> List[tuple]:
+        stage.status = "running"
+        start = time.perf_counter()
+        try:
+            rows = executor(stage) or []
+        except Exception:
+            stage.status = "failed"
+            raise
+        finally:
+            stage.elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+        stage.rows = len(rows)
+        # A stage that already timed out or was made redundant keeps that status
+        if stage.status == "running":
+            stage.status = "executed"
+        print(f"[DEBUG] Plan stage '{stage.name}' returned {stage.rows} rows in {stage.elapsed_ms}ms")
+        return rows
+
+    def run(self, executors: dict) -> List[tuple]:
+        """Run stages in order with executors[stage.name](stage), skipping work whose results would be discarded"""
+        results = []
+        for stage in self.stages:
+            rows = self._run_stage(stage, executors[stage.name])
+            results.append(rows)
+            if rows and stage.stop_when_found:
+                break
+        return self.combine(results)
+
+    def _waves(self) -> List[List[PlanStage]]:
+        """Stages grouped for run_concurrent: each stop_when_found stage alone, the stages between them together"""
+        waves = []
+        for stage in self.stages:
+            if stage.stop_when_found or not waves or waves[-1][-1].stop_when_found:
+                waves.append([stage])
+            else:
+                waves[-1].append(stage)
+        return waves
+
+    def run_concurrent(self, executors: dict, pool, stage_timeout: float) -> List[tuple]:
+        """Run stages on pool; a stage that fails or misses stage_timeout seconds is left out.
+
+        A stop_when_found stage runs first on its own, and the independent stages
+        after it start together only if it came back empty, so their latency is
+        that of the slowest one (capped by the timeout) rather than the sum. The
+        plan only fails when no stage produced rows and one raised.
+        """
+        if len(self.stages) == 1:
+            return self.run(executors)
+
+        results = []
+        error = None
+        for wave in self._waves():
+            futures = [pool.submit(self._run_stage, stage, executors[stage.name]) for stage in wave]
+            deadline = time.perf_counter() + stage_timeout
+            for stage, future in zip(wave, futures):
+                try:
+                    rows = future.result(timeout=max(deadline - time.perf_counter(), 0))
+                except FutureTimeout:
+                    stage.status = "timeout"
+                    print(f"[WARN] Plan stage '{stage.name}' timed out after {stage_timeout * 1000:.0f}ms, using other stages")
+                    rows = None
+                except Exception as e:
+                    print(f"[WARN] Plan stage '{stage.name}' failed: {e}")
+                    error = error or e
+                    rows = None
+                results.append(rows)
+            if results[-1] and wave[-1].stop_when_found:
+                # Later stages were only a fallback and never start
+                break
+
+        docs = self.combine(results)
+        if not docs and error is not None:
+            raise error
+        return docs
+
+    def to_dict(self) -> dict:
+        return {
+            "query_type": self.query_type,
+            "specialization": self.specialization,
+            "answer_limit": self.answer_limit,
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+
+def boost_keywords(query_text: str) -> List[str]:
+    query_lower = query_text.lower()
+    return [kw for kw in BOOST_KEYWORDS if kw in query_lower][:MAX_BOOST_KEYWORDS]
+
+
+def vector_stages(query_text: str, description: str, fetch_count: int, embed_text: str, filters: dict) -> List[PlanStage]:
+    """Vector search, preceded by a keyword-boost stage when the query names legal terms"""
+    stages = []
+    keywords = boost_keywords(query_text)
+    if keywords:
+        stages.append(PlanStage(
+            "keyword_search",
+            f"Chunks mentioning {', '.join(keywords)}, nearest first",
+            fetch_count=fetch_count,
+            embed_text=embed_text,
+            params={"keywords": keywords},
+            filters=filters,
+        ))
+    stages.append(PlanStage("vector_search", description, fetch_count=fetch_count, embed_text=embed_text, filters=filters))
+    return stages
+
+
+def build_query_plan(query_text: str, is_lawyer: bool, specialization: Optional[str], max_results: int = 5) -> QueryPlan:
+    """Choose the retrieval stages for a query type, with fetch sizes matched to what the answer stage uses"""
+    query_type = "lawyer" if is_lawyer else "general"
+    answer_limit = ANSWER_DOC_LIMITS[query_type]
+    fetch_count = max(max_results or 0, answer_limit)
+    stages = []
+
+    if is_lawyer and specialization:
+        # Exact "<Specialization> Law" lookup in the advocate list is cheap and more accurate than vectors
+        stages.append(PlanStage(
+            "lawyer_keyword",
+            f"LIKE lookup for '{specialization.title()} Law' in {LAWYER_SOURCE}",
+            fetch_count=answer_limit,
+            params={"pattern": f"%{specialization.title()} Law%", "source": LAWYER_SOURCE},
+            stop_when_found=True,
+        ))
+        stages.extend(vector_stages(
+            query_text,
+            "Vector search on reformulated advocate query (fallback)",
+            fetch_count,
+            f"Advocate {specialization.title()} Law",
+            {"corpus": CORPUS_ADVOCATES},
+        ))
+    elif is_lawyer:
+        stages.extend(vector_stages(
+            query_text,
+            "Vector search on generic advocate query",
+            fetch_count,
+            "Advocate Law lawyer",
+            {"corpus": CORPUS_ADVOCATES},
+        ))
+    else:
+        stages.extend(vector_stages(
+            query_text,
+            "Vector search on the user query",
+            fetch_count,
+            query_text,
+            {"exclude_corpus": CORPUS_ADVOCATES},
+        ))
+
+    return QueryPlan(query_type, specialization, stages, answer_limit)
@@ -0,0 +1,165 @@
+import os
+import re
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+# Words that point back at the previous answer ("what is the penalty for it?")
+ANAPHORA_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "he", "she", "him", "her",
+    "his", "there", "same", "such", "above", "former", "latter",
+}
+FOLLOWUP_PHRASES = (
+    "what about", "how about", "what if", "and if", "what else", "tell me more", "more about", "more detail",
+    "explain", "elaborate", "clarify", "how so", "in that case", "then what", "and then", "why",
+)
+FOLLOWUP_OPENERS = ("and", "but", "so", "also", "then")
+# Words that ask or refer without naming a topic of their own
+FUNCTION_WORDS = ANAPHORA_WORDS | set(
+    """a an the and or but so also then if of for to in on at by with from about as is are was were be been being
+    do does did can could would should will shall may might must have has had i me my we our you your what which
+    who whom whose when where why how please tell more detail details explain elaborate clarify else mean means
+    case happens happen again one ones any some other else thing things ok okay yes no not""".split()
+)
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def has_followup_signal(text: str) -> bool:
+    """The query refers back to the conversation instead of starting a new topic"""
+    words = _words(text)
+    if not words:
+        return False
+    text_lower = " ".join(words)
+    return (
+        any(word in ANAPHORA_WORDS for word in words)
+        or words[0] in FOLLOWUP_OPENERS
+        or any(re.search(rf"\b{phrase}\b", text_lower) for phrase in FOLLOWUP_PHRASES)
+    )
+
+
+def new_topic_words(text: str) -> List[str]:
+    """Words of the query that name something rather than refer back or ask"""
+    return [word for word in _words(text) if word not in FUNCTION_WORDS]
+
+
+class ConversationSession:
+    """Server-side state for one chat conversation"""
+
+    def __init__(self, session_id: str, max_turns: int = 4, summary_chars: int = 600):
+        self.session_id = session_id
+        self.turns = deque(maxlen=max_turns)
+        self.summary = ""
+        self.summary_chars = summary_chars
+        self.last_doc_ids: List[int] = []
+        self.last_similarities: List[float] = []
+        self.last_query_type: Optional[str] = None
+        self.last_specialization: Optional[str] = None
+        self.retrieval_version: Optional[int] = None
+        self.created_at = time.time()
+        self.last_access = self.created_at
+
+    def add_turn(self, role: str, content: str):
+        """Append a message, folding the oldest one into the rolling summary when full"""
+        if len(self.turns) == self.turns.maxlen:
+            self._fold_into_summary(self.turns[0])
+        self.turns.append({"role": role, "content": content})
+
+    def _fold_into_summary(self, message: dict):
+        """Keep only the first sentence of evicted turns so the summary stays compact"""
+        content = message.get("content", "").replace("\n", " ").strip()
+        first_sentence = content.split(". ")[0][:160]
+        if not first_sentence:
+            return
+        prefix = "User asked" if message.get("role") == "user" else "Assistant said"
+        self.summary = f"{self.summary} {prefix}: {first_sentence}.".strip()
+        if len(self.summary) > self.summary_chars:
+            # Drop the oldest part of the summary, keep the most recent context
+            self.summary = self.summary[-self.summary_chars:].split(" ", 1)[-1]
+
+    def history(self) -> List[dict]:
+        """Recent turns in the same shape clients send as conversation_history"""
+        return list(self.turns)
+
+    def remember_retrieval(self, docs: List[dict], query_type: str, specialization: Optional[str] = None,
+                           corpus_version: Optional[int] = None):
+        """Store the previous turn's retrieved document IDs for follow-up reuse"""
+        self.last_doc_ids = [doc["id"] for doc in docs if doc.get("id") is not None]
+        self.last_similarities = [float(doc.get("similarity", 0)) for doc in docs if doc.get("id") is not None]
+        self.last_query_type = query_type
+        self.last_specialization = specialization
+        self.retrieval_version = corpus_version
+
+
+class SessionStore:
+    """Bounded LRU store of conversation sessions with idle TTL"""
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: int = 1800, max_turns: int = 4):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: Optional[str]) -> Optional[ConversationSession]:
+        """Return the live session for session_id, None if it is unknown or expired"""
+        if not session_id:
+            return None
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if now - session.last_access > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            session.last_access = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def create(self, history: Optional[List[dict]] = None) -> ConversationSession:
+        """Start a session with a server-generated ID, seeded with the client's history if given"""
+        session = ConversationSession(uuid.uuid4().hex, max_turns=self.max_turns)
+        for message in history or []:
+            session.add_turn(message.get("role", "user"), message.get("content", ""))
+        with self._lock:
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get_or_create(self, session_id: Optional[str] = None) -> ConversationSession:
+        """Return the live session for session_id, or start a new one.
+
+        New sessions always get a server-generated ID; an unknown or expired
+        client-supplied ID is never adopted.
+        """
+        return self.get(session_id) or self.create()
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def purge_expired(self) -> int:
+        """Drop sessions idle longer than the TTL, returns how many were removed"""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [sid for sid, s in self._sessions.items() if s.last_access < cutoff]
+            for sid in expired:
+                del self._sessions[sid]
+            return len(expired)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+def session_store_from_env() -> SessionStore:
+    return SessionStore(
+        max_sessions=int(os.getenv("SESSION_MAX_ENTRIES", "1000")),
+        ttl_seconds=int(os.getenv("SESSION_TTL_SECONDS", "1800")),
+        max_turns=int(os.getenv("SESSION_MAX_TURNS", "4")),
+    )
@@ -1,29 +1,217 @@
 -- Enable pgvector extension
 CREATE EXTENSION IF NOT EXISTS vector;
 
+-- Trigram matching for the keyword (LIKE) searches
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Create documents table with vector embeddings
 CREATE TABLE IF NOT EXISTS documents (
     id BIGSERIAL PRIMARY KEY,
     content TEXT NOT NULL,
     metadata JSONB,
     embedding vector(768),
+    corpus TEXT,
+    source TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Corpus and source columns for databases created before they existed
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS corpus TEXT;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS source TEXT;
+
+-- Chunk identity (hash of file content, chunk number and text); ingestion writes are idempotent on it
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS chunk_key TEXT;
+
+-- MinHash LSH band hashes of the chunk text, for near-duplicate detection at ingest (see dedup.py)
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS lsh_bands BIGINT[];
+
+-- Backfill from metadata (same rules as corpora.classify_source)
+UPDATE documents
+SET source = metadata->>'source'
+WHERE source IS NULL;
+
+UPDATE documents
+SET corpus = CASE
+    WHEN source = 'Lawyer.pdf' THEN 'advocates'
+    WHEN LOWER(source) LIKE '%faq%' THEN 'faq'
+    ELSE 'statutes'
+END
+WHERE corpus IS NULL;
+
 -- Create index for vector similarity search
-CREATE INDEX IF NOT EXISTS documents_embedding_idx 
+CREATE INDEX IF NOT EXISTS documents_embedding_idx
 ON documents USING ivfflat (embedding vector_cosine_ops)
 WITH (lists = 100);
 
+-- Per-corpus partial ANN indexes, used when a search filters on corpus
+CREATE INDEX IF NOT EXISTS documents_embedding_advocates_idx
+ON documents USING ivfflat (embedding vector_cosine_ops)
+WITH (lists = 10)
+WHERE corpus = 'advocates';
+
+CREATE INDEX IF NOT EXISTS documents_embedding_faq_idx
+ON documents USING ivfflat (embedding vector_cosine_ops)
+WITH (lists = 50)
+WHERE corpus = 'faq';
+
+CREATE INDEX IF NOT EXISTS documents_embedding_statutes_idx
+ON documents USING ivfflat (embedding vector_cosine_ops)
+WITH (lists = 50)
+WHERE corpus = 'statutes';
+
+-- Substantive legal questions search everything except the advocate directory
+CREATE INDEX IF NOT EXISTS documents_embedding_legal_idx
+ON documents USING ivfflat (embedding vector_cosine_ops)
+WITH (lists = 100)
+WHERE corpus <> 'advocates';
+
+-- Create index for corpus/source filters
+CREATE INDEX IF NOT EXISTS documents_corpus_source_idx
+ON documents (corpus, source);
+
+-- Unique chunk identity, so a resumed ingestion run never stores a chunk twice
+CREATE UNIQUE INDEX IF NOT EXISTS documents_chunk_key_idx
+ON documents (chunk_key);
+
+-- Near-duplicate candidates: chunks sharing an LSH band
+CREATE INDEX IF NOT EXISTS documents_lsh_bands_idx
+ON documents USING gin (lsh_bands);
+
 -- Create index for metadata queries
-CREATE INDEX IF NOT EXISTS documents_metadata_idx 
+CREATE INDEX IF NOT EXISTS documents_metadata_idx
 ON documents USING gin (metadata);
 
+-- Trigram index for the keyword-boost stage's LOWER(content) LIKE '%term%' filters
+CREATE INDEX IF NOT EXISTS documents_content_trgm_idx
+ON documents USING gin (LOWER(content) gin_trgm_ops);
+
+-- Service settings (active embedding model, ...)
+CREATE TABLE IF NOT EXISTS rag_settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO rag_settings (key, value) VALUES
+    ('active_embedding_model', 'sentence-transformers/all-mpnet-base-v2'),
+    ('documents_embedding_model', 'sentence-transformers/all-mpnet-base-v2'),
+    ('corpus_version', '0')
+ON CONFLICT (key) DO NOTHING;
+
+-- Content-addressed embedding store: unchanged text is never embedded twice per model
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    model_name TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    embedding vector NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (model_name, content_hash)
+);
+
+-- Document vectors for embedding models other than the one in documents.embedding
+CREATE TABLE IF NOT EXISTS document_embeddings (
+    model_name TEXT NOT NULL,
+    document_id BIGINT NOT NULL,
+    embedding vector NOT NULL,
+    PRIMARY KEY (model_name, document_id)
+);
+
+-- Progress of background re-embedding jobs (see reembed.py)
+CREATE TABLE IF NOT EXISTS embedding_migrations (
+    model_name TEXT PRIMARY KEY,
+    dimension INT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    total_documents INT DEFAULT 0,
+    embedded_documents INT DEFAULT 0,
+    cache_hits INT DEFAULT 0,
+    error TEXT,
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+-- FAQ question/answer pairs, questions embedded with the active query model (see faq_index.py)
+CREATE TABLE IF NOT EXISTS faq_questions (
+    entry_key TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    source TEXT NOT NULL,
+    page INT,
+    model_name TEXT NOT NULL,
+    embedding vector NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Checkpoints of process_pdfs.py runs (see ingest_jobs.py)
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    id SERIAL PRIMARY KEY,
+    target_table TEXT NOT NULL,
+    phase TEXT NOT NULL DEFAULT 'loading',
+    abandoned BOOLEAN NOT NULL DEFAULT FALSE,
+    error TEXT,
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE TABLE IF NOT EXISTS ingest_files (
+    job_id INT NOT NULL REFERENCES ingest_jobs (id) ON DELETE CASCADE,
+    file_path TEXT NOT NULL,
+    file_hash TEXT,
+    chunks INT DEFAULT 0,
+    stored INT DEFAULT 0,
+    failed INT DEFAULT 0,
+    done BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job_id, file_path)
+);
+
+-- Chunks folded into a near-duplicate instead of being stored
+ALTER TABLE ingest_files ADD COLUMN IF NOT EXISTS duplicates INT DEFAULT 0;
+
+-- Chunks that failed to embed or insert, kept with their text so they can be retried
+CREATE TABLE IF NOT EXISTS ingest_dead_letters (
+    job_id INT NOT NULL REFERENCES ingest_jobs (id) ON DELETE CASCADE,
+    chunk_key TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    content TEXT NOT NULL,
+    metadata JSONB,
+    error TEXT,
+    attempts INT NOT NULL DEFAULT 1,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job_id, chunk_key)
+);
+
+-- PDFs uploaded through the API, ingested by ingest_worker.py (see upload_queue.py)
+CREATE TABLE IF NOT EXISTS upload_jobs (
+    id SERIAL PRIMARY KEY,
+    filename TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    chunks_total INT,
+    chunks_embedded INT DEFAULT 0,
+    attempts INT NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    corpus_version INT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP WITH TIME ZONE,
+    heartbeat_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS upload_jobs_status_idx ON upload_jobs (status, id);
+
 -- Function to search similar documents
+DROP FUNCTION IF EXISTS match_documents(vector, FLOAT, INT);
+
 CREATE OR REPLACE FUNCTION match_documents (
   query_embedding vector(768),
   match_threshold FLOAT DEFAULT 0.7,
-  match_count INT DEFAULT 5
+  match_count INT DEFAULT 5,
+  filter_corpus TEXT DEFAULT NULL,
+  filter_source TEXT DEFAULT NULL
 )
 RETURNS TABLE (
   id BIGINT,
@@ -40,6 +228,8 @@ AS $$
     1 - (documents.embedding <=> query_embedding) AS similarity
   FROM documents
   WHERE 1 - (documents.embedding <=> query_embedding) > match_threshold
+    AND (filter_corpus IS NULL OR documents.corpus = filter_corpus)
+    AND (filter_source IS NULL OR documents.source = filter_source)
   ORDER BY documents.embedding <=> query_embedding
   LIMIT match_count;
 $$;
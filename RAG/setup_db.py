@@ -26,6 +26,7 @@ def setup_database():
         print("✓ Database setup completed successfully!")
         print("✓ pgvector extension enabled")
         print("✓ documents table created")
+        print("✓ Corpus/source columns and per-corpus ANN indexes created")
         print("✓ Vector similarity search function created")
         
         cursor.close()
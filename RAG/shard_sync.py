@@ -0,0 +1,161 @@
+"""Distribute the live corpus from the primary database to the hash shards in DB_SHARDS.
+
+Usage:
+    python shard_sync.py sync [--init]    # rebuild every shard's documents table from the primary
+    python shard_sync.py status           # rows and corpus version per shard
+
+DB_SHARDS lists shards separated by commas, and replicas of a shard by "|"
+(e.g. "localhost:5433|localhost:5443,localhost:5434"). Rows are written to the
+first endpoint of each shard; its replicas are expected to follow it by
+streaming replication. Run this after every process_pdfs.py rebuild.
+"""
+import os
+import argparse
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+from db_pool import connection_params, parse_endpoints, shard_index
+from embedding_store import ACTIVE_MODEL_KEY, DOCUMENTS_MODEL_KEY, get_setting, set_setting
+from blue_green import (
+    CORPUS_VERSION_KEY, STAGING_TABLE, build_indexes, create_staging_table,
+    get_corpus_version, swap_in_staging, validate_staging,
+)
+
+load_dotenv()
+
+BATCH_SIZE = 500
+
+
+def shard_endpoints():
+    spec = os.getenv("DB_SHARDS", "").strip()
+    if not spec:
+        raise SystemExit("DB_SHARDS is not set")
+    return [parse_endpoints(group.split("|")[0])[0] for group in spec.split(",") if group.strip()]
+
+
+def connect(host=None, port=None):
+    return psycopg2.connect(**connection_params(host, port))
+
+
+def init_schema(conn):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "setup_database.sql")) as f:
+        script = f.read()
+    conn.autocommit = True
+    conn.cursor().execute(script)
+    conn.autocommit = False
+
+
+def copy_rows(primary, shards):
+    """Stream documents and their other-model vectors from the primary into each shard's staging table"""
+    counts = [0] * len(shards)
+    read = primary.cursor(name="shard_sync_documents")
+    read.itersize = BATCH_SIZE
+    read.execute("SELECT id, content, metadata::text, embedding::text, corpus, source, chunk_key FROM documents ORDER BY id")
+    insert = sql.SQL(
+        "INSERT INTO {} (id, content, metadata, embedding, corpus, source, chunk_key) VALUES %s"
+    ).format(sql.Identifier(STAGING_TABLE))
+    while True:
+        rows = read.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        batches = [[] for _ in shards]
+        for row in rows:
+            batches[shard_index(row[0], len(shards))].append(row)
+        for idx, batch in enumerate(batches):
+            if batch:
+                execute_values(
+                    shards[idx].cursor(), insert.as_string(shards[idx]), batch,
+                    template="(%s, %s, %s::jsonb, %s::vector, %s, %s, %s)"
+                )
+                counts[idx] += len(batch)
+    read.close()
+
+    read = primary.cursor(name="shard_sync_embeddings")
+    read.itersize = BATCH_SIZE
+    read.execute("SELECT model_name, document_id, embedding::text FROM document_embeddings")
+    while True:
+        rows = read.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        batches = [[] for _ in shards]
+        for row in rows:
+            batches[shard_index(row[1], len(shards))].append(row)
+        for idx, batch in enumerate(batches):
+            if batch:
+                execute_values(
+                    shards[idx].cursor(),
+                    "INSERT INTO document_embeddings (model_name, document_id, embedding) VALUES %s "
+                    "ON CONFLICT (model_name, document_id) DO NOTHING",
+                    batch, template="(%s, %s, %s::vector)"
+                )
+    read.close()
+    return counts
+
+
+def sync(args):
+    endpoints = shard_endpoints()
+    primary = connect()
+    shards = [connect(host, port) for host, port in endpoints]
+    try:
+        version = get_corpus_version(primary)
+        print(f"Primary corpus version {version}, distributing to {len(shards)} shards")
+        for (host, port), conn in zip(endpoints, shards):
+            if args.init:
+                init_schema(conn)
+                print(f"✓ Schema ready on {host}:{port}")
+            create_staging_table(conn)
+
+        counts = copy_rows(primary, shards)
+        for conn in shards:
+            conn.commit()
+
+        for (host, port), conn, count in zip(endpoints, shards, counts):
+            print(f"\n=== Shard {host}:{port}: {count} documents ===")
+            build_indexes(conn)
+            validate_staging(conn)
+            swap_in_staging(conn)
+            # Shards report the primary's version and models, not their own swap counter
+            set_setting(conn, CORPUS_VERSION_KEY, str(version))
+            for key in (ACTIVE_MODEL_KEY, DOCUMENTS_MODEL_KEY):
+                value = get_setting(primary, key)
+                if value:
+                    set_setting(conn, key, value)
+            conn.commit()
+        print(f"\n✓ All shards at corpus version {version}")
+    finally:
+        primary.close()
+        for conn in shards:
+            conn.close()
+
+
+def status(args):
+    primary = connect()
+    print(f"primary: corpus version {get_corpus_version(primary)}")
+    primary.close()
+    for host, port in shard_endpoints():
+        try:
+            conn = connect(host, port)
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM documents")
+            rows = cursor.fetchone()[0]
+            print(f"{host}:{port}: {rows} documents, corpus version {get_corpus_version(conn)}")
+            conn.close()
+        except psycopg2.Error as e:
+            print(f"{host}:{port}: unavailable ({e})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distribute documents across hash shards")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sync_parser = subparsers.add_parser("sync", help="Rebuild every shard from the primary")
+    sync_parser.add_argument("--init", action="store_true", help="Run setup_database.sql on each shard first")
+    sync_parser.set_defaults(func=sync)
+    status_parser = subparsers.add_parser("status", help="Row counts and corpus versions")
+    status_parser.set_defaults(func=status)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""Portable binary snapshots of the documents corpus, for bringing up a node without re-embedding.
+
+Usage:
+    python snapshot.py export corpus.ragsnap [--dtype float16]
+    python snapshot.py info corpus.ragsnap
+    python snapshot.py import corpus.ragsnap [--init]    # COPY into staging, index, validate, swap
+    python snapshot.py search corpus.ragsnap "What is Section 66A?" [--corpus faq]
+
+File layout (all integers little-endian):
+
+    b"RAGSNAP\\0"  uint32 format version  uint32 header length  JSON header
+    embeddings    rows x dimension float32/float16, 64-byte aligned
+    ids           rows int64
+    records       zlib-compressed JSON lines: content, metadata, corpus, source, chunk_key, lsh_bands
+    sha256        32 bytes over the three sections
+
+The header records the embedding model, dimension, dtype, row count, corpus
+version and the byte range of each section. The embedding matrix is
+memory-mapped as is: SnapshotIndex searches it in process, with no copy and no
+database.
+"""
+import os
+import io
+import json
+import mmap
+import zlib
+import struct
+import hashlib
+import argparse
+import tempfile
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2 import sql
+
+from db_pool import connection_params
+from embedding_store import get_active_model, get_documents_model
+from blue_green import (
+    CORPUS_VERSION_KEY, FAQ_STAGING_TABLE, LIVE_TABLE, STAGING_TABLE, build_indexes, create_staging_table,
+    get_corpus_version, swap_in_staging, validate_staging,
+)
+
+load_dotenv()
+
+MAGIC = b"RAGSNAP\0"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+DTYPES = {"float32": "<f4", "float16": "<f2"}
+RECORD_FIELDS = ("content", "metadata", "corpus", "source", "chunk_key", "lsh_bands")
+
+BATCH_SIZE = 500
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def export_snapshot(conn, path: str, dtype: str = "float32") -> dict:
+    """Write the live documents table to path (atomically, via a .part file); returns the header"""
+    conn.commit()
+    with tempfile.TemporaryFile() as vectors, tempfile.TemporaryFile() as records:
+        compressor = zlib.compressobj(6)
+        ids = []
+        dimension = None
+        # One REPEATABLE READ transaction: its first query fixes the snapshot, so the version and
+        # model read here describe exactly the rows the named cursor then streams
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        try:
+            corpus_version = get_corpus_version(conn)
+            model_name = get_documents_model(conn)
+            read = conn.cursor(name="snapshot_export")
+            read.itersize = BATCH_SIZE
+            read.execute(sql.SQL(
+                "SELECT id, content, metadata, corpus, source, chunk_key, lsh_bands, embedding::real[] FROM {} ORDER BY id"
+            ).format(sql.Identifier(LIVE_TABLE)))
+            for row in read:
+                if row[7] is None:
+                    raise RuntimeError(f"Document {row[0]} has no embedding; re-run the ingest before exporting")
+                vector = np.asarray(row[7], dtype=DTYPES[dtype])
+                if dimension is None:
+                    dimension = len(vector)
+                elif len(vector) != dimension:
+                    raise RuntimeError(f"Document {row[0]} has a {len(vector)}-dimensional embedding, expected {dimension}")
+                vectors.write(vector.tobytes())
+                ids.append(row[0])
+                record = dict(zip(RECORD_FIELDS, row[1:7]))
+                records.write(compressor.compress((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")))
+            records.write(compressor.flush())
+            read.close()
+        finally:
+            conn.rollback()
+            conn.set_session(isolation_level="DEFAULT", readonly=False)
+        if not ids:
+            raise RuntimeError(f"{LIVE_TABLE} is empty, nothing to export")
+
+        id_bytes = np.asarray(ids, dtype="<i8").tobytes()
+        sections = {
+            "embeddings": vectors.tell(),
+            "ids": len(id_bytes),
+            "records": records.tell(),
+        }
+        header = {
+            "format_version": FORMAT_VERSION,
+            "model_name": model_name,
+            "dimension": dimension,
+            "dtype": dtype,
+            "rows": len(ids),
+            "corpus_version": corpus_version,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "sections": {},
+        }
+        # The sections follow the header, whose length depends on their offsets: lay out until stable
+        while True:
+            header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+            offset = _aligned(len(MAGIC) + 8 + len(header_bytes))
+            layout = {}
+            for name, size in sections.items():
+                layout[name] = [offset, size]
+                offset = _aligned(offset + size)
+            if layout == header["sections"]:
+                break
+            header["sections"] = layout
+
+        digest = hashlib.sha256()
+        part_path = path + ".part"
+        with open(part_path, "wb") as out:
+            header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+            out.write(MAGIC + struct.pack("<II", FORMAT_VERSION, len(header_bytes)) + header_bytes)
+            for name, source in (("embeddings", vectors), ("ids", io.BytesIO(id_bytes)), ("records", records)):
+                start, size = header["sections"][name]
+                out.write(b"\0" * (start - out.tell()))
+                source.seek(0)
+                while True:
+                    block = source.read(1024 * 1024)
+                    if not block:
+                        break
+                    digest.update(block)
+                    out.write(block)
+            # The checksum trails the file so it can be computed while writing
+            out.write(digest.digest())
+        os.replace(part_path, path)
+    return header
+
+
+class Snapshot:
+    """Read-only view of a snapshot file; the embedding matrix is a zero-copy view of the mmapped file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot file")
+        version, header_length = struct.unpack_from("<II", self._mmap, len(MAGIC))
+        if version > FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} uses snapshot format {version}; this version reads up to {FORMAT_VERSION}")
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._mmap[start:start + header_length])
+        self.model_name = self.header["model_name"]
+        self.corpus_version = self.header["corpus_version"]
+        rows, dimension = self.header["rows"], self.header["dimension"]
+
+        offset, _ = self.header["sections"]["embeddings"]
+        self.embeddings = np.frombuffer(
+            self._mmap, dtype=DTYPES[self.header["dtype"]], count=rows * dimension, offset=offset
+        ).reshape(rows, dimension)
+        offset, _ = self.header["sections"]["ids"]
+        self.ids = np.frombuffer(self._mmap, dtype="<i8", count=rows, offset=offset)
+
+    def __len__(self):
+        return self.header["rows"]
+
+    def verify(self):
+        """Compare the section bytes with the checksum written at export"""
+        digest = hashlib.sha256()
+        for name in ("embeddings", "ids", "records"):
+            start, size = self.header["sections"][name]
+            digest.update(self._mmap[start:start + size])
+        if digest.digest() != self._mmap[-32:]:
+            raise ValueError(f"{self.path} is corrupt (checksum mismatch)")
+
+    def records(self) -> Iterator[dict]:
+        """Row records in embedding order, decompressed as they are read"""
+        start, size = self.header["sections"]["records"]
+        decompressor = zlib.decompressobj()
+        pending = b""
+        for block_start in range(start, start + size, 1024 * 1024):
+            block = self._mmap[block_start:min(block_start + 1024 * 1024, start + size)]
+            pending += decompressor.decompress(block)
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield json.loads(line)
+        pending += decompressor.flush()
+        if pending.strip():
+            yield json.loads(pending)
+
+    def close(self):
+        # Views of the mmap must be dropped before it can close
+        self.embeddings = self.ids = None
+        self._mmap.close()
+        self._file.close()
+
+
+class SnapshotIndex:
+    """Exact cosine search over a snapshot, in process: a vector backend for nodes or dev setups without pgvector"""
+
+    def __init__(self, snapshot: Snapshot, block_rows: int = 8192):
+        self.snapshot = snapshot
+        self.block_rows = block_rows
+        self.records = list(snapshot.records())
+        self.corpora = np.asarray([record["corpus"] for record in self.records])
+        # Norms are the only per-row data computed; the vectors stay in the page cache
+        self.norms = np.concatenate([
+            np.linalg.norm(snapshot.embeddings[i:i + block_rows].astype(np.float32), axis=1)
+            for i in range(0, len(snapshot), block_rows)
+        ])
+        self.norms = np.maximum(self.norms, 1e-12)
+
+    def search(self, query_embedding, limit: int = 10, corpus: Optional[str] = None,
+               exclude_corpus: Optional[str] = None) -> List[tuple]:
+        """(id, similarity) hits, best first, like the SQL searches in app.py"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = np.concatenate([
+            self.snapshot.embeddings[i:i + self.block_rows].astype(np.float32) @ query
+            for i in range(0, len(self.snapshot), self.block_rows)
+        ]) / self.norms
+        if corpus:
+            scores[self.corpora != corpus] = -np.inf
+        if exclude_corpus:
+            scores[self.corpora == exclude_corpus] = -np.inf
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.snapshot.ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def fetch(self, hits: List[tuple]) -> List[dict]:
+        """Documents for hits, in the shape of RAGSystem.fetch_documents_by_ids"""
+        positions = {int(doc_id): idx for idx, doc_id in enumerate(self.snapshot.ids)}
+        docs = []
+        for doc_id, similarity in hits:
+            record = self.records[positions[doc_id]]
+            docs.append({"id": doc_id, "content": record["content"], "metadata": record["metadata"],
+                         "similarity": similarity})
+        return docs
+
+
+def connect():
+    return psycopg2.connect(**connection_params())
+
+
+def import_snapshot(conn, snapshot: Snapshot) -> int:
+    """Bulk-load a snapshot through the blue/green path; returns the new corpus version"""
+    documents_model = get_documents_model(conn)
+    if documents_model != snapshot.model_name:
+        raise RuntimeError(
+            f"Snapshot embeddings are from {snapshot.model_name}, this database uses {documents_model}"
+        )
+    active_model = get_active_model(conn)
+    if active_model != snapshot.model_name:
+        print(f"[WARN] Queries use {active_model}; run reembed.py for it after the import")
+
+    create_staging_table(conn)
+    cursor = conn.cursor()
+    # The snapshot holds documents only; the live FAQ question index stays as it is
+    cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(FAQ_STAGING_TABLE)))
+
+    copy = sql.SQL(
+        "COPY {} (id, content, metadata, corpus, source, chunk_key, lsh_bands, embedding) FROM STDIN"
+    ).format(sql.Identifier(STAGING_TABLE)).as_string(conn)
+    buffer = io.StringIO()
+    loaded = 0
+    for position, record in enumerate(snapshot.records()):
+        vector = snapshot.embeddings[position].astype(np.float32)
+        fields = [
+            str(int(snapshot.ids[position])),
+            record["content"],
+            json.dumps(record["metadata"]) if record["metadata"] is not None else None,
+            record["corpus"],
+            record["source"],
+            record["chunk_key"],
+            "{" + ",".join(str(band) for band in record["lsh_bands"]) + "}" if record["lsh_bands"] else None,
+            "[" + ",".join(repr(float(value)) for value in vector) + "]",
+        ]
+        buffer.write("\t".join(_copy_text(field) for field in fields) + "\n")
+        loaded += 1
+        if loaded % BATCH_SIZE == 0:
+            buffer.seek(0)
+            cursor.copy_expert(copy, buffer)
+            buffer = io.StringIO()
+    buffer.seek(0)
+    cursor.copy_expert(copy, buffer)
+
+    # Ids come from the snapshot; move the shared sequence past them so later inserts do not collide,
+    # but never back, or new rows could reuse ids still held by the live table or document_embeddings
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (LIVE_TABLE,))
+    sequence = cursor.fetchone()[0]
+    if sequence:
+        cursor.execute(
+            sql.SQL("SELECT setval(%s, GREATEST((SELECT MAX(id) FROM {}), (SELECT last_value FROM {}), 1))").format(
+                sql.Identifier(STAGING_TABLE), sql.SQL(sequence)
+            ),
+            (sequence,)
+        )
+    conn.commit()
+    cursor.close()
+    print(f"✓ Copied {loaded} documents into {STAGING_TABLE}")
+
+    build_indexes(conn)
+    validate_staging(conn)
+    # Vectors of other models belong to the replaced rows; the same id may now be other text
+    version = swap_in_staging(conn, drop_replaced_embeddings=True)
+    if snapshot.corpus_version > version:
+        # Never move the version backwards, or caches from an older generation could match
+        cursor = conn.cursor()
+        cursor.execute("UPDATE rag_settings SET value = %s, updated_at = CURRENT_TIMESTAMP WHERE key = %s",
+                       (str(snapshot.corpus_version), CORPUS_VERSION_KEY))
+        conn.commit()
+        cursor.close()
+        version = snapshot.corpus_version
+    return version
+
+
+def _copy_text(value) -> str:
+    """A field in COPY's text format"""
+    if value is None:
+        return "\\N"
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def export_command(args):
+    conn = connect()
+    try:
+        header = export_snapshot(conn, args.path, args.dtype)
+    finally:
+        conn.close()
+    size = os.path.getsize(args.path)
+    print(f"✓ Exported {header['rows']} documents ({header['model_name']}, {header['dimension']}d {header['dtype']},"
+          f" corpus version {header['corpus_version']}) to {args.path}: {size / (1024 * 1024):.1f} MB")
+
+
+def info_command(args):
+    snapshot = Snapshot(args.path)
+    try:
+        header = snapshot.header
+        print(f"{args.path}: format {header['format_version']}, created {header['created_at']}")
+        print(f"  model:          {header['model_name']} ({header['dimension']}d {header['dtype']})")
+        print(f"  documents:      {header['rows']}")
+        print(f"  corpus version: {header['corpus_version']}")
+        for name, (offset, size) in header["sections"].items():
+            print(f"  {name + ':':<15} {size / 1024:.0f} KB at offset {offset}")
+        snapshot.verify()
+        print("✓ Checksum OK")
+    finally:
+        snapshot.close()
+
+
+def import_command(args):
+    snapshot = Snapshot(args.path)
+    conn = connect()
+    try:
+        snapshot.verify()
+        if args.init:
+            from shard_sync import init_schema
+            init_schema(conn)
+            print("✓ Schema ready")
+        version = import_snapshot(conn, snapshot)
+        print(f"✓ Imported {len(snapshot)} documents, corpus version is now {version}")
+    finally:
+        conn.close()
+        snapshot.close()
+
+
+def search_command(args):
+    from sentence_transformers import SentenceTransformer
+
+    snapshot = Snapshot(args.path)
+    try:
+        index = SnapshotIndex(snapshot)
+        model = SentenceTransformer(snapshot.model_name)
+        hits = index.search(model.encode(args.query).tolist(), args.limit, corpus=args.corpus)
+        for doc in index.fetch(hits):
+            print(f"{doc['similarity']:.3f}  {doc['metadata'].get('source')} p.{doc['metadata'].get('page', '?')}:"
+                  f" {doc['content'][:120]!r}")
+    finally:
+        index = None
+        snapshot.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and import binary snapshots of the documents corpus")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Write the live corpus to a snapshot file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--dtype", choices=sorted(DTYPES), default="float32",
+                               help="float16 halves the file; cosine scores change by ~1e-3")
+    export_parser.set_defaults(func=export_command)
+    info_parser = subparsers.add_parser("info", help="Show a snapshot's header and verify its checksum")
+    info_parser.add_argument("path")
+    info_parser.set_defaults(func=info_command)
+    import_parser = subparsers.add_parser("import", help="Load a snapshot and swap it in as the live corpus")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--init", action="store_true", help="Run setup_database.sql first (new node)")
+    import_parser.set_defaults(func=import_command)
+    search_parser = subparsers.add_parser("search", help="Query a snapshot in process, without a database")
+    search_parser.add_argument("path")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=5)
+    search_parser.add_argument("--corpus")
+    search_parser.set_defaults(func=search_command)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
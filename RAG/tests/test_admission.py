@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from admission import Overloaded, RequestGate, StageLimiter, admission_from_env
+
+
+def hold_slots(limiter, count):
+    """Threads holding `count` slots until the returned event is set"""
+    release = threading.Event()
+    entered = threading.Barrier(count + 1)
+
+    def hold():
+        with limiter.slot():
+            entered.wait()
+            release.wait()
+
+    threads = [threading.Thread(target=hold) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    entered.wait()
+    return release, threads
+
+
+def test_admits_up_to_concurrency_and_counts():
+    limiter = StageLimiter("db", concurrency=2, max_queue=4, max_wait=5)
+    with limiter.slot():
+        with limiter.slot():
+            assert limiter.usage()["active"] == 2
+    usage = limiter.usage()
+    assert (usage["active"], usage["admitted"], usage["rejected"]) == (0, 2, 0)
+
+
+def test_full_queue_rejects_at_once():
+    limiter = StageLimiter("llm", concurrency=1, max_queue=0, max_wait=5)
+    release, threads = hold_slots(limiter, 1)
+    start = time.time()
+    with pytest.raises(Overloaded) as error:
+        with limiter.slot():
+            pass
+    assert time.time() - start < 0.5
+    assert error.value.stage == "llm"
+    assert error.value.retry_after >= 1
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert limiter.usage()["rejected"] == 1
+
+
+def test_deadline_passes_while_queued():
+    limiter = StageLimiter("embed", concurrency=1, max_queue=4, max_wait=5)
+    release, threads = hold_slots(limiter, 1)
+    with pytest.raises(Overloaded, match="deadline passed"):
+        with limiter.slot(deadline=time.time() + 0.05):
+            pass
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert limiter.usage()["waiting"] == 0
+
+
+def test_expected_wait_beyond_deadline_rejects_without_waiting():
+    limiter = StageLimiter("llm", concurrency=1, max_queue=10, max_wait=30)
+    limiter.avg_service = 10.0
+    release, threads = hold_slots(limiter, 1)
+    limiter.waiting = 2  # two requests ahead, ~20s of expected wait
+    start = time.time()
+    with pytest.raises(Overloaded, match="expected wait"):
+        with limiter.slot(deadline=time.time() + 1):
+            pass
+    assert time.time() - start < 0.5
+    limiter.waiting = 0
+    release.set()
+    for thread in threads:
+        thread.join()
+
+
+def test_admission_from_env(monkeypatch):
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "3")
+    monkeypatch.setenv("REQUEST_TIMEOUT_SECONDS", "7")
+    controller = admission_from_env(db_pool_max=6)
+    assert controller.limiters["llm"].concurrency == 3
+    assert controller.limiters["db"].concurrency == 6
+    assert controller.request_timeout == 7
+    assert set(controller.usage()) == {"embed", "db", "llm", "request"}
+    # The /query thread pool defaults to the sum of the stage limits
+    assert controller.gate.concurrency == controller.limiters["embed"].concurrency + 6 + 3
+
+
+def test_request_gate_sheds_beyond_threads_and_queue():
+    gate = RequestGate("request", concurrency=2, max_queue=1, max_wait=30)
+    with gate.admit(), gate.admit(), gate.admit():
+        assert gate.usage()["waiting"] == 1
+        with pytest.raises(Overloaded, match="already queued") as error:
+            with gate.admit():
+                pass
+        assert error.value.retry_after >= 1
+    usage = gate.usage()
+    assert (usage["active"], usage["admitted"], usage["rejected"]) == (0, 3, 1)
+
+
+def test_request_gate_rejects_when_expected_wait_exceeds_deadline():
+    gate = RequestGate("request", concurrency=1, max_queue=10, max_wait=5)
+    gate.avg_service = 10.0
+    with gate.admit():
+        with pytest.raises(Overloaded, match="expected wait"):
+            with gate.admit():
+                pass
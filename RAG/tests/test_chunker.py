@@ -0,0 +1,61 @@
+from chunker import chunk_pages, is_boundary, is_noise
+
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+
+def answer_line(words, prefix="w"):
+    return " ".join(f"{prefix}{i}" for i in range(words))
+
+
+def test_short_entries_pack_into_one_chunk():
+    pages = ["Q1: What is A?\nA is a thing.\nQ2: What is B?\nB is another thing."]
+    chunks = list(chunk_pages(pages, "faq.pdf", count_words, max_tokens=40, overlap_tokens=8))
+    assert len(chunks) == 1
+    assert chunks[0]["metadata"] == {"source": "faq.pdf", "page": 1, "page_end": 1, "chunk": 0, "tokens": 16}
+
+
+def test_chunks_respect_the_token_limit():
+    pages = ["\n".join(f"Q{i}: Question {i}?\n{answer_line(15, f'a{i}_')}" for i in range(10))]
+    chunks = list(chunk_pages(pages, "faq.pdf", count_words, max_tokens=40, overlap_tokens=8))
+    assert all(chunk["metadata"]["tokens"] <= 40 for chunk in chunks)
+    # Entries are never split when they fit: every chunk starts at a question
+    assert all(chunk["content"].startswith("Q") for chunk in chunks)
+
+
+def test_long_answer_keeps_its_question_in_every_chunk():
+    # Regression: a 100-word answer line used to leave the question alone in a 4-token chunk
+    pages = ["Q3: What is C?\n" + answer_line(100)]
+    chunks = list(chunk_pages(pages, "faq.pdf", count_words, max_tokens=40, overlap_tokens=8))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk["content"].startswith("Q3: What is C?")
+        assert chunk["metadata"]["tokens"] <= 40
+        assert len(chunk["content"].split()) > 4
+    answer_words = [word for chunk in chunks for word in chunk["content"].split()[4:]]
+    assert answer_words == answer_line(100).split()
+
+
+def test_long_entry_without_question_carries_overlap():
+    pages = ["\n".join(answer_line(10, f"l{i}_") for i in range(10))]
+    chunks = list(chunk_pages(pages, "guide.pdf", count_words, max_tokens=40, overlap_tokens=10))
+    assert len(chunks) > 1
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["content"].splitlines()[0] == previous["content"].splitlines()[-1]
+
+
+def test_chunks_run_across_pages():
+    pages = ["Q1: First?\nshort answer", "continues here"]
+    chunks = list(chunk_pages(pages, "faq.pdf", count_words, max_tokens=40, overlap_tokens=8))
+    assert len(chunks) == 1
+    assert (chunks[0]["metadata"]["page"], chunks[0]["metadata"]["page_end"]) == (1, 2)
+
+
+def test_boundaries_and_noise():
+    assert is_boundary("Q: What is bail?")
+    assert is_boundary("12. Is the information legally binding?")
+    assert is_boundary("Chapter IV")
+    assert not is_boundary("Quite a normal sentence.")
+    assert is_noise("3/14/24, 10:05 AM")
+    assert not is_noise("Section 420 of the IPC")
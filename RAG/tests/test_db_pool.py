@@ -0,0 +1,105 @@
+from collections import Counter
+
+import psycopg2
+import pytest
+
+from admission import Overloaded
+from db_pool import ReadRouter, ReplicaSet, parse_endpoints, shard_index
+
+
+class FakeConn:
+    closed = 0
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    def __init__(self, fail=False, in_use=0, saturated=False):
+        self.fail = fail
+        self.saturated = saturated
+        self.in_use = in_use
+        self.maxconn = 5
+        self.checkouts = 0
+
+    def getconn(self, timeout=None):
+        if self.saturated:
+            raise TimeoutError("Timed out waiting for a database connection")
+        if self.fail:
+            raise psycopg2.OperationalError("connection refused")
+        self.checkouts += 1
+        return FakeConn()
+
+    def putconn(self, conn, close=False):
+        pass
+
+    def usage(self):
+        return {"in_use": self.in_use}
+
+
+def test_shard_index_is_stable_and_even():
+    # shard_sync.py placed existing rows with this function; it must never change
+    assert [shard_index(doc_id, 3) for doc_id in (1, 2, 3, 1000)] == [2, 1, 1, 0]
+    assert shard_index(12345, 1) == 0
+    counts = Counter(shard_index(doc_id, 4) for doc_id in range(1, 20001))
+    assert set(counts) == {0, 1, 2, 3}
+    assert max(counts.values()) - min(counts.values()) < 20000 * 0.05
+
+
+def test_read_router_routes_ids_to_their_shard():
+    shards = [ReplicaSet([(f"s{i}", FakePool())]) for i in range(3)]
+    router = ReadRouter(shards)
+    assert router.sharded
+    assert all(router.shard_number(doc_id) == shard_index(doc_id, 3) for doc_id in range(100))
+    assert router.capacity == 5
+    assert not ReadRouter(shards[:1]).sharded
+
+
+def test_parse_endpoints(monkeypatch):
+    monkeypatch.setenv("DB_PORT", "5432")
+    assert parse_endpoints("a:5433, b ,") == [("a", "5433"), ("b", "5432")]
+
+
+def test_replica_set_ejects_failing_endpoint():
+    down, up = FakePool(fail=True), FakePool()
+    replicas = ReplicaSet([("down", down), ("up", up)], eject_seconds=60)
+    for _ in range(3):
+        with replicas.connection() as conn:
+            assert isinstance(conn, FakeConn)
+    assert up.checkouts == 3
+    assert replicas.failures["down"] == 1
+    assert replicas.usage()["down"]["healthy"] is False
+
+
+def test_replica_set_raises_when_all_endpoints_fail():
+    replicas = ReplicaSet([("a", FakePool(fail=True)), ("b", FakePool(fail=True))])
+    with pytest.raises(psycopg2.OperationalError):
+        with replicas.connection():
+            pass
+
+
+def test_saturated_pool_sheds_without_ejecting():
+    replicas = ReplicaSet([("busy", FakePool(saturated=True)), ("up", FakePool())])
+    replicas._next = len(replicas.pools) - 1  # "busy" comes first
+    with pytest.raises(Overloaded):
+        with replicas.connection():
+            pass
+    assert replicas.failures["busy"] == 0
+
+
+def test_failed_query_does_not_eject_but_broken_connection_does():
+    pool = FakePool()
+    replicas = ReplicaSet([("a", pool)])
+    with pytest.raises(psycopg2.extensions.QueryCanceledError):
+        with replicas.connection():
+            raise psycopg2.extensions.QueryCanceledError("canceling statement due to statement timeout")
+    assert replicas.failures["a"] == 0
+
+    with pytest.raises(psycopg2.OperationalError):
+        with replicas.connection() as conn:
+            conn.closed = 2
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+    assert replicas.failures["a"] == 1
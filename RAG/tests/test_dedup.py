@@ -0,0 +1,161 @@
+from dedup import (
+    BANDS, ChunkDeduplicator, deduplicator_from_env, foldable_corpora, jaccard, lsh_bands, reference, shingles,
+)
+
+BASE = (
+    "Section 66A of the IT Act made it an offence to send offensive messages through a computer "
+    "or communication device. The Supreme Court struck it down in Shreya Singhal v Union of India "
+    "in 2015 because it was vague and restricted free speech beyond the limits of Article 19(2). "
+    "Police can no longer register cases under the section and pending cases must be closed."
+)
+EDITED = BASE.replace("in 2015", "in March 2015")
+# An FAQ answer saying what BASE says in other words
+REWORDED = (
+    "Can I still be booked for an offensive post under Section 66A? No. In Shreya Singhal v Union of "
+    "India (2015) the Supreme Court held the section unconstitutional as vague and an excessive curb on "
+    "free speech under Article 19(2), so police cannot file new cases and old ones must be dropped."
+)
+OTHER = (
+    "A cheque that bounces for insufficient funds is an offence under Section 138 of the Negotiable "
+    "Instruments Act. The payee must send a demand notice within thirty days of the bank memo."
+)
+
+
+class FakeCursor:
+    def __init__(self, rows, nearest=None):
+        self.rows = rows
+        self.nearest = nearest
+        self.params = None
+
+    def execute(self, query, params=None):
+        self.params = params
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.nearest
+
+
+def chunk(content, source="IT Act 2000 Key Sections Guide.pdf", number=0):
+    return {"content": content, "metadata": {"source": source, "page": 1, "page_end": 1, "chunk": number}}
+
+
+def test_shingles_and_jaccard():
+    assert shingles("") == set()
+    assert shingles("Bail is a right") == {"bail is a right"}
+    assert len(shingles("one two three four five six")) == 2
+    assert jaccard(shingles(BASE), shingles(BASE)) == 1.0
+    assert jaccard(shingles(BASE), shingles(EDITED)) > 0.85
+    assert jaccard(shingles(BASE), shingles(OTHER)) < 0.1
+    assert jaccard(set(), shingles(BASE)) == 0.0
+
+
+def test_lsh_bands_are_stable_and_shared_by_near_duplicates():
+    bands = lsh_bands(BASE)
+    assert len(bands) == BANDS
+    # Stored in the lsh_bands BIGINT[] column, so they must be deterministic signed 64-bit values
+    assert bands == lsh_bands(BASE)
+    assert all(-2 ** 63 <= band < 2 ** 63 for band in bands)
+    assert set(bands) & set(lsh_bands(EDITED))
+    assert not set(bands) & set(lsh_bands(OTHER))
+
+
+def test_split_batch_folds_near_duplicates_of_stored_chunks():
+    stored = ("stored-key", BASE, "statutes", lsh_bands(BASE))
+    cursor = FakeCursor([stored])
+    dedup = ChunkDeduplicator(threshold=0.85)
+    unique, duplicates = dedup.split_batch(cursor, "documents", [("k1", chunk(EDITED)), ("k2", chunk(OTHER, number=1))])
+    assert [key for key, _ in unique] == ["k2"]
+    assert unique[0][1]["lsh_bands"] == lsh_bands(OTHER)
+    [(key, _, target_key, similarity)] = duplicates
+    assert (key, target_key) == ("k1", "stored-key")
+    assert similarity >= 0.85
+    assert (dedup.checked, dedup.duplicates, dedup.chars_saved) == (2, 1, len(EDITED))
+
+
+def test_split_batch_within_one_batch_and_across_corpora():
+    dedup = ChunkDeduplicator(threshold=0.85)
+    batch = [
+        ("k1", chunk(BASE)),
+        ("k2", chunk(EDITED, number=1)),
+        # Same text in the FAQ corpus folds into the statutes chunk
+        ("k3", chunk(EDITED, source="Cyber FAQ.pdf", number=2)),
+        # ...but never into the advocate directory
+        ("k4", chunk(EDITED, source="Lawyer.pdf", number=3)),
+    ]
+    unique, duplicates = dedup.split_batch(FakeCursor([]), "documents", batch)
+    assert [key for key, _ in unique] == ["k1", "k4"]
+    assert [(key, target) for key, _, target, _ in duplicates] == [("k2", "k1"), ("k3", "k1")]
+
+
+def test_faq_chunk_folds_into_stored_statute_chunk():
+    stored = ("guide-key", BASE, "statutes", lsh_bands(BASE))
+    cursor = FakeCursor([stored])
+    unique, duplicates = ChunkDeduplicator(0.85).split_batch(
+        cursor, "documents", [("faq-key", chunk(EDITED, source="Cyber Law FAQ.pdf"))]
+    )
+    assert unique == []
+    assert [(key, target) for key, _, target, _ in duplicates] == [("faq-key", "guide-key")]
+    assert cursor.params[1] == ["faq", "statutes"]
+    assert foldable_corpora("advocates") == ("advocates",)
+
+
+def test_reworded_cross_corpus_pair_folds_by_embedding():
+    # Too few shared shingles for the MinHash path...
+    assert jaccard(shingles(BASE), shingles(REWORDED)) < 0.85
+    dedup = ChunkDeduplicator(threshold=0.85, embedding_threshold=0.95)
+    faq_chunk = chunk(REWORDED, source="Cyber Law FAQ.pdf")
+    unique, duplicates = dedup.split_batch(FakeCursor([]), "documents", [("faq-key", faq_chunk)])
+    assert duplicates == []
+    # ...but its vector is close to the stored guide chunk's
+    cursor = FakeCursor([], nearest=("guide-key", 0.98))
+    keep, reworded = dedup.split_embedded(cursor, "documents", unique, [[0.6, 0.8]])
+    assert keep == []
+    assert [(key, target, similarity) for key, _, target, similarity in reworded] == [("faq-key", "guide-key", 0.98)]
+    assert cursor.params[1] == "advocates"  # searched everything except the advocate directory
+    assert (dedup.checked, dedup.duplicates, dedup.embedded_duplicates) == (1, 1, 1)
+    assert "0 embeddings skipped" in dedup.report(3072)
+
+
+def test_split_embedded_within_batch_and_threshold():
+    dedup = ChunkDeduplicator(threshold=0.85, embedding_threshold=0.95)
+    batch = [
+        ("k1", chunk(BASE)),
+        ("k2", chunk(REWORDED, source="Cyber FAQ.pdf", number=1)),
+        ("k3", chunk(REWORDED, source="Lawyer.pdf", number=2)),
+        ("k4", chunk(OTHER, number=3)),
+    ]
+    vectors = [[1.0, 0.0], [0.99, 0.05], [1.0, 0.0], [0.0, 1.0]]
+    keep, reworded = dedup.split_embedded(FakeCursor([], nearest=("far-key", 0.5)), "documents", batch, vectors)
+    assert keep == [0, 2, 3]
+    assert [(key, target) for key, _, target, _ in reworded] == [("k2", "k1")]
+    assert ChunkDeduplicator(0.85).split_embedded(FakeCursor([]), "documents", batch, vectors) == ([0, 1, 2, 3], [])
+
+
+def test_split_batch_excludes_the_replaced_source():
+    cursor = FakeCursor([])
+    ChunkDeduplicator(0.85).split_batch(cursor, "documents", [("k1", chunk(BASE))], exclude_source="old.pdf")
+    bands, corpora, excluded, _ = cursor.params
+    assert bands == sorted(set(lsh_bands(BASE)))
+    assert corpora == ["faq", "statutes"]
+    assert excluded == "old.pdf"
+
+
+def test_reference_and_report():
+    assert reference("k9", chunk(BASE, number=4)) == {
+        "source": "IT Act 2000 Key Sections Guide.pdf", "page": 1, "page_end": 1, "chunk": 4, "chunk_key": "k9",
+    }
+    dedup = ChunkDeduplicator(0.85)
+    assert dedup.report(3072) == "Near-duplicates: no chunks checked"
+    dedup.split_batch(FakeCursor([]), "documents", [("k1", chunk(BASE)), ("k2", chunk(BASE, number=1))])
+    assert dedup.report(3072, models=2).startswith("Near-duplicates: 1/2 chunks (50.0%) folded")
+
+
+def test_deduplicator_from_env(monkeypatch):
+    monkeypatch.setenv("DEDUP_THRESHOLD", "0.9")
+    monkeypatch.setenv("DEDUP_EMBEDDING_THRESHOLD", "0")
+    assert deduplicator_from_env().threshold == 0.9
+    assert deduplicator_from_env().embedding_threshold == 0
+    monkeypatch.setenv("INGEST_DEDUP", "0")
+    assert deduplicator_from_env() is None
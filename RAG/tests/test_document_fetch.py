@@ -0,0 +1,106 @@
+from contextlib import contextmanager
+
+from db_pool import ReadRouter, shard_index
+from document_fetch import DocumentFetcher
+from query_cache import VersionedCache
+from retrieval_plan import MIN_RELEVANT_SIMILARITY
+
+# id -> (content, source, page, also_in)
+ROWS = {
+    3: ("Section 438 CrPC covers anticipatory bail", "crpc.pdf", 12, None),
+    7: ("Bail is a right for bailable offences", "crpc.pdf", 3, None),
+    12: ("Section 66A was struck down", "it_act.pdf", None, [{"source": "cyber_faq.pdf", "page": 2}]),
+    20: ("Advocate R. Rao - Criminal Law", "Lawyer.pdf", 4, None),
+}
+
+
+class FakeShard:
+    """A shard's replica set; lookups return its rows in ID order, like an index scan would"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.lookups = []
+
+    @contextmanager
+    def connection(self, timeout=None):
+        shard = self
+
+        class Cursor:
+            def execute(self, query, params):
+                self.ids = params[0]
+                shard.lookups.append(sorted(self.ids))
+
+            def fetchall(self):
+                return [(doc_id, *shard.rows[doc_id]) for doc_id in sorted(self.ids) if doc_id in shard.rows]
+
+            def close(self):
+                pass
+
+        class Conn:
+            def cursor(self):
+                return Cursor()
+        yield Conn()
+
+
+class FakeAdmission:
+    def __init__(self):
+        self.slots = 0
+
+    @contextmanager
+    def slot(self, stage, deadline=None):
+        self.slots += 1
+        yield
+
+
+def fetcher_for(shard_count=1, rows=ROWS):
+    shards = [
+        FakeShard({doc_id: row for doc_id, row in rows.items() if shard_index(doc_id, shard_count) == number})
+        for number in range(shard_count)
+    ]
+    return DocumentFetcher(ReadRouter(shards), FakeAdmission(), VersionedCache(100)), shards
+
+
+def test_fetch_keeps_hit_order_and_scores_across_shards_and_cache():
+    fetcher, shards = fetcher_for(shard_count=2)
+    fetcher.fetch([7], [0.5], corpus_version=1)
+    docs = fetcher.fetch([12, 7, 3], [0.81, 0.74, 0.66], corpus_version=1)
+    assert [(doc["id"], doc["similarity"]) for doc in docs] == [(12, 0.81), (7, 0.74), (3, 0.66)]
+    assert docs[0]["metadata"] == {"source": "it_act.pdf", "also_in": [{"source": "cyber_faq.pdf", "page": 2}]}
+    assert docs[1]["metadata"] == {"source": "crpc.pdf", "page": 3}
+    # 7 came from the chunk cache; the others were asked only of the shard that owns them
+    looked_up = sorted(doc_id for shard in shards for lookup in shard.lookups for doc_id in lookup)
+    assert looked_up == [3, 7, 12]
+
+
+def test_missing_ids_are_dropped():
+    fetcher, _ = fetcher_for()
+    docs = fetcher.fetch([99, 7, 42], [0.9, 0.8, 0.7], corpus_version=1)
+    assert [(doc["id"], doc["similarity"]) for doc in docs] == [(7, 0.8)]
+    assert fetcher.fetch([], corpus_version=1) == []
+
+
+def test_fetch_relevant_skips_hits_below_the_threshold():
+    fetcher, [shard] = fetcher_for()
+    below = MIN_RELEVANT_SIMILARITY - 0.01
+    trace = {"deadline": None}
+    docs, wanted = fetcher.fetch_relevant(((3, 0.9), (7, below), (20, 0.4)), corpus_version=1, trace=trace)
+    assert [doc["id"] for doc in docs] == [3, 20]
+    assert wanted == 2
+    assert shard.lookups == [[3, 20]]
+    # The trace keeps every hit, including those not fetched
+    assert trace["doc_ids"] == [3, 7, 20]
+
+
+def test_fetch_relevant_without_relevant_hits_does_no_database_work():
+    fetcher, [shard] = fetcher_for()
+    docs, wanted = fetcher.fetch_relevant(((7, 0.1), (12, 0.2)), corpus_version=1)
+    assert (docs, wanted) == ([], 0)
+    assert shard.lookups == []
+    assert fetcher.admission.slots == 0
+
+
+def test_fetch_relevant_reports_a_gone_id_so_cached_hits_are_searched_again():
+    fetcher, _ = fetcher_for()
+    docs, wanted = fetcher.fetch_relevant(((7, 0.9), (99, 0.8)), corpus_version=1)
+    assert [doc["id"] for doc in docs] == [7]
+    assert wanted == 2
@@ -0,0 +1,64 @@
+from faq_index import FAQIndex, extract_faq_entries
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return FakeCursor(self.rows)
+
+
+def test_extract_entries():
+    pages = [
+        "Q1: What is an FIR?\nA: A First Information Report is the complaint recorded by police.\n"
+        "Q2: Can the police refuse\nto register an FIR?\nNo, for a cognizable offence they must register it.",
+        "3/14/24, 10:05 AM\n3. Is a Zero FIR valid?\nYes, any police station must register it and transfer it.\n"
+        "Q4: Too short?\nNo.\nQ1: What is an FIR?\nA duplicate question is only kept once, whatever it says.",
+    ]
+    entries = extract_faq_entries(pages, "FIR FAQ.pdf")
+    assert [(entry["question"], entry["page"]) for entry in entries] == [
+        ("What is an FIR?", 1),
+        ("Can the police refuse to register an FIR?", 1),
+        ("Is a Zero FIR valid?", 2),
+    ]
+    assert entries[0]["answer"] == "A First Information Report is the complaint recorded by police."
+    assert all(entry["source"] == "FIR FAQ.pdf" for entry in entries)
+
+
+def test_match_threshold_and_model():
+    rows = [
+        ("What is an FIR?", "A complaint recorded by police.", "faq.pdf", 1, [1.0, 0.0, 0.0]),
+        ("Is a Zero FIR valid?", "Yes.", "faq.pdf", 2, [0.0, 3.0, 0.0]),
+    ]
+    index = FAQIndex(threshold=0.9)
+    assert index.match([1.0, 0.0, 0.0], "model-a") is None
+    index.load(FakeConn(rows), "model-a")
+
+    entry, similarity = index.match([0.1, 2.0, 0.0], "model-a")
+    assert entry["question"] == "Is a Zero FIR valid?"
+    assert similarity > 0.99
+    # Below the threshold, or embedded by another model: no direct answer
+    assert index.match([1.0, 1.0, 0.0], "model-a") is None
+    assert index.match([1.0, 0.0, 0.0], "model-b") is None
+    assert index.usage()["questions"] == 2
+
+
+def test_empty_table_never_matches():
+    index = FAQIndex(threshold=0.5)
+    index.load(FakeConn([]), "model-a")
+    assert index.match([1.0, 0.0], "model-a") is None
@@ -0,0 +1,114 @@
+import pytest
+
+import process_pdfs
+from ingest_jobs import chunk_key
+from process_pdfs import PDFProcessor
+
+DIGEST = "d" * 64
+CHUNKS = [
+    {"content": f"Section {number} of the IPC", "metadata": {"source": "ipc.pdf", "chunk": number}}
+    for number in range(5)
+]
+KEYS = [chunk_key(DIGEST, chunk) for chunk in CHUNKS]
+
+
+class FakeCursor:
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self):
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class FakePDFCache:
+    def get_pages(self, path):
+        return ["page one"]
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    """A PDFProcessor without models or database, recording the checkpoints it writes"""
+    monkeypatch.setattr(process_pdfs, "BATCH_SIZE", 2)
+    monkeypatch.setattr(process_pdfs, "file_hash", lambda path: DIGEST)
+    calls = {"checkpoints": [], "batches": [], "cleared": [], "unreadable": [], "reprocessed": []}
+    monkeypatch.setattr(process_pdfs, "clear_file_dead_letters", lambda cursor, job_id, path: None)
+    monkeypatch.setattr(
+        process_pdfs, "checkpoint_file",
+        lambda cursor, job_id, path, digest, chunks, stored, failed, done=False, duplicates=0:
+        calls["checkpoints"].append((chunks, stored, failed, done, duplicates))
+    )
+    monkeypatch.setattr(
+        process_pdfs, "add_unreadable_file",
+        lambda cursor, job_id, path, error: calls["unreadable"].append((path, error))
+    )
+    monkeypatch.setattr(
+        process_pdfs, "clear_dead_letter",
+        lambda cursor, job_id, key, path: calls["cleared"].append((key, path))
+    )
+
+    processor = PDFProcessor.__new__(PDFProcessor)
+    processor.db_conn = FakeConn()
+    processor.faq_table = None
+    processor.target_table = "documents_staging"
+    processor.pdf_cache = FakePDFCache()
+    processor.extract_text_from_pdf = lambda path, pages: [dict(chunk) for chunk in CHUNKS]
+    processor.stored = set()
+    processor.stored_keys = lambda cursor, keys: {key for key in keys if key in processor.stored}
+
+    def store_batch(cursor, job_id, file_path, batch):
+        # The first chunk of every batch is folded into a near-duplicate
+        calls["batches"].append([key for key, _ in batch])
+        return [key for key, _ in batch], 1
+    processor.store_batch = store_batch
+    processor.calls = calls
+    return processor
+
+
+def test_resume_skips_chunks_already_stored(processor):
+    processor.stored = set(KEYS[:2])
+    processor.process_file(1, "knowledge_base/ipc.pdf", DIGEST)
+    assert processor.calls["batches"] == [KEYS[2:4], KEYS[4:]]
+    # Resumed count includes the chunks the interrupted attempt stored
+    assert processor.calls["checkpoints"] == [(5, 4, 0, False, 1), (5, 5, 0, True, 2)]
+
+
+def test_fully_stored_file_is_only_checkpointed(processor):
+    processor.stored = set(KEYS)
+    processor.process_file(1, "knowledge_base/ipc.pdf", DIGEST)
+    assert processor.calls["batches"] == []
+    assert processor.calls["checkpoints"] == [(5, 5, 0, True, 0)]
+
+
+def test_unreadable_file_is_dead_lettered(processor, monkeypatch):
+    def broken(path):
+        raise OSError("No such file")
+    monkeypatch.setattr(process_pdfs, "file_hash", broken)
+    processor.process_file(1, "knowledge_base/missing.pdf", DIGEST)
+    assert processor.calls["unreadable"] == [("knowledge_base/missing.pdf", "No such file")]
+    assert processor.calls["checkpoints"] == [(0, 0, 1, True, 0)]
+
+
+def test_retry_stores_dead_letters_and_reprocesses_unreadable_files(processor, monkeypatch):
+    letters = [
+        {"chunk_key": "file:knowledge_base/missing.pdf", "file_path": "knowledge_base/missing.pdf",
+         "content": "", "metadata": {"source": "missing.pdf", "unreadable": True}},
+        {"chunk_key": KEYS[3], "file_path": "knowledge_base/ipc.pdf",
+         "content": CHUNKS[3]["content"], "metadata": CHUNKS[3]["metadata"]},
+    ]
+    monkeypatch.setattr(process_pdfs, "dead_letters", lambda conn, job_id: letters)
+    processor.process_file = lambda job_id, path, recorded_hash=None: processor.calls["reprocessed"].append(path)
+    processor.retry_dead_letters(1)
+    assert processor.calls["reprocessed"] == ["knowledge_base/missing.pdf"]
+    assert processor.calls["batches"] == [[KEYS[3]]]
+    assert processor.calls["cleared"] == [(KEYS[3], "knowledge_base/ipc.pdf")]
@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+
+from db_pool import ReadRouter
+from document_fetch import DocumentFetcher
+from query_cache import LRUCache, VersionedCache, cache_from_env, normalize_query
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, query, params):
+        self.ids = params[0]
+        self.db.lookups.append(list(self.ids))
+
+    def fetchall(self):
+        return [(doc_id, *self.db.rows[doc_id]) for doc_id in self.ids if doc_id in self.db.rows]
+
+    def close(self):
+        pass
+
+
+class FakeReplicas:
+    """One shard whose documents table is the dict rows: id -> (content, source, page, also_in)"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.lookups = []
+
+    @contextmanager
+    def connection(self, timeout=None):
+        db = self
+
+        class Conn:
+            def cursor(self):
+                return FakeCursor(db)
+        yield Conn()
+
+
+class FakeAdmission:
+    @contextmanager
+    def slot(self, stage, deadline=None):
+        yield
+
+
+def test_normalize_query():
+    assert normalize_query("  What is  BAIL?? ") == "what is bail"
+
+
+def test_versioned_cache_misses_after_a_version_bump():
+    cache = VersionedCache(10)
+    cache.put("what is bail", 3, ((7, 0.9),))
+    assert cache.get("what is bail", 3) == ((7, 0.9),)
+    assert cache.get("what is bail", 4) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.put("what is bail", 4, ((8, 0.8),))
+    assert cache.get("what is bail", 4) == ((8, 0.8),)
+    assert len(cache) == 1
+
+
+def test_cache_from_env(monkeypatch):
+    monkeypatch.setenv("CHUNK_CACHE_SIZE", "0")
+    cache = cache_from_env("chunk", 5000, versioned=True)
+    assert isinstance(cache, VersionedCache)
+    cache.put(1, 1, "row")
+    assert cache.get(1, 1) is None
+    assert type(cache_from_env("answer", 500)) is LRUCache
+
+
+def test_stale_chunk_cache_entries_are_fetched_again():
+    shard = FakeReplicas({7: ("Bail is a right", "crpc.pdf", 3, None)})
+    fetcher = DocumentFetcher(ReadRouter([shard]), FakeAdmission(), VersionedCache(10))
+    assert fetcher.fetch([7], [0.9], corpus_version=1)[0]["content"] == "Bail is a right"
+    assert fetcher.fetch([7], [0.9], corpus_version=1)[0]["content"] == "Bail is a right"
+    assert shard.lookups == [[7]]
+
+    # A re-ingest swapped in a new table that reuses ID 7
+    shard.rows[7] = ("Bail is the rule, jail the exception", "crpc.pdf", 4, None)
+    [doc] = fetcher.fetch([7], [0.9], corpus_version=2)
+    assert shard.lookups == [[7], [7]]
+    assert doc["content"] == "Bail is the rule, jail the exception"
+    assert doc["metadata"] == {"source": "crpc.pdf", "page": 4}
@@ -0,0 +1,67 @@
+import time
+
+from query_log import MAGIC, QueryLog, read_query_log, read_query_logs, top_queries
+
+
+def entry(text, query_type="general", **fields):
+    return dict({"text": text, "query_type": query_type, "timestamp": time.time()}, **fields)
+
+
+def write_log(log_dir, entries):
+    query_log = QueryLog(str(log_dir))
+    for item in entries:
+        # Written inline rather than through the background thread, so the test does not race it
+        query_log._write(item)
+    query_log._file.flush()
+    return query_log
+
+
+def test_round_trip(tmp_path):
+    write_log(tmp_path, [
+        entry(
+            "What is Section 420?", cache={"embedding", "session_followup"}, corpus_version=7,
+            doc_ids=[11, 2 ** 40], similarities=[0.8125, 0.5],
+            timings={"total": 12.5, "vector_search": 3.25, "not_a_stage": 1.0},
+        ),
+        entry("hello", "greeting"),
+    ])
+    records = list(read_query_logs(str(tmp_path)))
+    assert len(records) == 2
+    first = records[0]
+    assert first["text"] == "What is Section 420?"
+    assert first["query_type"] == "general"
+    assert sorted(first["cache"]) == ["embedding", "session_followup"]
+    assert first["corpus_version"] == 7
+    assert first["doc_ids"] == [11, 2 ** 40]
+    assert first["similarities"] == [0.8125, 0.5]
+    assert first["timings"] == {"total": 12.5, "vector_search": 3.25}
+    assert records[1]["query_type"] == "greeting"
+    assert records[1]["doc_ids"] == []
+
+
+def test_text_written_once_per_file(tmp_path):
+    write_log(tmp_path, [entry("Bail for theft?") for _ in range(3)])
+    [path] = [str(p) for p in tmp_path.iterdir()]
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data.startswith(MAGIC)
+    assert data.count(b"Bail for theft?") == 1
+    assert [record["text"] for record in read_query_log(path)] == ["Bail for theft?"] * 3
+
+
+def test_truncated_tail_is_ignored(tmp_path):
+    write_log(tmp_path, [entry("first"), entry("second")])
+    [path] = [str(p) for p in tmp_path.iterdir()]
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:-3])
+    assert [record["text"] for record in read_query_log(path)] == ["first"]
+
+
+def test_top_queries(tmp_path):
+    write_log(tmp_path, [
+        entry("divorce lawyer", "lawyer"), entry("divorce lawyer", "lawyer"),
+        entry("what is an FIR"), entry("hi", "greeting"), entry("hi", "greeting"), entry("hi", "greeting"),
+    ])
+    assert top_queries(str(tmp_path), days=1) == [("divorce lawyer", 2), ("what is an FIR", 1)]
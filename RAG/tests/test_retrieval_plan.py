@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from retrieval_plan import build_query_plan
+
+
+def executors_for(plan, rows_by_stage, calls):
+    def make(name):
+        def execute(stage):
+            calls.append(name)
+            return rows_by_stage.get(name, [])
+        return execute
+    return {stage.name: make(stage.name) for stage in plan.stages}
+
+
+def test_lawyer_keyword_hit_never_starts_the_fallbacks():
+    plan = build_query_plan("I need a divorce lawyer", True, "family")
+    assert [stage.name for stage in plan.stages] == ["lawyer_keyword", "keyword_search", "vector_search"]
+    calls = []
+    with ThreadPoolExecutor(4) as pool:
+        hits = plan.run_concurrent(executors_for(plan, {"lawyer_keyword": [(1, 1.0)]}, calls), pool, 1.0)
+    assert hits == [(1, 1.0)]
+    assert calls == ["lawyer_keyword"]
+    assert [stage.status for stage in plan.stages] == ["executed", "skipped", "skipped"]
+
+
+def test_empty_lawyer_keyword_falls_back_to_vector_stages():
+    plan = build_query_plan("I need a divorce lawyer", True, "family")
+    calls = []
+    rows = {"keyword_search": [(2, 0.9), (3, 0.8)], "vector_search": [(3, 0.8), (4, 0.7)]}
+    with ThreadPoolExecutor(4) as pool:
+        hits = plan.run_concurrent(executors_for(plan, rows, calls), pool, 1.0)
+    assert calls[0] == "lawyer_keyword"
+    assert sorted(calls[1:]) == ["keyword_search", "vector_search"]
+    assert hits == [(2, 0.9), (3, 0.8), (4, 0.7)]
+
+
+def test_failed_stage_is_left_out():
+    plan = build_query_plan("what are my rights on arrest", False, None)
+    executors = {
+        "keyword_search": lambda stage: 1 / 0,
+        "vector_search": lambda stage: [(5, 0.6)],
+    }
+    with ThreadPoolExecutor(2) as pool:
+        assert plan.run_concurrent(executors, pool, 1.0) == [(5, 0.6)]
+    assert plan.stages[0].status == "failed"
@@ -0,0 +1,69 @@
+from session_store import SessionStore, has_followup_signal, new_topic_words
+
+
+def test_followup_signal():
+    assert has_followup_signal("Can I get bail for it?")
+    assert has_followup_signal("What about the penalty?")
+    assert has_followup_signal("Explain that again")
+    assert has_followup_signal("and for minors?")
+    assert not has_followup_signal("What is the GST rate on rent?")
+    assert not has_followup_signal("Tell me about cheque bounce")
+    assert not has_followup_signal("")
+
+
+def test_new_topic_words():
+    assert new_topic_words("Can you explain that?") == []
+    assert new_topic_words("What about pizza?") == ["pizza"]
+    assert new_topic_words("Is it bailable?") == ["bailable"]
+
+
+def test_unknown_session_id_gets_a_fresh_id():
+    store = SessionStore()
+    session = store.get_or_create("attacker-chosen-id")
+    assert session.session_id != "attacker-chosen-id"
+    assert store.get_or_create(session.session_id) is session
+    assert len(store) == 1
+
+
+def test_expired_session_is_replaced():
+    store = SessionStore(ttl_seconds=10)
+    session = store.get_or_create()
+    session.last_access -= 60
+    renewed = store.get_or_create(session.session_id)
+    assert renewed is not session
+    assert renewed.session_id != session.session_id
+    assert len(store) == 1
+
+
+def test_lru_eviction_and_rolling_summary():
+    store = SessionStore(max_sessions=2, max_turns=2)
+    first = store.get_or_create()
+    store.get_or_create()
+    store.get_or_create()
+    assert store.delete(first.session_id) is False
+    session = store.get_or_create()
+    session.add_turn("user", "What is Section 420? It covers cheating")
+    session.add_turn("assistant", "Section 420 IPC deals with cheating.")
+    session.add_turn("user", "Is it bailable?")
+    assert session.history()[-1]["content"] == "Is it bailable?"
+    assert session.summary == "User asked: What is Section 420? It covers cheating."
+
+
+def test_get_does_not_create_sessions():
+    store = SessionStore()
+    assert store.get(None) is None
+    assert store.get("unknown") is None
+    assert len(store) == 0
+
+
+def test_lost_session_is_rebuilt_from_client_history():
+    store = SessionStore(max_turns=2)
+    history = [
+        {"role": "user", "content": "What is Section 420? It covers cheating"},
+        {"role": "assistant", "content": "Section 420 IPC deals with cheating."},
+        {"role": "user", "content": "Is it bailable?"},
+    ]
+    session = store.create(history)
+    assert store.get(session.session_id) is session
+    assert session.history()[-1]["content"] == "Is it bailable?"
+    assert session.summary == "User asked: What is Section 420? It covers cheating."
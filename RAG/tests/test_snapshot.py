@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+import snapshot
+from snapshot import Snapshot, SnapshotIndex, export_snapshot
+
+ROWS = [
+    (7, "Q: What is bail?\nRelease pending trial.", {"source": "faq.pdf", "page": 1}, "faq", "faq.pdf", "k7", [1, -2]),
+    (9, "Advocate R. Rao - Family Law", {"source": "Lawyer.pdf", "page": 3}, "advocates", "Lawyer.pdf", "k9", None),
+    (12, "Section 66A — struck down", None, "guides", "guide.pdf", "k12", [5]),
+]
+VECTORS = [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0], [0.6, 0.8, 0.0, 0.0]]
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.itersize = None
+
+    def execute(self, query, params=None):
+        pass
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, rows):
+        self.rows = rows
+        self.isolation_level = "DEFAULT"
+
+    def cursor(self, name=None):
+        return FakeCursor(self.rows)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def set_session(self, isolation_level=None, readonly=None):
+        self.isolation_level = isolation_level
+
+
+@pytest.fixture
+def export(monkeypatch, tmp_path):
+    monkeypatch.setattr(snapshot, "get_documents_model", lambda conn: "test-model")
+    monkeypatch.setattr(snapshot, "get_corpus_version", lambda conn: 42)
+    rows = [row + (vector,) for row, vector in zip(ROWS, VECTORS)]
+
+    def run(dtype="float32"):
+        path = str(tmp_path / f"corpus-{dtype}.ragsnap")
+        header = export_snapshot(FakeConn(rows), path, dtype)
+        return path, header
+    return run
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_round_trip(export, dtype):
+    path, header = export(dtype)
+    snap = Snapshot(path)
+    try:
+        snap.verify()
+        assert (snap.model_name, snap.corpus_version, len(snap)) == ("test-model", 42, 3)
+        assert snap.header == header
+        assert snap.ids.tolist() == [7, 9, 12]
+        np.testing.assert_allclose(snap.embeddings, VECTORS, atol=1e-3)
+        # The matrix is a view of the mapped file, not a copy
+        assert not snap.embeddings.flags.owndata
+        assert snap.header["sections"]["embeddings"][0] % snapshot.ALIGNMENT == 0
+        records = list(snap.records())
+        assert [record["content"] for record in records] == [row[1] for row in ROWS]
+        assert [record["metadata"] for record in records] == [row[2] for row in ROWS]
+        assert [record["lsh_bands"] for record in records] == [row[6] for row in ROWS]
+    finally:
+        snap.close()
+
+
+def test_search_and_fetch(export):
+    path, _ = export()
+    snap = Snapshot(path)
+    try:
+        index = SnapshotIndex(snap, block_rows=2)
+        hits = index.search([0.0, 2.0, 0.0, 0.0], limit=2)
+        assert [doc_id for doc_id, _ in hits] == [9, 12]
+        assert hits[0][1] == pytest.approx(1.0)
+        assert [doc_id for doc_id, _ in index.search([0.0, 1.0, 0.0, 0.0], exclude_corpus="advocates")] == [12, 7]
+        docs = index.fetch(hits[:1])
+        assert docs[0]["content"] == ROWS[1][1]
+    finally:
+        snap.close()
+
+
+def test_corruption_is_detected(export):
+    path, header = export()
+    start, _ = header["sections"]["records"]
+    with open(path, "r+b") as f:
+        f.seek(start)
+        byte = f.read(1)
+        f.seek(start)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    snap = Snapshot(path)
+    try:
+        with pytest.raises(ValueError, match="checksum"):
+            snap.verify()
+    finally:
+        snap.close()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not.ragsnap"
+    path.write_bytes(b"%PDF-1.4" + b"\0" * 64)
+    with pytest.raises(ValueError, match="not a snapshot"):
+        Snapshot(str(path))
+
+
+def test_version_is_read_in_the_export_transaction(monkeypatch, tmp_path):
+    seen = []
+    monkeypatch.setattr(snapshot, "get_documents_model", lambda conn: "test-model")
+    monkeypatch.setattr(snapshot, "get_corpus_version", lambda conn: seen.append(conn.isolation_level) or 42)
+    conn = FakeConn([row + (vector,) for row, vector in zip(ROWS, VECTORS)])
+    export_snapshot(conn, str(tmp_path / "corpus.ragsnap"))
+    assert seen == ["REPEATABLE READ"]
+    assert conn.isolation_level == "DEFAULT"
@@ -0,0 +1,32 @@
+from upload_queue import is_shipped_filename, safe_filename
+
+
+def test_safe_filename():
+    assert safe_filename("../../etc/Contract Act FAQ.pdf") == "Contract Act FAQ.pdf"
+    assert safe_filename("notes;rm -rf.pdf") == "notes_rm -rf.pdf"
+    assert safe_filename("report.docx") == ""
+    assert safe_filename(".pdf") == ""
+    assert safe_filename(None) == ""
+
+
+def test_shipped_names_are_refused():
+    assert is_shipped_filename("Lawyer.pdf")
+    assert is_shipped_filename("Hindu Marriage Act Guide.pdf")
+    assert not is_shipped_filename("My Own Notes.pdf")
+
+
+def test_failed_upload_is_quarantined(tmp_path, monkeypatch):
+    import hashlib
+    import upload_queue
+    monkeypatch.setattr(upload_queue, "FAILED_DIR", str(tmp_path / "failed"))
+    path = tmp_path / "Notes.pdf"
+    path.write_bytes(b"%PDF-1.4 broken")
+    digest = hashlib.sha256(b"%PDF-1.4 broken").hexdigest()
+
+    # A newer upload with the same name replaced the file: it stays for its own job
+    upload_queue.quarantine_upload(3, str(path), "0" * 64)
+    assert path.exists()
+
+    upload_queue.quarantine_upload(3, str(path), digest)
+    assert not path.exists()
+    assert (tmp_path / "failed" / "3-Notes.pdf").read_bytes() == b"%PDF-1.4 broken"
@@ -0,0 +1,219 @@
+"""Persistent queue of uploaded PDFs waiting to be ingested (see ingest_worker.py).
+
+The API stores the file in UPLOAD_DIR and enqueues a row in upload_jobs.
+Workers claim rows with FOR UPDATE SKIP LOCKED, so any number of them can share
+the queue. A running job whose heartbeat stops, because its worker died, can be
+claimed again.
+
+The file of a failed job is moved to FAILED_DIR, and a full rebuild only reads
+uploads whose latest job completed, so a rejected upload never reaches the index.
+"""
+import os
+import re
+from typing import List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR") or os.path.join(BASE_DIR, "uploads")
+# Uploads whose job failed, kept for inspection as <job id>-<filename>
+FAILED_DIR = os.path.join(UPLOAD_DIR, "failed")
+# Folders of the shipped knowledge base, relative to BASE_DIR
+KNOWLEDGE_BASE_DIRS = ["knowledge-base", "New Knowledge Base"]
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+JOB_COLUMNS = (
+    "id", "filename", "status", "chunks_total", "chunks_embedded", "attempts", "error",
+    "corpus_version", "created_at", "started_at", "finished_at",
+)
+
+
+def safe_filename(name: str) -> str:
+    """Basename restricted to characters the knowledge-base files already use"""
+    name = os.path.basename(name or "").strip()
+    name = re.sub(r"[^\w .&()\-]", "_", name)
+    return name if name.lower().endswith(".pdf") and len(name) > 4 else ""
+
+
+def is_shipped_filename(filename: str) -> bool:
+    """Chunks are replaced by source name, so an upload must not share a name with a shipped PDF"""
+    return any(os.path.exists(os.path.join(BASE_DIR, kb_dir, filename)) for kb_dir in KNOWLEDGE_BASE_DIRS)
+
+
+def enqueue(conn, filename: str, file_path: str, file_digest: str) -> int:
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO upload_jobs (filename, file_path, file_hash) VALUES (%s, %s, %s) RETURNING id",
+        (filename, file_path, file_digest)
+    )
+    job_id = cursor.fetchone()[0]
+    cursor.close()
+    return job_id
+
+
+def _row_to_job(row) -> dict:
+    return dict(zip(JOB_COLUMNS, row))
+
+
+def get_job(conn, job_id: int) -> Optional[dict]:
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM upload_jobs WHERE id = %s", (job_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    return _row_to_job(row) if row else None
+
+
+def list_jobs(conn, limit: int = 20, status: Optional[str] = None) -> List[dict]:
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT {', '.join(JOB_COLUMNS)} FROM upload_jobs
+        WHERE %s IS NULL OR status = %s
+        ORDER BY id DESC LIMIT %s
+        """,
+        (status, status, limit)
+    )
+    jobs = [_row_to_job(row) for row in cursor.fetchall()]
+    cursor.close()
+    return jobs
+
+
+def queue_depth(conn) -> dict:
+    cursor = conn.cursor()
+    cursor.execute("SELECT status, COUNT(*) FROM upload_jobs WHERE status IN (%s, %s) GROUP BY status",
+                   (STATUS_QUEUED, STATUS_RUNNING))
+    depth = {STATUS_QUEUED: 0, STATUS_RUNNING: 0}
+    depth.update(dict(cursor.fetchall()))
+    cursor.close()
+    return depth
+
+
+def claim_job(conn, worker: str, stale_seconds: int, max_attempts: int) -> Optional[dict]:
+    """Take the oldest queued job, or a running one whose worker stopped sending heartbeats"""
+    cursor = conn.cursor()
+    # Jobs that keep killing their worker are given up on rather than retried forever
+    cursor.execute(
+        """
+        UPDATE upload_jobs SET status = %s, error = 'worker stopped responding', finished_at = CURRENT_TIMESTAMP
+        WHERE status = %s AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s) AND attempts >= %s
+        RETURNING id, file_path, file_hash
+        """,
+        (STATUS_FAILED, STATUS_RUNNING, stale_seconds, max_attempts)
+    )
+    given_up = cursor.fetchall()
+    conn.commit()
+    for failed_id, file_path, file_digest in given_up:
+        quarantine_upload(failed_id, file_path, file_digest)
+    cursor.execute(
+        """
+        UPDATE upload_jobs
+        SET status = %s, worker = %s, attempts = attempts + 1,
+            started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP, error = NULL
+        WHERE id = (
+            SELECT id FROM upload_jobs
+            WHERE status = %s
+               OR (status = %s AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, filename, file_path, file_hash, attempts
+        """,
+        (STATUS_RUNNING, worker, STATUS_QUEUED, STATUS_RUNNING, stale_seconds)
+    )
+    row = cursor.fetchone()
+    conn.commit()
+    cursor.close()
+    if not row:
+        return None
+    return {"id": row[0], "filename": row[1], "file_path": row[2], "file_hash": row[3], "attempts": row[4]}
+
+
+def heartbeat(conn, job_id: int, chunks_total: Optional[int] = None, chunks_embedded: Optional[int] = None):
+    """Progress update; also proves the worker is alive. Committed by the caller"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE upload_jobs
+        SET heartbeat_at = CURRENT_TIMESTAMP,
+            chunks_total = COALESCE(%s, chunks_total),
+            chunks_embedded = COALESCE(%s, chunks_embedded)
+        WHERE id = %s
+        """,
+        (chunks_total, chunks_embedded, job_id)
+    )
+    cursor.close()
+
+
+def complete_job(cursor, job_id: int, corpus_version: int):
+    """Called inside the transaction that publishes the job's chunks"""
+    cursor.execute(
+        """
+        UPDATE upload_jobs SET status = %s, corpus_version = %s, finished_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+        """,
+        (STATUS_COMPLETED, corpus_version, job_id)
+    )
+
+
+def fail_job(conn, job_id: int, error: str):
+    conn.rollback()
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE upload_jobs SET status = %s, error = %s, finished_at = CURRENT_TIMESTAMP WHERE id = %s
+        RETURNING file_path, file_hash
+        """,
+        (STATUS_FAILED, error[:2000], job_id)
+    )
+    row = cursor.fetchone()
+    conn.commit()
+    cursor.close()
+    if row:
+        quarantine_upload(job_id, row[0], row[1])
+
+
+def quarantine_upload(job_id: int, file_path: str, file_digest: str):
+    """Move a failed job's file out of UPLOAD_DIR, unless a newer upload has replaced it there"""
+    from pdf_cache import file_hash
+    try:
+        if not os.path.exists(file_path) or file_hash(file_path) != file_digest:
+            return
+        os.makedirs(FAILED_DIR, exist_ok=True)
+        target = os.path.join(FAILED_DIR, f"{job_id}-{os.path.basename(file_path)}")
+        os.replace(file_path, target)
+        print(f"[INFO] Moved the file of failed upload job {job_id} to {target}")
+    except OSError as e:
+        print(f"[WARN] Could not move the file of failed upload job {job_id}: {e}")
+
+
+def completed_upload_paths(conn) -> List[str]:
+    """Uploaded files whose latest job completed; queued, running and failed uploads are left out"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT file_path FROM (
+            SELECT DISTINCT ON (filename) filename, file_path, status FROM upload_jobs ORDER BY filename, id DESC
+        ) latest
+        WHERE status = %s
+        ORDER BY filename
+        """,
+        (STATUS_COMPLETED,)
+    )
+    paths = [row[0] for row in cursor.fetchall() if os.path.exists(row[0])]
+    cursor.close()
+    return paths
+
+
+def release_job(conn, job_id: int):
+    """Put a claimed job back in the queue without counting the attempt"""
+    conn.rollback()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE upload_jobs SET status = %s, attempts = attempts - 1, worker = NULL WHERE id = %s",
+        (STATUS_QUEUED, job_id)
+    )
+    conn.commit()
+    cursor.close()
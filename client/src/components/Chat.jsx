@@ -11,6 +11,9 @@ pdfjsLib.GlobalWorkerOptions.workerSrc = new URL(
   import.meta.url
 ).href;
 
+// Recent messages sent with every RAG query as a fallback for a lost server-side session
+const HISTORY_FALLBACK_MESSAGES = 6;
+
 // Function to structure and format bot responses
 function formatBotResponse(content) {
   if (!content) return [{ type: 'paragraph', content: ['No content available'] }];
@@ -281,6 +284,7 @@ function Chat({ onClose, selectedBot = null }) {
   const [uploadedFiles, setUploadedFiles] = useState([]);
   const [extractedText, setExtractedText] = useState('');
   const [processingFile, setProcessingFile] = useState(false);
+  const [sessionId, setSessionId] = useState(null);
   const messagesEndRef = useRef(null);
   const fileInputRef = useRef(null);
 
@@ -582,8 +586,9 @@ function Chat({ onClose, selectedBot = null }) {
         
         console.log('Bot message created:', botMessage);
       } else {
-        // Use regular RAG endpoint
-        const conversationHistory = messages.map(msg => ({
+        // Use regular RAG endpoint - the server session keeps the history, but a trimmed copy is
+        // always sent so the server can rebuild the session if it was lost
+        const conversationHistory = messages.slice(-HISTORY_FALLBACK_MESSAGES).map(msg => ({
           role: msg.type === 'user' ? 'user' : 'assistant',
           content: typeof msg.content === 'string' ? msg.content : JSON.stringify(msg.content)
         }));
@@ -591,9 +596,19 @@ function Chat({ onClose, selectedBot = null }) {
         const response = await axios.post('http://localhost:3000/rag/query', {
           query: fullQuery,
           conversation_history: conversationHistory,
+          session_id: sessionId,
+          start_session: true,
           max_results: 5
         });
 
+        if (response.data?.data?.session_reset) {
+          console.log('RAG session was lost, server rebuilt it from the sent history');
+        }
+
+        if (response.data?.data?.session_id) {
+          setSessionId(response.data.data.session_id);
+        }
+
         botMessage = {
           id: Date.now() + 1,
           type: 'bot',
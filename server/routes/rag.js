@@ -7,7 +7,7 @@ const RAG_API_URL = process.env.RAG_API_URL || 'http://localhost:8000';
 // Query RAG system
 router.post('/query', async (req, res) => {
   try {
-    const { query, max_results, conversation_history } = req.body;
+    const { query, max_results, conversation_history, session_id, start_session } = req.body;
 
     if (!query || query.trim() === '') {
       return res.status(400).json({ 
@@ -16,11 +16,13 @@ router.post('/query', async (req, res) => {
       });
     }
 
-    // Call RAG API with conversation history
+    // Call RAG API with conversation history (or the server-side session that replaces it)
     const response = await axios.post(`${RAG_API_URL}/query`, {
       query: query.trim(),
       max_results: max_results || 5,
-      conversation_history: conversation_history || []
+      conversation_history: conversation_history || [],
+      session_id: session_id || null,
+      start_session: Boolean(start_session)
     });
 
     res.json({
@@ -32,6 +34,10 @@ router.post('/query', async (req, res) => {
     console.error('RAG query error:', error.message);
     
     if (error.response) {
+      // Pass the RAG service's load-shedding hint through to the client
+      if (error.response.headers['retry-after']) {
+        res.set('Retry-After', error.response.headers['retry-after']);
+      }
       return res.status(error.response.status).json({
         success: false,
         message: error.response.data.detail || 'RAG service error'